@@ -3,75 +3,125 @@ Flask API Server - REST API cho chatbot
 Sử dụng cho Node.js web interface
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
+import json
 import os
 import sys
+import uuid
 
 # Add src to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 
-from src.chatbot import MEChatbot
+from src.startup import BackgroundLoader, NotReady
+# Import qua src/ trên sys.path (không qua package src) - cùng module metrics/ingest_jobs mà chatbot dùng
+from metrics import CONTENT_TYPE, REGISTRY
+from ingest_jobs import QueueFull
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for Node.js frontend
 
-# Initialize chatbot
-print("Initializing ME Chatbot...")
-chatbot = MEChatbot(
-    documents_path="./documents",
-    vector_db_path="./vector_db",
-    use_local_llm=False  # Change to True if using vLLM local
-)
+# Số giây request chờ chatbot khởi tạo xong trước khi trả 503
+STARTUP_WAIT_SECONDS = float(os.getenv("STARTUP_WAIT_SECONDS", 30))
 
-# Store conversations in memory (in production, use Redis or database)
-conversations = {}
+
+def _create_chatbot():
+    with chatbot_loader.phase("imports"):
+        from src.chatbot import MEChatbot
+    
+    return MEChatbot(
+        documents_path="./documents",
+        vector_db_path="./vector_db",
+        use_local_llm=False,  # Change to True if using vLLM local
+        startup_timings=chatbot_loader.phases
+    )
+
+
+# Initialize chatbot in background - server nhận request ngay, /api/ready báo khi load xong
+print("Initializing ME Chatbot in background...")
+chatbot_loader = BackgroundLoader(_create_chatbot, name="ME Chatbot")
+chatbot_loader.start()
+
+
+def get_chatbot():
+    """Chatbot đã khởi tạo, raise NotReady nếu chưa xong sau STARTUP_WAIT_SECONDS"""
+    return chatbot_loader.get(timeout=STARTUP_WAIT_SECONDS)
+
+# Số query tối đa trong 1 request /api/search/batch
+MAX_BATCH_QUERIES = int(os.getenv("MAX_BATCH_QUERIES", 100))
+MAX_SEARCH_K = int(os.getenv("MAX_SEARCH_K", 100))
+
+
+def _valid_k(k) -> bool:
+    """k phải là số nguyên 1..MAX_SEARCH_K (bool cũng là int trong Python)"""
+    return isinstance(k, int) and not isinstance(k, bool) and 1 <= k <= MAX_SEARCH_K
+
+
+@app.errorhandler(NotReady)
+def not_ready(e):
+    return jsonify({
+        "error": str(e),
+        "startup": chatbot_loader.status()
+    }), 503, {"Retry-After": "5"}
 
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    """Health check endpoint"""
+    """Liveness check - trả lời ngay cả khi chatbot đang khởi tạo"""
     return jsonify({
         "status": "healthy",
-        "service": "ME Chatbot API"
+        "service": "ME Chatbot API",
+        "ready": chatbot_loader.ready
     })
 
 
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    """Readiness check - 200 khi chatbot đã sẵn sàng, 503 khi đang khởi tạo hoặc lỗi"""
+    status = chatbot_loader.status()
+    return jsonify(status), 200 if chatbot_loader.ready else 503
+
+
+@app.route('/api/stats', methods=['GET'])
+def stats():
+    """Cache and session statistics"""
+    chatbot = get_chatbot()
+    
+    return jsonify(chatbot.cache_stats())
+
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics: latency từng bước pipeline, số request, token prompt/completion"""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
 @app.route('/api/chat', methods=['POST'])
 def chat():
     """Chat endpoint"""
+    chatbot = get_chatbot()
+    
     try:
         data = request.json
         message = data.get('message', '').strip()
-        conversation_id = data.get('conversation_id', 'default')
+        # Thiếu conversation_id: tạo hội thoại mới (không dùng chung 1 session cho mọi client)
+        conversation_id = data.get('conversation_id') or str(uuid.uuid4())
         
         if not message:
             return jsonify({
                 "error": "Message is required"
             }), 400
         
-        # Get or create conversation
-        if conversation_id not in conversations:
-            conversations[conversation_id] = []
-        
         # Chat with bot
-        result = chatbot.chat(message)
-        
-        # Store in conversation history
-        conversations[conversation_id].append({
-            "role": "user",
-            "content": message
-        })
-        conversations[conversation_id].append({
-            "role": "assistant",
-            "content": result['answer'],
-            "sources": result['sources']
-        })
+        result = chatbot.chat(message, conversation_id=conversation_id)
         
         return jsonify({
             "answer": result['answer'],
             "sources": result['sources'],
-            "conversation_id": conversation_id
+            "conversation_id": conversation_id,
+            "prompt_tokens": result.get('prompt_tokens'),
+            "completion_tokens": result.get('completion_tokens'),
+            "condensed": result.get('condensed')
         })
     
     except Exception as e:
@@ -80,9 +130,47 @@ def chat():
         }), 500
 
 
+def _sse(event: str, data: dict) -> str:
+    """Format một server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """Chat endpoint - stream câu trả lời bằng server-sent events"""
+    chatbot = get_chatbot()
+    
+    data = request.json or {}
+    message = data.get('message', '').strip()
+    conversation_id = data.get('conversation_id') or str(uuid.uuid4())
+    
+    if not message:
+        return jsonify({
+            "error": "Message is required"
+        }), 400
+    
+    def generate():
+        for event in chatbot.chat_stream(message, conversation_id=conversation_id):
+            if event['type'] == 'done':
+                event['conversation_id'] = conversation_id
+            
+            yield _sse(event.pop('type'), event)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
 @app.route('/api/search', methods=['POST'])
 def search():
     """Search documents endpoint"""
+    chatbot = get_chatbot()
+    
     try:
         data = request.json
         query = data.get('query', '').strip()
@@ -93,6 +181,11 @@ def search():
                 "error": "Query is required"
             }), 400
         
+        if not _valid_k(k):
+            return jsonify({
+                "error": f"k must be an integer between 1 and {MAX_SEARCH_K}"
+            }), 400
+        
         results = chatbot.search_documents(query, k=k)
         
         # Format results
@@ -115,9 +208,64 @@ def search():
         }), 500
 
 
+@app.route('/api/search/batch', methods=['POST'])
+def search_batch():
+    """Batch search endpoint - nhiều query trong 1 request"""
+    chatbot = get_chatbot()
+    
+    try:
+        data = request.json
+        queries = data.get('queries')
+        k = data.get('k', 5)
+        
+        if not isinstance(queries, list) or not queries or \
+                not all(isinstance(q, str) and q.strip() for q in queries):
+            return jsonify({
+                "error": "Queries must be a non-empty list of strings"
+            }), 400
+        
+        if len(queries) > MAX_BATCH_QUERIES:
+            return jsonify({
+                "error": f"Too many queries (max {MAX_BATCH_QUERIES})"
+            }), 400
+        
+        if not _valid_k(k):
+            return jsonify({
+                "error": f"k must be an integer between 1 and {MAX_SEARCH_K}"
+            }), 400
+        
+        results = chatbot.search_documents_batch([q.strip() for q in queries], k=k)
+        
+        return jsonify({
+            "results": [
+                {
+                    "query": query,
+                    "results": [
+                        {
+                            "filename": doc.metadata.get('filename', 'Unknown'),
+                            "content": doc.page_content,
+                            "source": doc.metadata.get('source', ''),
+                            "score": score
+                        }
+                        for doc, score in docs
+                    ]
+                }
+                for query, docs in zip(queries, results)
+            ],
+            "count": len(results)
+        })
+    
+    except Exception as e:
+        return jsonify({
+            "error": str(e)
+        }), 500
+
+
 @app.route('/api/compare', methods=['POST'])
 def compare():
     """Compare documents endpoint"""
+    chatbot = get_chatbot()
+    
     try:
         data = request.json
         file1 = data.get('file1', '').strip()
@@ -145,33 +293,57 @@ def compare():
 
 @app.route('/api/upload', methods=['POST'])
 def upload():
-    """Upload document endpoint"""
+    """
+    Upload documents endpoint - lưu file và index trong background, trả về job ngay (HTTP 202)
+    Nhiều file: lặp lại field 'files' trong multipart; trạng thái qua /api/upload/jobs/<job_id>
+    """
+    chatbot = get_chatbot()
+    jobs = []
+    
     try:
-        if 'file' not in request.files:
+        files = request.files.getlist('file') + request.files.getlist('files')
+        
+        if not files:
             return jsonify({
                 "error": "No file provided"
             }), 400
         
-        file = request.files['file']
-        
-        if file.filename == '':
+        if any(file.filename == '' for file in files):
             return jsonify({
                 "error": "No file selected"
             }), 400
         
-        # Save file
-        filename = file.filename
-        filepath = os.path.join('./documents', filename)
-        file.save(filepath)
+        # Hàng đợi đầy: từ chối trước khi lưu file vào documents
+        chatbot.ingest_jobs.check_capacity(len(files))
+        
+        for file in files:
+            # Save file
+            filename = os.path.basename(file.filename)
+            filepath = os.path.join('./documents', filename)
+            existed = os.path.exists(filepath)
+            file.save(filepath)
+            
+            # Index trong background
+            jobs.append(chatbot.submit_document(filepath, filename, remove_on_reject=not existed))
         
-        # Add to vector store
-        chatbot.add_document(filepath)
+        response = {
+            "status": "queued",
+            "message": f"{len(jobs)} document(s) queued for indexing",
+            "jobs": jobs
+        }
+        if len(jobs) == 1:
+            response["job_id"] = jobs[0]["job_id"]
+            response["filename"] = jobs[0]["filename"]
         
+        return jsonify(response), 202
+    
+    except QueueFull as e:
+        # Các file đã nhận (jobs) vẫn được index, chỉ các file còn lại cần upload lại
         return jsonify({
-            "status": "success",
-            "message": f"Document uploaded and indexed: {filename}",
-            "filename": filename
-        })
+            "error": str(e),
+            "jobs": jobs,
+            "rejected": [os.path.basename(file.filename) for file in files[len(jobs):]]
+        }), 429, {"Retry-After": "5"}
     
     except Exception as e:
         return jsonify({
@@ -179,27 +351,55 @@ def upload():
         }), 500
 
 
+@app.route('/api/upload/jobs', methods=['GET'])
+def upload_jobs():
+    """Các upload job gần nhất và thống kê hàng đợi index"""
+    chatbot = get_chatbot()
+    limit = request.args.get('limit', 50, type=int)
+    
+    return jsonify({
+        "jobs": chatbot.ingest_jobs.recent(limit),
+        "stats": chatbot.ingest_jobs.stats()
+    })
+
+
+@app.route('/api/upload/jobs/<job_id>', methods=['GET'])
+def upload_job(job_id):
+    """Trạng thái 1 upload job: queued -> running (stage: parsing/indexing/saving) -> done | failed"""
+    chatbot = get_chatbot()
+    job = chatbot.ingest_jobs.get(job_id)
+    
+    if job is None:
+        return jsonify({
+            "error": "Job not found"
+        }), 404
+    
+    return jsonify(job)
+
+
 @app.route('/api/conversations/<conversation_id>', methods=['GET'])
 def get_conversation(conversation_id):
-    """Get conversation history"""
-    if conversation_id not in conversations:
+    """Get conversation history (các lượt còn giữ trong session store)"""
+    chatbot = get_chatbot()
+    
+    messages = chatbot.conversation_messages(conversation_id)
+    if messages is None:
         return jsonify({
             "error": "Conversation not found"
         }), 404
     
     return jsonify({
         "conversation_id": conversation_id,
-        "messages": conversations[conversation_id]
+        "messages": messages
     })
 
 
 @app.route('/api/conversations/<conversation_id>/reset', methods=['POST'])
 def reset_conversation(conversation_id):
     """Reset conversation"""
-    if conversation_id in conversations:
-        conversations[conversation_id] = []
+    chatbot = get_chatbot()
     
-    chatbot.reset_conversation()
+    chatbot.reset_conversation(conversation_id)
     
     return jsonify({
         "status": "success",
@@ -209,12 +409,16 @@ def reset_conversation(conversation_id):
 
 @app.route('/api/rebuild', methods=['POST'])
 def rebuild_vector_store():
-    """Rebuild vector store from documents folder"""
+    """Rebuild vector store from documents folder (incremental by default)"""
+    chatbot = get_chatbot()
+    
     try:
-        chatbot.rebuild_vector_store()
+        data = request.get_json(silent=True) or {}
+        stats = chatbot.rebuild_vector_store(full=bool(data.get('full', False)))
         return jsonify({
             "status": "success",
-            "message": "Vector store rebuilt"
+            "message": "Vector store rebuilt",
+            "stats": stats
         })
     except Exception as e:
         return jsonify({
@@ -230,13 +434,21 @@ if __name__ == '__main__':
     print("ME Chatbot API Server")
     print("="*60)
     print("\nAPI Endpoints:")
+    print("  GET  /api/health            - Liveness check")
+    print("  GET  /api/ready             - Readiness check (503 while starting)")
+    print("  GET  /api/stats             - Cache and session statistics")
+    print("  GET  /api/metrics           - Prometheus metrics")
     print("  POST /api/chat              - Chat with bot")
+    print("  POST /api/chat/stream       - Chat with bot (server-sent events)")
     print("  POST /api/search            - Search documents")
+    print("  POST /api/search/batch      - Search many queries at once")
     print("  POST /api/compare           - Compare documents")
-    print("  POST /api/upload            - Upload document")
+    print("  POST /api/upload            - Upload documents (indexed in background)")
+    print("  GET  /api/upload/jobs       - Recent upload jobs")
+    print("  GET  /api/upload/jobs/:id   - Upload job status")
     print("  GET  /api/conversations/:id - Get conversation")
     print("  POST /api/conversations/:id/reset - Reset conversation")
-    print("  POST /api/rebuild           - Rebuild vector store")
+    print("  POST /api/rebuild           - Rebuild vector store (body: {\"full\": true} for full rebuild)")
     print("\n" + "="*60 + "\n")
     
     app.run(
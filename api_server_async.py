@@ -0,0 +1,457 @@
+"""
+Async API Server (ASGI) - cùng REST API với api_server.py
+Dùng async LLM/retriever để giữ nhiều request LLM đồng thời tới vLLM,
+giới hạn concurrency có hàng đợi và trả HTTP 429 khi quá tải
+
+Chạy: uvicorn api_server_async:app --host 0.0.0.0 --port 5000
+"""
+
+from fastapi import Depends, FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+import json
+import os
+import sys
+import uuid
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.concurrency import ConcurrencyLimiter, Saturated
+from src.startup import BackgroundLoader, NotReady
+# Import qua src/ trên sys.path (không qua package src) - cùng module metrics/ingest_jobs mà chatbot dùng
+from metrics import CONTENT_TYPE, REGISTRY
+from ingest_jobs import QueueFull
+
+app = FastAPI(title="ME Chatbot API")
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_methods=["*"],
+    allow_headers=["*"]
+)
+
+# Số giây request chờ chatbot khởi tạo xong trước khi trả 503
+STARTUP_WAIT_SECONDS = float(os.getenv("STARTUP_WAIT_SECONDS", 30))
+
+
+def _create_chatbot():
+    with chatbot_loader.phase("imports"):
+        from src.chatbot import MEChatbot
+
+    return MEChatbot(
+        documents_path="./documents",
+        vector_db_path="./vector_db",
+        use_local_llm=False,  # Change to True if using vLLM local
+        startup_timings=chatbot_loader.phases
+    )
+
+
+# Initialize chatbot in background - server nhận request ngay, /api/ready báo khi load xong
+print("Initializing ME Chatbot in background...")
+chatbot_loader = BackgroundLoader(_create_chatbot, name="ME Chatbot")
+chatbot_loader.start()
+
+
+async def get_chatbot():
+    """Dependency: chatbot đã khởi tạo, raise NotReady nếu chưa xong sau STARTUP_WAIT_SECONDS"""
+    return await chatbot_loader.aget(timeout=STARTUP_WAIT_SECONDS)
+
+# Giới hạn số request chat/search xử lý đồng thời
+limiter = ConcurrencyLimiter(
+    max_concurrency=int(os.getenv("MAX_CONCURRENT_REQUESTS", 32)),
+    max_queue=int(os.getenv("MAX_QUEUED_REQUESTS", 64)),
+    queue_timeout=float(os.getenv("QUEUE_TIMEOUT_SECONDS", 30))
+)
+
+# Số query tối đa trong 1 request /api/search/batch
+MAX_BATCH_QUERIES = int(os.getenv("MAX_BATCH_QUERIES", 100))
+MAX_SEARCH_K = int(os.getenv("MAX_SEARCH_K", 100))
+
+
+def _error(message: str, status_code: int, headers: dict = None) -> JSONResponse:
+    return JSONResponse({"error": message}, status_code=status_code, headers=headers)
+
+
+def _valid_k(k) -> bool:
+    """k phải là số nguyên 1..MAX_SEARCH_K (bool cũng là int trong Python)"""
+    return isinstance(k, int) and not isinstance(k, bool) and 1 <= k <= MAX_SEARCH_K
+
+
+def _saturated(e: Saturated) -> JSONResponse:
+    return _error(f"Server busy: {e}", 429, headers={"Retry-After": "1"})
+
+
+async def _json_body(request: Request) -> dict:
+    try:
+        return await request.json() or {}
+    except Exception:
+        return {}
+
+
+@app.exception_handler(NotReady)
+async def not_ready(request: Request, e: NotReady):
+    return JSONResponse(
+        {"error": str(e), "startup": chatbot_loader.status()},
+        status_code=503,
+        headers={"Retry-After": "5"}
+    )
+
+
+@app.get('/api/health')
+async def health_check():
+    """Liveness check - trả lời ngay cả khi chatbot đang khởi tạo"""
+    return {
+        "status": "healthy",
+        "service": "ME Chatbot API",
+        "ready": chatbot_loader.ready,
+        "concurrency": limiter.stats()
+    }
+
+
+@app.get('/api/ready')
+async def readiness_check():
+    """Readiness check - 200 khi chatbot đã sẵn sàng, 503 khi đang khởi tạo hoặc lỗi"""
+    return JSONResponse(chatbot_loader.status(), status_code=200 if chatbot_loader.ready else 503)
+
+
+@app.get('/api/stats')
+async def stats(chatbot=Depends(get_chatbot)):
+    """Cache and session statistics"""
+    return chatbot.cache_stats()
+
+
+@app.get('/api/metrics')
+async def metrics():
+    """Prometheus metrics: latency từng bước pipeline, số request, token prompt/completion"""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@app.post('/api/chat')
+async def chat(request: Request, chatbot=Depends(get_chatbot)):
+    """Chat endpoint"""
+    try:
+        data = await _json_body(request)
+        message = data.get('message', '').strip()
+        # Thiếu conversation_id: tạo hội thoại mới (không dùng chung 1 session cho mọi client)
+        conversation_id = data.get('conversation_id') or str(uuid.uuid4())
+
+        if not message:
+            return _error("Message is required", 400)
+
+        # Chat with bot
+        async with limiter.slot():
+            result = await chatbot.achat(message, conversation_id=conversation_id)
+
+        return {
+            "answer": result['answer'],
+            "sources": result['sources'],
+            "conversation_id": conversation_id,
+            "prompt_tokens": result.get('prompt_tokens'),
+            "completion_tokens": result.get('completion_tokens'),
+            "condensed": result.get('condensed')
+        }
+
+    except Saturated as e:
+        return _saturated(e)
+    except Exception as e:
+        return _error(str(e), 500)
+
+
+def _sse(event: str, data: dict) -> str:
+    """Format một server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post('/api/chat/stream')
+async def chat_stream(request: Request, chatbot=Depends(get_chatbot)):
+    """Chat endpoint - stream câu trả lời bằng server-sent events"""
+    data = await _json_body(request)
+    message = data.get('message', '').strip()
+    conversation_id = data.get('conversation_id') or str(uuid.uuid4())
+
+    if not message:
+        return _error("Message is required", 400)
+
+    # Giữ slot trong suốt thời gian stream
+    try:
+        await limiter.acquire()
+    except Saturated as e:
+        return _saturated(e)
+
+    released = False
+
+    def release_slot():
+        # Gọi từ generator hoặc background task (client ngắt kết nối trước khi stream bắt đầu)
+        nonlocal released
+        if not released:
+            released = True
+            limiter.release()
+
+    async def generate():
+        try:
+            async for event in chatbot.achat_stream(message, conversation_id=conversation_id):
+                if event['type'] == 'done':
+                    event['conversation_id'] = conversation_id
+
+                yield _sse(event.pop('type'), event)
+        finally:
+            release_slot()
+
+    return StreamingResponse(
+        generate(),
+        media_type='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        },
+        background=BackgroundTask(release_slot)
+    )
+
+
+@app.post('/api/search')
+async def search(request: Request, chatbot=Depends(get_chatbot)):
+    """Search documents endpoint"""
+    try:
+        data = await _json_body(request)
+        query = data.get('query', '').strip()
+        k = data.get('k', 5)
+
+        if not query:
+            return _error("Query is required", 400)
+
+        if not _valid_k(k):
+            return _error(f"k must be an integer between 1 and {MAX_SEARCH_K}", 400)
+
+        async with limiter.slot():
+            results = await run_in_threadpool(chatbot.search_documents, query, k=k)
+
+        # Format results
+        formatted_results = []
+        for doc in results:
+            formatted_results.append({
+                "filename": doc.metadata.get('filename', 'Unknown'),
+                "content": doc.page_content,
+                "source": doc.metadata.get('source', '')
+            })
+
+        return {
+            "results": formatted_results,
+            "count": len(formatted_results)
+        }
+
+    except Saturated as e:
+        return _saturated(e)
+    except Exception as e:
+        return _error(str(e), 500)
+
+
+@app.post('/api/search/batch')
+async def search_batch(request: Request, chatbot=Depends(get_chatbot)):
+    """Batch search endpoint - nhiều query trong 1 request"""
+    try:
+        data = await _json_body(request)
+        queries = data.get('queries')
+        k = data.get('k', 5)
+
+        if not isinstance(queries, list) or not queries or \
+                not all(isinstance(q, str) and q.strip() for q in queries):
+            return _error("Queries must be a non-empty list of strings", 400)
+
+        if len(queries) > MAX_BATCH_QUERIES:
+            return _error(f"Too many queries (max {MAX_BATCH_QUERIES})", 400)
+
+        if not _valid_k(k):
+            return _error(f"k must be an integer between 1 and {MAX_SEARCH_K}", 400)
+
+        async with limiter.slot():
+            results = await run_in_threadpool(
+                chatbot.search_documents_batch, [q.strip() for q in queries], k=k
+            )
+
+        return {
+            "results": [
+                {
+                    "query": query,
+                    "results": [
+                        {
+                            "filename": doc.metadata.get('filename', 'Unknown'),
+                            "content": doc.page_content,
+                            "source": doc.metadata.get('source', ''),
+                            "score": score
+                        }
+                        for doc, score in docs
+                    ]
+                }
+                for query, docs in zip(queries, results)
+            ],
+            "count": len(results)
+        }
+
+    except Saturated as e:
+        return _saturated(e)
+    except Exception as e:
+        return _error(str(e), 500)
+
+
+@app.post('/api/compare')
+async def compare(request: Request, chatbot=Depends(get_chatbot)):
+    """Compare documents endpoint"""
+    try:
+        data = await _json_body(request)
+        file1 = data.get('file1', '').strip()
+        file2 = data.get('file2', '').strip()
+
+        if not file1 or not file2:
+            return _error("Both file paths are required", 400)
+
+        result = await run_in_threadpool(chatbot.compare_documents, file1, file2)
+
+        if 'error' in result:
+            return _error(result['error'], 400)
+
+        return result
+
+    except Exception as e:
+        return _error(str(e), 500)
+
+
+@app.post('/api/upload')
+async def upload(request: Request, chatbot=Depends(get_chatbot)):
+    """
+    Upload documents endpoint - lưu file và index trong background, trả về job ngay (HTTP 202)
+    Nhiều file: lặp lại field 'files' trong multipart; trạng thái qua /api/upload/jobs/{job_id}
+    """
+    jobs = []
+    try:
+        form = await request.form()
+        files = [
+            file for file in form.getlist('file') + form.getlist('files')
+            if not isinstance(file, str)
+        ]
+
+        if not files:
+            return _error("No file provided", 400)
+
+        if any(file.filename == '' for file in files):
+            return _error("No file selected", 400)
+
+        # Hàng đợi đầy: từ chối trước khi lưu file vào documents
+        chatbot.ingest_jobs.check_capacity(len(files))
+
+        for file in files:
+            # Save file
+            filename = os.path.basename(file.filename)
+            filepath = os.path.join('./documents', filename)
+            existed = os.path.exists(filepath)
+            with open(filepath, 'wb') as f:
+                f.write(await file.read())
+
+            # Index trong background
+            jobs.append(chatbot.submit_document(filepath, filename, remove_on_reject=not existed))
+
+        response = {
+            "status": "queued",
+            "message": f"{len(jobs)} document(s) queued for indexing",
+            "jobs": jobs
+        }
+        if len(jobs) == 1:
+            response["job_id"] = jobs[0]["job_id"]
+            response["filename"] = jobs[0]["filename"]
+
+        return JSONResponse(response, status_code=202)
+
+    except QueueFull as e:
+        # Các file đã nhận (jobs) vẫn được index, chỉ các file còn lại cần upload lại
+        return JSONResponse(
+            {
+                "error": str(e),
+                "jobs": jobs,
+                "rejected": [os.path.basename(file.filename) for file in files[len(jobs):]]
+            },
+            status_code=429,
+            headers={"Retry-After": "5"}
+        )
+    except Exception as e:
+        return _error(str(e), 500)
+
+
+@app.get('/api/upload/jobs')
+async def upload_jobs(limit: int = 50, chatbot=Depends(get_chatbot)):
+    """Các upload job gần nhất và thống kê hàng đợi index"""
+    return {
+        "jobs": chatbot.ingest_jobs.recent(limit),
+        "stats": chatbot.ingest_jobs.stats()
+    }
+
+
+@app.get('/api/upload/jobs/{job_id}')
+async def upload_job(job_id: str, chatbot=Depends(get_chatbot)):
+    """Trạng thái 1 upload job: queued -> running (stage: parsing/indexing/saving) -> done | failed"""
+    job = chatbot.ingest_jobs.get(job_id)
+
+    if job is None:
+        return _error("Job not found", 404)
+
+    return job
+
+
+@app.get('/api/conversations/{conversation_id}')
+async def get_conversation(conversation_id: str, chatbot=Depends(get_chatbot)):
+    """Get conversation history (các lượt còn giữ trong session store)"""
+    messages = chatbot.conversation_messages(conversation_id)
+    if messages is None:
+        return _error("Conversation not found", 404)
+
+    return {
+        "conversation_id": conversation_id,
+        "messages": messages
+    }
+
+
+@app.post('/api/conversations/{conversation_id}/reset')
+async def reset_conversation(conversation_id: str, chatbot=Depends(get_chatbot)):
+    """Reset conversation"""
+    chatbot.reset_conversation(conversation_id)
+
+    return {
+        "status": "success",
+        "message": "Conversation reset"
+    }
+
+
+@app.post('/api/rebuild')
+async def rebuild_vector_store(request: Request, chatbot=Depends(get_chatbot)):
+    """Rebuild vector store from documents folder (incremental by default)"""
+    try:
+        data = await _json_body(request)
+        stats = await run_in_threadpool(chatbot.rebuild_vector_store, full=bool(data.get('full', False)))
+        return {
+            "status": "success",
+            "message": "Vector store rebuilt",
+            "stats": stats
+        }
+    except Exception as e:
+        return _error(str(e), 500)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    # Create documents folder
+    os.makedirs('./documents', exist_ok=True)
+
+    print("\n" + "="*60)
+    print("ME Chatbot Async API Server")
+    print("="*60)
+    print(f"\nMax concurrent requests: {limiter.max_concurrency}, queue: {limiter.max_queue}")
+    print("Same endpoints as api_server.py; returns HTTP 429 when saturated")
+    print("\n" + "="*60 + "\n")
+
+    uvicorn.run(
+        app,
+        host='0.0.0.0',
+        port=5000
+    )
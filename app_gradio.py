@@ -6,50 +6,95 @@ Giao diện web đơn giản để chat và so sánh tài liệu
 import gradio as gr
 import os
 import sys
+import time
+import uuid
+import shutil
 
 # Add src to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 
-from src.chatbot import MEChatbot
 from src.document_compare import DocumentCompare
+from src.startup import BackgroundLoader, NotReady
 
+# Số giây chờ chatbot khởi tạo xong trước khi báo "đang khởi động"
+STARTUP_WAIT_SECONDS = float(os.getenv("STARTUP_WAIT_SECONDS", 30))
 
-# Initialize chatbot
-print("Initializing ME Chatbot...")
-chatbot = MEChatbot(
-    documents_path="./documents",
-    vector_db_path="./vector_db",
-    use_local_llm=False  # Đổi thành True nếu dùng vLLM local
-)
+
+def _create_chatbot():
+    with chatbot_loader.phase("imports"):
+        from src.chatbot import MEChatbot
+    
+    return MEChatbot(
+        documents_path="./documents",
+        vector_db_path="./vector_db",
+        use_local_llm=False,  # Đổi thành True nếu dùng vLLM local
+        startup_timings=chatbot_loader.phases
+    )
+
+
+# Initialize chatbot in background - giao diện mở ngay trong khi model/index đang load
+print("Initializing ME Chatbot in background...")
+chatbot_loader = BackgroundLoader(_create_chatbot, name="ME Chatbot")
+chatbot_loader.start()
 
 document_compare = DocumentCompare()
 
 
-def chat_interface(message, history):
-    """Chat interface cho Gradio"""
+def get_chatbot():
+    """Chatbot đã khởi tạo, raise NotReady nếu chưa xong sau STARTUP_WAIT_SECONDS"""
+    return chatbot_loader.get(timeout=STARTUP_WAIT_SECONDS)
+
+
+def startup_status():
+    """Trạng thái khởi tạo hệ thống"""
+    status = chatbot_loader.status()
+    if status["state"] == "ready":
+        return f"✓ Sẵn sàng (khởi tạo {status['elapsed_s']}s)"
+    if status["state"] == "failed":
+        return f"Lỗi khởi tạo: {status['error']}"
+    return f"⏳ Đang khởi động... ({status['elapsed_s']}s)"
+
+
+def chat_interface(message, history, conversation_id):
+    """Chat interface cho Gradio - stream câu trả lời theo từng token"""
     if not message.strip():
-        return history, ""
+        yield history, ""
+        return
     
-    # Call chatbot
-    result = chatbot.chat(message)
+    history.append((message, ""))
+    answer = ""
     
-    # Format response with sources
-    response = result['answer']
-    
-    if result['sources']:
-        response += "\n\n📚 **Nguồn tham khảo:**\n"
-        for i, source in enumerate(result['sources'][:3], 1):
-            response += f"{i}. {source['filename']}\n"
-    
-    # Add to history
-    history.append((message, response))
+    try:
+        chatbot = get_chatbot()
+    except NotReady:
+        history[-1] = (message, startup_status())
+        yield history, message
+        return
     
-    return history, ""
+    # Call chatbot (streaming)
+    for event in chatbot.chat_stream(message, conversation_id=conversation_id):
+        if event['type'] == 'token':
+            answer += event['content']
+            history[-1] = (message, answer)
+            yield history, ""
+        elif event['type'] == 'sources' and event['sources']:
+            # Format response with sources
+            answer += "\n\n📚 **Nguồn tham khảo:**\n"
+            for i, source in enumerate(event['sources'][:3], 1):
+                answer += f"{i}. {source['filename']}\n"
+            history[-1] = (message, answer)
+            yield history, ""
+        elif event['type'] == 'error':
+            history[-1] = (message, event['error'])
+            yield history, ""
 
 
-def reset_chat():
+def reset_chat(conversation_id):
     """Reset conversation"""
-    chatbot.reset_conversation()
+    try:
+        get_chatbot().reset_conversation(conversation_id)
+    except NotReady:
+        return [], startup_status()
     return [], "✓ Đã reset hội thoại"
 
 
@@ -58,7 +103,10 @@ def search_documents(query):
     if not query.strip():
         return "Vui lòng nhập từ khóa tìm kiếm"
     
-    results = chatbot.search_documents(query, k=5)
+    try:
+        results = get_chatbot().search_documents(query, k=5)
+    except NotReady:
+        return startup_status()
     
     if not results:
         return "Không tìm thấy tài liệu nào"
@@ -84,7 +132,7 @@ def compare_files(file1, file2):
         path2 = file2.name if hasattr(file2, 'name') else file2
         
         # Compare
-        result = chatbot.compare_documents(path1, path2)
+        result = get_chatbot().compare_documents(path1, path2)
         
         if 'error' in result:
             return result['error']
@@ -111,31 +159,75 @@ def compare_files(file1, file2):
         
         return output
     
+    except NotReady:
+        return startup_status()
     except Exception as e:
         return f"Lỗi: {str(e)}"
 
 
-def upload_document(file):
-    """Upload và index document mới"""
-    if file is None:
-        return "Vui lòng chọn file"
+# Số giây giữa 2 lần cập nhật trạng thái upload job
+UPLOAD_POLL_SECONDS = float(os.getenv("UPLOAD_POLL_SECONDS", 1))
+
+_JOB_STATES = {
+    "queued": "⏳ Đang chờ",
+    "running": "⚙️ Đang xử lý",
+    "done": "✓ Đã index",
+    "failed": "✗ Lỗi"
+}
+_JOB_STAGES = {"parsing": "đọc và tách văn bản", "indexing": "embed và thêm vào index", "saving": "lưu index"}
+
+
+def _format_job(job):
+    line = f"{_JOB_STATES[job['state']]}: {job['filename']}"
+    if job['state'] == "queued" and job.get('queued_ahead'):
+        line += f" ({job['queued_ahead']} tài liệu phía trước)"
+    elif job['state'] == "running" and job['stage']:
+        line += f" - {_JOB_STAGES.get(job['stage'], job['stage'])} ({job['running_s']:.0f}s)"
+    elif job['state'] == "done":
+        result = job['result'] or {}
+        line += " (không thay đổi)" if result.get('unchanged') else f" - {result.get('chunks', 0)} chunks"
+    elif job['state'] == "failed":
+        line += f" - {job['error']}"
+    return line
+
+
+def upload_documents(files):
+    """Upload nhiều documents, index trong background và cập nhật tiến độ từng file"""
+    if not files:
+        yield "Vui lòng chọn file"
+        return
     
     try:
-        # Save to documents folder
-        filename = os.path.basename(file.name)
-        dest_path = os.path.join("./documents", filename)
+        chatbot = get_chatbot()
         
-        # Copy file
-        import shutil
-        shutil.copy(file.name, dest_path)
+        # Hàng đợi đầy: từ chối trước khi lưu file vào documents
+        chatbot.ingest_jobs.check_capacity(len(files))
         
-        # Add to vector store
-        chatbot.add_document(dest_path)
+        job_ids = []
+        for file in files:
+            # Save to documents folder (Gradio trả về đường dẫn file tạm)
+            source_path = getattr(file, "name", file)
+            filename = os.path.basename(source_path)
+            dest_path = os.path.join("./documents", filename)
+            existed = os.path.exists(dest_path)
+            shutil.copy(source_path, dest_path)
+            
+            # Index trong background
+            job_ids.append(chatbot.submit_document(dest_path, filename, remove_on_reject=not existed)["job_id"])
         
-        return f"✓ Đã upload và index tài liệu: {filename}"
+        # Poll trạng thái tới khi tất cả job xong
+        while True:
+            jobs = [chatbot.ingest_jobs.get(job_id) for job_id in job_ids]
+            jobs = [job for job in jobs if job is not None]
+            yield "\n".join(_format_job(job) for job in jobs)
+            if all(job['state'] in ("done", "failed") for job in jobs):
+                return
+            time.sleep(UPLOAD_POLL_SECONDS)
     
+    except NotReady:
+        yield startup_status()
     except Exception as e:
-        return f"Lỗi: {str(e)}"
+        yield f"Lỗi: {str(e)}"
 
 
 # Create Gradio interface
@@ -197,21 +289,25 @@ with gr.Blocks(
                     - ✅ Nhớ ngữ cảnh
                     """)
             
+            # Mỗi phiên trình duyệt có conversation riêng
+            conversation_id = gr.State(lambda: str(uuid.uuid4()))
+            
             # Event handlers
             msg_input.submit(
                 chat_interface, 
-                inputs=[msg_input, chatbot_ui], 
+                inputs=[msg_input, chatbot_ui, conversation_id], 
                 outputs=[chatbot_ui, msg_input]
             )
             
             send_btn.click(
                 chat_interface, 
-                inputs=[msg_input, chatbot_ui], 
+                inputs=[msg_input, chatbot_ui, conversation_id], 
                 outputs=[chatbot_ui, msg_input]
             )
             
             reset_btn.click(
                 reset_chat,
+                inputs=[conversation_id],
                 outputs=[chatbot_ui, status_text]
             )
         
@@ -269,25 +365,30 @@ with gr.Blocks(
             gr.Markdown("""
             ### Upload tài liệu mới vào hệ thống
             
-            Hệ thống sẽ tự động xử lý và index tài liệu để chatbot có thể trả lời câu hỏi.
+            Hệ thống sẽ tự động xử lý và index tài liệu (trong background) để chatbot có thể trả lời câu hỏi.
+            Có thể chọn nhiều file cùng lúc.
             
             **Định dạng hỗ trợ:** PDF, DOCX, TXT
             """)
             
             upload_file = gr.File(
                 label="Chọn tài liệu",
-                file_types=[".pdf", ".docx", ".txt"]
+                file_types=[".pdf", ".docx", ".txt"],
+                file_count="multiple"
             )
             
             upload_btn = gr.Button("Upload & Index", variant="primary")
-            upload_output = gr.Textbox(label="Kết quả", interactive=False)
+            upload_output = gr.Textbox(label="Kết quả", interactive=False, lines=4)
             
             upload_btn.click(
-                upload_document,
+                upload_documents,
                 inputs=[upload_file],
                 outputs=[upload_output]
             )
     
+    # Hiển thị trạng thái khởi tạo khi mở trang
+    demo.load(startup_status, outputs=[status_text])
+    
     gr.Markdown("""
     ---
     **ME Internal Chatbot** | Powered by Langchain, vLLM, Qwen3-14B-AWQ
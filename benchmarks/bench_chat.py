@@ -0,0 +1,154 @@
+"""
+Benchmark Chat - End-to-end chat (retrieval + prompt + LLM) với LLM stub cục bộ
+LLM là StubLLMServer (OpenAI-compatible) với latency và tốc độ sinh token giả lập, nên kết quả
+phản ánh overhead của pipeline chứ không phụ thuộc vào LLM server thật
+Đo: time to first token, latency tổng p50/p95/p99 (tuần tự và đồng thời), thời gian từng stage
+(mechat_stage_seconds), số token prompt/completion, tỉ lệ nguồn trả về đúng file
+
+Chạy: python benchmarks/bench_chat.py --files 100 --questions 50 --concurrency 4 --output results/chat.json
+"""
+
+import os
+import time
+import random
+import shutil
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from bench_utils import (
+    Timer, format_stages, latency_summary, peak_rss_mb, print_section, stage_deltas, write_results
+)
+from synthetic_corpus import generate_corpus
+
+
+def _ask(chatbot, query: Dict, conversation_id: str) -> Dict:
+    """1 câu hỏi qua chat_stream: thời gian token đầu tiên, tổng thời gian và event done"""
+    start = time.perf_counter()
+    first_token = None
+    sources: List[Dict] = []
+    done: Dict = {}
+    for event in chatbot.chat_stream(query["query"], conversation_id=conversation_id):
+        if event["type"] == "token" and first_token is None:
+            first_token = time.perf_counter() - start
+        elif event["type"] == "sources":
+            sources = event["sources"]
+        elif event["type"] in ("done", "error"):
+            done = event
+    return {
+        "ttft": first_token,
+        "total": time.perf_counter() - start,
+        "error": done.get("type") == "error",
+        "prompt_tokens": done.get("prompt_tokens"),
+        "completion_tokens": done.get("completion_tokens"),
+        "source_hit": any(source.get("filename") == query["filename"] for source in sources)
+    }
+
+
+def _run_questions(chatbot, queries: List[Dict], concurrency: int, prefix: str) -> Dict:
+    def ask(item):
+        i, query = item
+        # Mỗi câu hỏi 1 conversation riêng: không có lịch sử, không bị condense
+        return _ask(chatbot, query, f"{prefix}-{i}")
+
+    with Timer() as wall:
+        if concurrency <= 1:
+            answers = [ask(item) for item in enumerate(queries)]
+        else:
+            with ThreadPoolExecutor(concurrency) as executor:
+                answers = list(executor.map(ask, enumerate(queries)))
+
+    ok = [answer for answer in answers if not answer["error"]]
+    prompt_tokens = [answer["prompt_tokens"] for answer in ok if answer["prompt_tokens"] is not None]
+    completion_tokens = [answer["completion_tokens"] for answer in ok if answer["completion_tokens"] is not None]
+    return {
+        "requests": len(answers),
+        "errors": len(answers) - len(ok),
+        "throughput_rps": round(len(answers) / wall.elapsed, 2),
+        "time_to_first_token": latency_summary([answer["ttft"] for answer in ok if answer["ttft"] is not None]),
+        "latency": latency_summary([answer["total"] for answer in ok]),
+        "avg_prompt_tokens": round(sum(prompt_tokens) / len(prompt_tokens), 1) if prompt_tokens else None,
+        "avg_completion_tokens": round(sum(completion_tokens) / len(completion_tokens), 1) if completion_tokens else None,
+        "source_hit_rate": round(sum(answer["source_hit"] for answer in ok) / len(ok), 4) if ok else 0.0
+    }
+
+
+def run(args) -> Dict:
+    from llm_stub_server import StubLLMServer
+
+    stub = StubLLMServer(port=0, latency=args.llm_latency, token_delay=args.token_delay).start()
+    os.environ["LLM_API_BASE"] = stub.base_url
+    os.environ.pop("LLM_API_BASES", None)
+    os.environ.pop("CONDENSE_LLM_API_BASE", None)
+    os.environ["ANSWER_CACHE_ENABLED"] = "true" if args.answer_cache else "false"
+    os.environ["QUERY_CACHE_SIZE"] = "0"
+
+    from chatbot import MEChatbot
+    from metrics import STAGE_SECONDS
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="mechat-bench-")
+    documents_dir = os.path.join(workdir, "documents")
+    db_path = os.path.join(workdir, "vector_db")
+    for path in (documents_dir, db_path):
+        shutil.rmtree(path, ignore_errors=True)
+
+    queries = generate_corpus(documents_dir, args.files, args.articles, seed=args.seed)
+    queries = [query for query in queries if query["kind"] == "semantic"]
+    queries = random.Random(args.seed).sample(queries, min(args.questions, len(queries)))
+
+    results: Dict = {}
+    timings: Dict[str, float] = {}
+    with Timer() as startup_timer:
+        chatbot = MEChatbot(
+            documents_path=documents_dir,
+            vector_db_path=db_path,
+            use_local_llm=True,
+            startup_timings=timings
+        )
+    results["startup"] = {"total_s": round(startup_timer.elapsed, 2), **timings}
+    print_section("Startup", results["startup"])
+
+    # Warm-up
+    for i, query in enumerate(queries[:3]):
+        _ask(chatbot, query, f"warmup-{i}")
+    stages_before = STAGE_SECONDS.snapshot()
+
+    results["sequential"] = _run_questions(chatbot, queries, 1, "seq")
+    print_section("Sequential", results["sequential"])
+    if args.concurrency > 1:
+        results[f"concurrent_{args.concurrency}"] = _run_questions(chatbot, queries, args.concurrency, "conc")
+        print_section(f"Concurrent ({args.concurrency} threads)", results[f"concurrent_{args.concurrency}"])
+
+    # Thời gian trung bình từng stage trong phần đo (không tính startup và warm-up)
+    results["stages"] = stage_deltas(stages_before, STAGE_SECONDS.snapshot())
+    print_section("Stages (avg)", format_stages(results["stages"]))
+
+    results["llm_stub"] = {"requests": stub.requests, "failures": stub.failures}
+    results["peak_rss_mb"] = peak_rss_mb()
+    stub.stop()
+
+    if not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="End-to-end chat benchmark với LLM stub cục bộ")
+    parser.add_argument("--files", type=int, default=100, help="Số file trong corpus")
+    parser.add_argument("--articles", type=int, default=12, help="Số Điều mỗi file")
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=4, help="Số thread chat đồng thời (1 = bỏ qua)")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Độ trễ trước token đầu tiên của stub (giây)")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="Độ trễ giữa các token của stub (giây)")
+    parser.add_argument("--answer-cache", action="store_true", help="Bật answer cache (mặc định tắt)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workdir", help="Giữ corpus và index tại thư mục này (mặc định: thư mục tạm, xóa sau khi chạy)")
+    parser.add_argument("--output", help="Ghi kết quả JSON")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = run(args)
+    write_results(args.output, vars(args), results)
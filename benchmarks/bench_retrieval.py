@@ -0,0 +1,173 @@
+"""
+Benchmark Retrieval - Ingest, build index và truy vấn trên corpus tổng hợp
+Đo: files/s, chunks/s khi ingest; thời gian build/save index; bộ nhớ (RSS) và dung lượng trên disk;
+latency p50/p95/p99 của hybrid search và vector search (tuần tự và đồng thời); recall@k, MRR
+
+Chạy: python benchmarks/bench_retrieval.py --files 500 --queries 200 --k 4 --output results/retrieval.json
+Embedding model phải có sẵn trong cache HuggingFace (chạy offline sau lần tải đầu tiên)
+"""
+
+import os
+import time
+import random
+import shutil
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from bench_utils import (
+    Timer, dir_size_mb, latency_summary, peak_rss_mb, print_section, recall_at_k, rss_mb, write_results
+)
+from synthetic_corpus import generate_corpus
+
+
+def _timed_queries(search, queries: List[str], concurrency: int = 1):
+    """Chạy search cho từng query, trả về (filenames theo thứ tự kết quả, latencies, wall time)"""
+    def run(query):
+        start = time.perf_counter()
+        documents = search(query)
+        return [doc.metadata.get("filename") for doc in documents], time.perf_counter() - start
+
+    with Timer() as wall:
+        if concurrency <= 1:
+            results = [run(query) for query in queries]
+        else:
+            with ThreadPoolExecutor(concurrency) as executor:
+                results = list(executor.map(run, queries))
+    return [filenames for filenames, _ in results], [latency for _, latency in results], wall.elapsed
+
+
+def _evaluate(name: str, search, queries: List[Dict], k: int, concurrency: int) -> Dict:
+    texts = [query["query"] for query in queries]
+    expected = [query["filename"] for query in queries]
+
+    ranked, latencies, wall = _timed_queries(search, texts)
+    result = {
+        "latency": latency_summary(latencies),
+        **recall_at_k(ranked, expected, k)
+    }
+    for kind in sorted({query["kind"] for query in queries}):
+        indices = [i for i, query in enumerate(queries) if query["kind"] == kind]
+        result[f"recall@{k}_{kind}"] = recall_at_k(
+            [ranked[i] for i in indices], [expected[i] for i in indices], k
+        )[f"recall@{k}"]
+
+    if concurrency > 1:
+        _, latencies, wall = _timed_queries(search, texts, concurrency)
+        result[f"concurrent_{concurrency}"] = {
+            "latency": latency_summary(latencies),
+            "qps": round(len(texts) / wall, 2)
+        }
+
+    print_section(name, result)
+    return result
+
+
+def run(args) -> Dict:
+    # Đo latency thực của embedding: không dùng LRU cache cho query
+    os.environ["QUERY_CACHE_SIZE"] = "0"
+    if args.index_type:
+        os.environ["FAISS_INDEX_TYPE"] = args.index_type
+
+    from vector_store import VectorStore
+    from document_processor import DocumentProcessor, IngestProgress
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="mechat-bench-")
+    documents_dir = os.path.join(workdir, "documents")
+    db_path = os.path.join(workdir, "vector_db")
+    for path in (documents_dir, db_path):
+        shutil.rmtree(path, ignore_errors=True)
+
+    with Timer() as corpus_timer:
+        queries = generate_corpus(documents_dir, args.files, args.articles, seed=args.seed)
+    queries = random.Random(args.seed).sample(queries, min(args.queries, len(queries)))
+
+    results: Dict = {}
+    rss_start = rss_mb()
+    with Timer() as model_timer:
+        vector_store = VectorStore(persist_directory=db_path)
+    processor = DocumentProcessor(chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap)
+
+    files = DocumentProcessor.list_files(documents_dir)
+    progress = IngestProgress(total_files=len(files))
+
+    def chunks():
+        for file_path, file_chunks in processor.iter_process_files(files, workers=args.workers):
+            progress.file_done()
+            filename = os.path.basename(file_path)
+            for i, chunk in enumerate(file_chunks or []):
+                yield chunk, f"{filename}:{i}"
+
+    with Timer() as ingest_timer:
+        total_chunks = vector_store.add_documents_stream(chunks(), on_batch=progress.chunks_added)
+    with Timer() as build_timer:
+        vector_store.build_index()
+    with Timer() as save_timer:
+        vector_store.save()
+
+    results["ingest"] = {
+        "files": len(files),
+        "chunks": total_chunks,
+        "corpus_generation_s": round(corpus_timer.elapsed, 2),
+        "model_load_s": round(model_timer.elapsed, 2),
+        "ingest_s": round(ingest_timer.elapsed, 2),
+        "files_per_s": round(len(files) / ingest_timer.elapsed, 2),
+        "chunks_per_s": round(total_chunks / ingest_timer.elapsed, 2),
+        "index_type": vector_store.index_type(),
+        "build_index_s": round(build_timer.elapsed, 3),
+        "save_s": round(save_timer.elapsed, 3)
+    }
+    print_section("Ingest", results["ingest"])
+
+    results["memory"] = {
+        "rss_start_mb": rss_start,
+        "rss_after_ingest_mb": rss_mb(),
+        "peak_rss_mb": peak_rss_mb(),
+        "index_on_disk_mb": dir_size_mb(db_path)
+    }
+    print_section("Memory", results["memory"])
+
+    # Warm-up (load lazy components, page cache)
+    for query in queries[:5]:
+        vector_store.hybrid_search(query["query"], k=args.k)
+
+    results["hybrid_search"] = _evaluate(
+        "Hybrid search (vector + BM25)",
+        lambda query: vector_store.hybrid_search(query, k=args.k),
+        queries, args.k, args.concurrency
+    )
+    results["vector_search"] = _evaluate(
+        "Vector search",
+        lambda query: vector_store.similarity_search(query, k=args.k),
+        queries, args.k, args.concurrency
+    )
+    results["memory"]["peak_rss_mb"] = peak_rss_mb()
+    results["embedding_batcher"] = vector_store.embedding_batcher_stats()
+
+    if not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Retrieval benchmark trên corpus quy định tổng hợp")
+    parser.add_argument("--files", type=int, default=200, help="Số file trong corpus")
+    parser.add_argument("--articles", type=int, default=12, help="Số Điều mỗi file")
+    parser.add_argument("--queries", type=int, default=200, help="Số câu hỏi đánh giá")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=1, help="Số process parse file (INGEST_WORKERS)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Số thread truy vấn đồng thời (1 = bỏ qua)")
+    parser.add_argument("--index-type", choices=["flat", "ivf", "hnsw", "ivfpq"], help="Ghi đè FAISS_INDEX_TYPE")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workdir", help="Giữ corpus và index tại thư mục này (mặc định: thư mục tạm, xóa sau khi chạy)")
+    parser.add_argument("--output", help="Ghi kết quả JSON")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = run(args)
+    write_results(args.output, vars(args), results)
@@ -0,0 +1,138 @@
+"""
+Benchmark Utils - Percentiles, bộ nhớ tiến trình, kích thước thư mục và ghi kết quả
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Benchmarks import trực tiếp các module trong src/ (giống api_server.py)
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+
+def latency_summary(seconds: Sequence[float]) -> Dict:
+    """p50/p95/p99/mean/max (ms) của danh sách thời gian (giây)"""
+    if not len(seconds):
+        return {"count": 0}
+    ms = np.asarray(seconds, dtype=np.float64) * 1000
+    return {
+        "count": int(len(ms)),
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(ms, 95)), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+        "mean_ms": round(float(ms.mean()), 2),
+        "max_ms": round(float(ms.max()), 2)
+    }
+
+
+def rss_mb() -> Optional[float]:
+    """RSS hiện tại của tiến trình (Linux /proc), None nếu không đọc được"""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def peak_rss_mb() -> Optional[float]:
+    """RSS lớn nhất từ khi tiến trình chạy"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux trả về KB, macOS trả về bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def dir_size_mb(directory: str) -> float:
+    total = 0
+    for root, _, files in os.walk(directory):
+        for filename in files:
+            total += os.path.getsize(os.path.join(root, filename))
+    return round(total / (1024 * 1024), 2)
+
+
+def environment() -> Dict:
+    """Thông tin môi trường để so sánh kết quả giữa các lần chạy"""
+    info = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count()
+    }
+    try:
+        import faiss
+        info["faiss"] = faiss.__version__
+    except Exception:
+        pass
+    return info
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+
+
+def stage_deltas(before: Dict, after: Dict) -> Dict:
+    """Số lần và thời gian trung bình (ms) từng stage giữa 2 lần STAGE_SECONDS.snapshot()"""
+    stages = {}
+    for stage, values in after.items():
+        previous = before.get(stage, {"count": 0, "avg": 0.0})
+        count = values["count"] - previous["count"]
+        if count:
+            total = values["avg"] * values["count"] - previous["avg"] * previous["count"]
+            stages[stage.replace("stage=", "")] = {"count": count, "avg_ms": round(total / count * 1000, 2)}
+    return stages
+
+
+def format_stages(stages: Dict) -> Dict:
+    return {stage: f"{values['avg_ms']} ms x {values['count']}" for stage, values in stages.items()}
+
+
+def print_section(title: str, values: Dict):
+    print(f"\n{title}")
+    for key, value in values.items():
+        print(f"  {key:<24} {value}")
+
+
+def write_results(path: Optional[str], config: Dict, results: Dict):
+    """Ghi {config, environment, results} ra JSON (để so sánh giữa các commit)"""
+    if not path:
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(
+            {"config": config, "environment": environment(), "results": results},
+            f, ensure_ascii=False, indent=2
+        )
+    print(f"\nResults written to {path}")
+
+
+def recall_at_k(ranked_filenames: List[List[str]], expected: List[str], k: int) -> Dict:
+    """recall@k (file đúng nằm trong top-k) và MRR"""
+    hits = 0
+    reciprocal_ranks = 0.0
+    for filenames, target in zip(ranked_filenames, expected):
+        top = filenames[:k]
+        if target in top:
+            hits += 1
+            reciprocal_ranks += 1 / (top.index(target) + 1)
+    n = len(expected)
+    return {
+        f"recall@{k}": round(hits / n, 4) if n else 0.0,
+        "mrr": round(reciprocal_ranks / n, 4) if n else 0.0
+    }
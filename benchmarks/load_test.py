@@ -0,0 +1,323 @@
+"""
+Load Test - Tải hỗn hợp /api/chat, /api/search, /api/upload với concurrency tăng dần
+Mỗi mức concurrency chạy N client (closed loop) trong --duration giây; báo cáo throughput,
+latency p50/p95/p99 và tỉ lệ lỗi theo endpoint, và mức concurrency mà throughput ngừng tăng
+(MEChatbot dùng chung đã bão hòa)
+
+Mặc định chạy api_server.py trong tiến trình (corpus tổng hợp + LLM stub), hoặc --url để bắn vào server đang chạy
+Chạy: python benchmarks/load_test.py --concurrency 1,2,4,8,16 --duration 20 --mix chat=70,search=25,upload=5
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from bench_utils import (
+    format_stages, latency_summary, peak_rss_mb, print_section, stage_deltas, write_results
+)
+from synthetic_corpus import generate_corpus
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENDPOINTS = ("chat", "search", "upload")
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """'chat=70,search=25,upload=5' -> trọng số theo endpoint"""
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"Unknown endpoint in mix: {name}")
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("Mix must have a positive weight")
+    return mix
+
+
+class LoadClient:
+    """1 client ảo: chọn endpoint theo mix, gửi request, ghi (endpoint, status, latency)"""
+
+    def __init__(
+        self,
+        http: httpx.Client,
+        worker: int,
+        mix: Dict[str, float],
+        queries: List[Dict],
+        uploads: List[str],
+        chat_turns: int,
+        seed: int
+    ):
+        self.http = http
+        self.worker = worker
+        self.rng = random.Random(seed * 1000 + worker)
+        self.endpoints = list(mix)
+        self.weights = [mix[name] for name in self.endpoints]
+        self.queries = queries
+        self.uploads = uploads
+        self.chat_turns = chat_turns
+        self.sent = 0
+        self.chats = 0
+
+    def _chat(self) -> httpx.Response:
+        # Hội thoại chat_turns lượt rồi bắt đầu conversation mới (có cả câu hỏi tiếp theo -> condense)
+        conversation = self.chats // self.chat_turns
+        self.chats += 1
+        query = self.rng.choice(self.queries)
+        return self.http.post("/api/chat", json={
+            "message": query["query"],
+            "conversation_id": f"load-{self.worker}-{conversation}"
+        })
+
+    def _search(self) -> httpx.Response:
+        query = self.rng.choice(self.queries)
+        return self.http.post("/api/search", json={"query": query["query"], "k": 5})
+
+    def _upload(self) -> httpx.Response:
+        path = self.rng.choice(self.uploads)
+        with open(path, "rb") as f:
+            content = f.read()
+        # Tên file mới mỗi lần: mỗi upload là 1 document mới được index
+        filename = f"load_{self.worker}_{self.sent}_{os.path.basename(path)}"
+        return self.http.post("/api/upload", files={"file": (filename, content, "text/plain")})
+
+    def request(self) -> Tuple[str, Optional[int], float]:
+        endpoint = self.rng.choices(self.endpoints, self.weights)[0]
+        self.sent += 1
+        start = time.perf_counter()
+        try:
+            response = getattr(self, f"_{endpoint}")()
+            status = response.status_code
+        except httpx.HTTPError:
+            status = None
+        return endpoint, status, time.perf_counter() - start
+
+
+def run_level(
+    base_url: str,
+    concurrency: int,
+    duration: float,
+    mix: Dict[str, float],
+    queries: List[Dict],
+    uploads: List[str],
+    chat_turns: int,
+    timeout: float,
+    seed: int
+) -> Dict:
+    """Chạy concurrency clients trong duration giây, trả về thống kê theo endpoint"""
+    records: List[Tuple[str, Optional[int], float]] = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    http = httpx.Client(
+        base_url=base_url,
+        timeout=timeout,
+        limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    )
+
+    def worker(index: int):
+        client = LoadClient(http, index, mix, queries, uploads, chat_turns, seed + concurrency)
+        while time.perf_counter() < deadline:
+            record = client.request()
+            with lock:
+                records.append(record)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    http.close()
+
+    def summarize(items: List[Tuple[str, Optional[int], float]]) -> Dict:
+        errors = [item for item in items if item[1] is None or item[1] >= 400]
+        statuses: Dict[str, int] = {}
+        for _, status, _ in items:
+            key = str(status) if status is not None else "connection_error"
+            statuses[key] = statuses.get(key, 0) + 1
+        return {
+            "requests": len(items),
+            "throughput_rps": round(len(items) / elapsed, 2),
+            "error_rate": round(len(errors) / len(items), 4) if items else 0.0,
+            "latency": latency_summary([item[2] for item in items if item not in errors]),
+            "statuses": statuses
+        }
+
+    result = {"concurrency": concurrency, "elapsed_s": round(elapsed, 2), "all": summarize(records)}
+    for endpoint in mix:
+        result[endpoint] = summarize([record for record in records if record[0] == endpoint])
+    return result
+
+
+def find_saturation(levels: List[Dict], min_gain: float) -> Optional[int]:
+    """Mức concurrency cuối cùng mà throughput còn tăng ít nhất min_gain so với mức trước"""
+    for previous, current in zip(levels, levels[1:]):
+        if current["all"]["throughput_rps"] < previous["all"]["throughput_rps"] * (1 + min_gain):
+            return previous["concurrency"]
+    return None
+
+
+class InProcessServer:
+    """api_server.py (Flask, threaded) + LLM stub + corpus tổng hợp trong thư mục tạm"""
+
+    def __init__(self, args):
+        self.args = args
+        self.workdir = args.workdir or tempfile.mkdtemp(prefix="mechat-load-")
+        self.stub = None
+        self.server = None
+        self.stage_seconds = None
+
+    def start(self) -> str:
+        from llm_stub_server import StubLLMServer
+        from werkzeug.serving import make_server
+
+        documents_dir = os.path.join(self.workdir, "documents")
+        for path in (documents_dir, os.path.join(self.workdir, "vector_db")):
+            shutil.rmtree(path, ignore_errors=True)
+        generate_corpus(documents_dir, self.args.files, self.args.articles, seed=self.args.seed)
+
+        self.stub = StubLLMServer(port=0, latency=self.args.llm_latency, token_delay=self.args.token_delay).start()
+        # api_server.py dùng OpenAI mode với ./documents, ./vector_db
+        os.environ["OPENAI_API_BASE"] = self.stub.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "EMPTY")
+        os.environ["ANSWER_CACHE_ENABLED"] = "true" if self.args.answer_cache else "false"
+        os.chdir(self.workdir)
+
+        if REPO_DIR not in sys.path:
+            sys.path.insert(0, REPO_DIR)
+        import api_server
+        from metrics import STAGE_SECONDS
+        self.stage_seconds = STAGE_SECONDS
+
+        # Không in access log của từng request
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        self.server = make_server("127.0.0.1", 0, api_server.app, threaded=True)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{self.server.server_port}"
+        wait_ready(base_url, timeout=self.args.startup_timeout)
+        return base_url
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+        if self.stub is not None:
+            self.stub.stop()
+        os.chdir(REPO_DIR)
+        if not self.args.workdir:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+def wait_ready(base_url: str, timeout: float):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{base_url}/api/ready", timeout=5).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"Server at {base_url} not ready after {timeout}s")
+
+
+def run(args) -> Dict:
+    # Câu hỏi: cùng seed với corpus được index; upload: văn bản khác (seed khác)
+    corpus_dir = tempfile.mkdtemp(prefix="mechat-load-queries-")
+    queries = generate_corpus(os.path.join(corpus_dir, "documents"), args.files, args.articles, seed=args.seed)
+    upload_dir = os.path.join(corpus_dir, "uploads")
+    generate_corpus(upload_dir, args.upload_pool, args.articles, seed=args.seed + 1)
+    uploads = [os.path.join(upload_dir, name) for name in sorted(os.listdir(upload_dir))]
+
+    server = None
+    base_url = args.url
+    if not base_url:
+        server = InProcessServer(args)
+        base_url = server.start()
+    else:
+        wait_ready(base_url, timeout=args.startup_timeout)
+
+    results: Dict = {"levels": []}
+    try:
+        for concurrency in args.concurrency:
+            stages_before = server.stage_seconds.snapshot() if server else None
+            level = run_level(
+                base_url, concurrency, args.duration, args.mix, queries, uploads,
+                args.chat_turns, args.timeout, args.seed
+            )
+            if server:
+                level["stages"] = stage_deltas(stages_before, server.stage_seconds.snapshot())
+            results["levels"].append(level)
+
+            print_section(f"Concurrency {concurrency} ({level['elapsed_s']}s)", {
+                endpoint: (
+                    f"{level[endpoint]['throughput_rps']} req/s, "
+                    f"p50 {level[endpoint]['latency'].get('p50_ms')} ms, "
+                    f"p95 {level[endpoint]['latency'].get('p95_ms')} ms, "
+                    f"p99 {level[endpoint]['latency'].get('p99_ms')} ms, "
+                    f"errors {level[endpoint]['error_rate']:.1%}"
+                )
+                for endpoint in ("all", *args.mix)
+            })
+            if server and args.verbose:
+                print_section("  Stages (avg)", format_stages(level["stages"]))
+
+            if level["all"]["error_rate"] > args.max_error_rate:
+                print(f"Error rate above {args.max_error_rate:.0%}, stopping sweep")
+                break
+    finally:
+        if server:
+            results["llm_stub"] = {"requests": server.stub.requests, "failures": server.stub.failures}
+            server.stop()
+        shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    results["saturation_concurrency"] = find_saturation(results["levels"], args.min_gain)
+    results["peak_rss_mb"] = peak_rss_mb()
+    print_section("Summary", {
+        "saturation_concurrency": results["saturation_concurrency"] or "not reached",
+        "max_throughput_rps": max((level["all"]["throughput_rps"] for level in results["levels"]), default=0)
+    })
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load test api_server.py với concurrency tăng dần")
+    parser.add_argument("--url", help="Server đang chạy (vd: http://localhost:5000); mặc định chạy api_server.py trong tiến trình")
+    parser.add_argument("--concurrency", type=lambda v: [int(c) for c in v.split(",")], default=[1, 2, 4, 8, 16],
+                        help="Các mức concurrency, cách nhau bởi dấu phẩy")
+    parser.add_argument("--duration", type=float, default=20, help="Số giây mỗi mức concurrency")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("chat=70,search=25,upload=5"),
+                        help="Tỉ lệ request theo endpoint, vd: chat=70,search=25,upload=5")
+    parser.add_argument("--chat-turns", type=int, default=3, help="Số lượt mỗi conversation")
+    parser.add_argument("--timeout", type=float, default=120, help="Timeout mỗi request (giây)")
+    parser.add_argument("--max-error-rate", type=float, default=0.5, help="Dừng sweep khi tỉ lệ lỗi vượt ngưỡng")
+    parser.add_argument("--min-gain", type=float, default=0.1,
+                        help="Throughput tăng ít hơn tỉ lệ này khi tăng concurrency -> coi là bão hòa")
+    parser.add_argument("--files", type=int, default=100, help="Số file trong corpus")
+    parser.add_argument("--articles", type=int, default=12, help="Số Điều mỗi file")
+    parser.add_argument("--upload-pool", type=int, default=20, help="Số văn bản khác nhau dùng cho upload")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Độ trễ trước token đầu tiên của LLM stub (giây)")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="Độ trễ giữa các token của LLM stub (giây)")
+    parser.add_argument("--answer-cache", action="store_true", help="Bật answer cache (mặc định tắt)")
+    parser.add_argument("--startup-timeout", type=float, default=600)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workdir", help="Thư mục chạy api_server.py (mặc định: thư mục tạm)")
+    parser.add_argument("--verbose", action="store_true", help="In thời gian từng stage ở mỗi mức")
+    parser.add_argument("--output", help="Ghi kết quả JSON")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = run(args)
+    config = {**vars(args), "mix": args.mix}
+    write_results(args.output, config, results)
@@ -0,0 +1,135 @@
+"""
+Synthetic Corpus - Sinh bộ văn bản quy định nội bộ tiếng Việt (giả lập) để benchmark
+Mỗi file là 1 quy định (số hiệu, chủ đề, đơn vị, khu vực) gồm nhiều Điều; kèm theo bộ câu hỏi
+có đáp án là file chứa thông tin (để tính recall@k). Cùng seed -> cùng corpus và câu hỏi
+
+Chạy: python benchmarks/synthetic_corpus.py [output_dir] [n_files] [articles_per_file]
+"""
+
+import os
+import json
+import random
+import itertools
+from typing import Dict, List
+
+TOPICS = [
+    ("nghỉ phép năm", "được nghỉ", "ngày"),
+    ("làm thêm giờ", "được làm thêm tối đa", "giờ mỗi tháng"),
+    ("công tác phí", "được thanh toán", "nghìn đồng mỗi ngày"),
+    ("thưởng hiệu suất", "được thưởng", "phần trăm lương"),
+    ("đào tạo nội bộ", "phải hoàn thành", "giờ học mỗi năm"),
+    ("phụ cấp ăn trưa", "được hỗ trợ", "nghìn đồng mỗi ngày"),
+    ("làm việc từ xa", "được làm việc từ xa", "ngày mỗi tuần"),
+    ("khám sức khỏe định kỳ", "được khám", "lần mỗi năm"),
+    ("hạn mức phê duyệt tín dụng", "được phê duyệt tối đa", "triệu đồng"),
+    ("bảo mật thông tin khách hàng", "phải đổi mật khẩu sau", "ngày"),
+    ("nghỉ thai sản", "được nghỉ", "tháng"),
+    ("hỗ trợ nhà ở", "được hỗ trợ", "triệu đồng mỗi tháng"),
+    ("tuyển dụng nội bộ", "phải thông báo trước", "ngày"),
+    ("đánh giá năng lực", "được đánh giá", "lần mỗi năm"),
+    ("kiểm soát giao dịch tiền mặt", "phải báo cáo giao dịch trên", "triệu đồng"),
+]
+DEPARTMENTS = [
+    "Khối Khách hàng cá nhân", "Khối Khách hàng doanh nghiệp", "Phòng Quản lý rủi ro",
+    "Phòng Công nghệ thông tin", "Phòng Kế toán", "Phòng Nhân sự", "Trung tâm Thẻ",
+    "Phòng Pháp chế", "Trung tâm Vận hành", "Phòng Kiểm toán nội bộ", "Phòng Ngân quỹ",
+    "Trung tâm Chăm sóc khách hàng"
+]
+REGIONS = ["Hà Nội", "TP. Hồ Chí Minh", "Đà Nẵng", "Hải Phòng", "Cần Thơ", "Nghệ An", "Khánh Hòa", "Quảng Ninh"]
+
+FILLER = [
+    "Các đơn vị có trách nhiệm phổ biến quy định này tới toàn bộ cán bộ nhân viên trong phạm vi quản lý.",
+    "Trường hợp phát sinh vướng mắc, đơn vị gửi văn bản về Phòng Nhân sự để được hướng dẫn.",
+    "Hồ sơ đề nghị được lập theo biểu mẫu ban hành kèm theo và lưu trữ tối thiểu năm năm.",
+    "Trưởng đơn vị chịu trách nhiệm kiểm tra, giám sát việc tuân thủ tại đơn vị mình.",
+    "Việc vi phạm quy định sẽ bị xử lý kỷ luật theo Nội quy lao động của ngân hàng.",
+    "Quy định này thay thế các văn bản trước đây trái với nội dung tại đây.",
+    "Nhân viên thử việc áp dụng theo hợp đồng thử việc đã ký, trừ khi có thỏa thuận khác.",
+    "Đề nghị phải được gửi qua hệ thống quản lý nhân sự trước thời hạn quy định.",
+    "Các trường hợp đặc biệt do Tổng Giám đốc xem xét, quyết định.",
+    "Dữ liệu liên quan được bảo mật theo chính sách an toàn thông tin của ngân hàng.",
+    "Đơn vị chủ trì rà soát, cập nhật quy định định kỳ hằng năm hoặc khi có thay đổi pháp luật.",
+    "Chi phí phát sinh được hạch toán vào chi phí hoạt động của đơn vị theo quy định tài chính."
+]
+
+
+def _combinations(seed: int) -> List[tuple]:
+    combos = list(itertools.product(range(len(TOPICS)), range(len(DEPARTMENTS)), range(len(REGIONS))))
+    random.Random(seed).shuffle(combos)
+    return combos
+
+
+def generate_corpus(
+    directory: str,
+    n_files: int = 200,
+    articles_per_file: int = 12,
+    seed: int = 42
+) -> List[Dict]:
+    """
+    Ghi n_files file .txt vào directory, trả về danh sách câu hỏi
+    {"query", "filename", "kind": "semantic" | "code"} - mỗi file 2 câu hỏi
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    combos = _combinations(seed)
+    queries = []
+
+    for i in range(n_files):
+        topic_index, department_index, region_index = combos[i % len(combos)]
+        topic, action, unit = TOPICS[topic_index]
+        department = DEPARTMENTS[department_index]
+        region = REGIONS[region_index]
+        # Vượt quá số tổ hợp: phân biệt bằng số phiên bản
+        version = i // len(combos) + 1
+        year = 2015 + rng.randrange(10)
+        code = f"QĐ-{i + 1:05d}/{year}/ME"
+        value = rng.randrange(2, 60)
+        filename = f"quy_dinh_{i + 1:05d}.txt"
+
+        subject = f"{department} khu vực {region}" + (f" (phiên bản {version})" if version > 1 else "")
+        lines = [
+            f"QUY ĐỊNH VỀ {topic.upper()}",
+            f"Số: {code}",
+            f"Áp dụng cho: {subject}",
+            ""
+        ]
+        key_article = rng.randrange(articles_per_file)
+        for article in range(articles_per_file):
+            lines.append(f"Điều {article + 1}.")
+            if article == key_article:
+                lines.append(
+                    f"Cán bộ nhân viên {subject} {action} {value} {unit} theo quy định về {topic}."
+                )
+            lines.extend(rng.sample(FILLER, 3))
+            lines.append("")
+
+        with open(os.path.join(directory, filename), "w", encoding="utf-8") as f:
+            f.write("\n".join(lines))
+
+        queries.append({
+            "query": f"{subject} {action} bao nhiêu {unit} theo quy định về {topic}?",
+            "filename": filename,
+            "kind": "semantic"
+        })
+        queries.append({
+            "query": f"Quy định số {code} áp dụng cho ai?",
+            "filename": filename,
+            "kind": "code"
+        })
+
+    return queries
+
+
+if __name__ == "__main__":
+    import sys
+
+    output_dir = sys.argv[1] if len(sys.argv) > 1 else "./benchmark_corpus"
+    n_files = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    articles = int(sys.argv[3]) if len(sys.argv) > 3 else 12
+
+    # documents/ dùng được trực tiếp làm DOCUMENTS_PATH; queries.json để ngoài (không bị index)
+    documents_dir = os.path.join(output_dir, "documents")
+    queries = generate_corpus(documents_dir, n_files=n_files, articles_per_file=articles)
+    with open(os.path.join(output_dir, "queries.json"), "w", encoding="utf-8") as f:
+        json.dump(queries, f, ensure_ascii=False, indent=2)
+    print(f"Wrote {n_files} files to {documents_dir} and {len(queries)} queries to {output_dir}/queries.json")
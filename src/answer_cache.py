@@ -0,0 +1,129 @@
+"""
+Semantic Answer Cache - Cache câu trả lời theo độ tương đồng ngữ nghĩa của câu hỏi
+Câu hỏi mới gần giống (cosine >= threshold) câu hỏi đã trả lời thì dùng lại câu trả lời và nguồn
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+
+class SemanticAnswerCache:
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        threshold: float = 0.93,
+        max_size: int = 1000,
+        ttl_seconds: float = 86400
+    ):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+
+        self.hits = 0
+        self.misses = 0
+        # Câu trả lời tạo ra trước lần clear() gần nhất (index đã đổi trong lúc gọi LLM) không được lưu
+        self.stale_skipped = 0
+        # Tăng mỗi lần clear(); lấy trước khi retrieval và truyền vào store()
+        self.generation = 0
+
+        # key -> {"vector", "question", "answer", "sources", "created"}; thứ tự LRU
+        self._entries: "OrderedDict[int, Dict]" = OrderedDict()
+        self._next_key = 0
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: List[int] = []
+        self._lock = threading.Lock()
+
+    def _embed(self, question: str) -> np.ndarray:
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _evict_expired(self, now: float):
+        expired = [
+            key for key, entry in self._entries.items()
+            if now - entry["created"] > self.ttl_seconds
+        ]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+    def _get_matrix(self) -> Optional[np.ndarray]:
+        """Ma trận vectors của các câu hỏi đã cache (build lại khi cache thay đổi)"""
+        if self._matrix is None and self._entries:
+            self._matrix_keys = list(self._entries)
+            self._matrix = np.stack([self._entries[key]["vector"] for key in self._matrix_keys])
+        return self._matrix
+
+    def lookup(self, question: str) -> Optional[Dict]:
+        """Tìm câu trả lời đã cache cho câu hỏi tương tự, None nếu không có"""
+        vector = self._embed(question)
+
+        with self._lock:
+            self._evict_expired(time.monotonic())
+            matrix = self._get_matrix()
+            if matrix is None:
+                self.misses += 1
+                return None
+
+            similarities = matrix @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            key = self._matrix_keys[best]
+            entry = self._entries[key]
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return {
+                "answer": entry["answer"],
+                "sources": entry["sources"],
+                "cached_question": entry["question"],
+                "similarity": round(float(similarities[best]), 4)
+            }
+
+    def store(self, question: str, answer: str, sources: List[Dict], generation: Optional[int] = None):
+        """Lưu câu trả lời vào cache; bỏ qua nếu cache đã bị clear() sau generation (câu trả lời dựa trên index cũ)"""
+        vector = self._embed(question)
+
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                self.stale_skipped += 1
+                return
+            self._entries[self._next_key] = {
+                "vector": vector,
+                "question": question,
+                "answer": answer,
+                "sources": sources,
+                "created": time.monotonic()
+            }
+            self._next_key += 1
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def clear(self):
+        """Xóa toàn bộ cache (khi vector store thay đổi)"""
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+            self.generation += 1
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "size": len(self._entries),
+            "stale_skipped": self.stale_skipped
+        }
@@ -4,66 +4,270 @@ Hỗ trợ cả OpenAI API và local LLM (vLLM)
 """
 
 import os
-from typing import List, Dict, Optional
+import time
+import queue
+import asyncio
+import threading
+from contextlib import contextmanager
+from typing import AsyncIterator, Callable, List, Dict, Iterator, Optional
+from uuid import UUID
 from dotenv import load_dotenv
 
-from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
+from langchain.callbacks.base import AsyncCallbackHandler, BaseCallbackHandler
+from langchain.chains.conversational_retrieval.prompts import CONDENSE_QUESTION_PROMPT
 from langchain.prompts import PromptTemplate
 from langchain_community.chat_models import ChatOpenAI
-from langchain.schema import Document
+from langchain.schema import BaseMessage, Document, LLMResult
 
 from vector_store import VectorStore
-from document_processor import DocumentProcessor
+from document_processor import DocumentProcessor, IngestProgress
 from document_compare import DocumentCompare
+from index_manifest import IndexManifest
+from session_store import SessionStore, TokenWindowMemory
+from answer_cache import SemanticAnswerCache
+from reranker import Reranker, RerankingRetriever
+from context_builder import BudgetedConversationalRetrievalChain, ContextBuilder
+from condense import SkippableCondenseChain
+from llm_backend import LLMBackend, parse_base_urls
+from token_counter import count_tokens
+from ingest_jobs import IngestJobQueue, QueueFull
+from metrics import observe_stage, operation, record_tokens, span
 
 load_dotenv()
 
+# Tag cho bước viết lại câu hỏi (condense question) - tokens của bước này không được stream
+CONDENSE_QUESTION_TAG = "condense_question"
+
+NOT_INITIALIZED_ANSWER = "Vector store chưa được khởi tạo. Vui lòng thêm tài liệu vào thư mục documents."
+
+
+class _AnswerStreamHandler(BaseCallbackHandler):
+    """Đẩy tokens của câu trả lời vào queue để stream cho client"""
+    
+    def __init__(self):
+        self.queue: "queue.Queue[Optional[str]]" = queue.Queue()
+    
+    def on_llm_new_token(self, token: str, *, tags: Optional[List[str]] = None, **kwargs):
+        if token and CONDENSE_QUESTION_TAG not in (tags or []):
+            self.queue.put(token)
+
+
+class _AsyncAnswerStreamHandler(AsyncCallbackHandler):
+    """Bản async của _AnswerStreamHandler - dùng asyncio.Queue"""
+    
+    def __init__(self):
+        self.queue: "asyncio.Queue[Optional[str]]" = asyncio.Queue()
+    
+    async def on_llm_new_token(self, token: str, *, tags: Optional[List[str]] = None, **kwargs):
+        if token and CONDENSE_QUESTION_TAG not in (tags or []):
+            self.queue.put_nowait(token)
+
+
+class _RequestMetrics(BaseCallbackHandler):
+    """
+    Metrics của 1 request: thời gian retrieval / condense / LLM (time to first token, tổng),
+    số token prompt và câu trả lời của LLM trả lời, có gọi LLM condense question không
+    """
+    
+    def __init__(self):
+        self.prompt_tokens: Optional[int] = None
+        self.completion_tokens: Optional[int] = None
+        self.condensed = False
+        # run_id -> (stage, thời điểm bắt đầu)
+        self._runs: Dict[UUID, tuple] = {}
+        self._first_token_seen = set()
+    
+    def on_chat_model_start(
+        self, serialized: Dict, messages: List[List[BaseMessage]], *, run_id: UUID,
+        tags: Optional[List[str]] = None, **kwargs
+    ):
+        if CONDENSE_QUESTION_TAG in (tags or []):
+            self.condensed = True
+            self._runs[run_id] = ("condense_llm", time.perf_counter())
+        else:
+            self.prompt_tokens = sum(count_tokens(message.content) for batch in messages for message in batch)
+            self._runs[run_id] = ("llm", time.perf_counter())
+    
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs):
+        run = self._runs.get(run_id)
+        if run and run[0] == "llm" and run_id not in self._first_token_seen:
+            self._first_token_seen.add(run_id)
+            observe_stage("llm_first_token", time.perf_counter() - run[1])
+    
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs):
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        observe_stage(run[0], time.perf_counter() - run[1])
+        if run[0] == "llm":
+            self.completion_tokens = sum(
+                count_tokens(generation.text) for generations in response.generations for generation in generations
+            )
+            record_tokens(self.prompt_tokens, self.completion_tokens)
+    
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        run = self._runs.pop(run_id, None)
+        if run is not None:
+            observe_stage(run[0], time.perf_counter() - run[1])
+    
+    def on_retriever_start(
+        self, serialized: Dict, query: str, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs
+    ):
+        # Retriever lồng nhau (base retriever của RerankingRetriever) đã nằm trong retrieval span ngoài
+        if parent_run_id not in self._runs:
+            self._runs[run_id] = ("retrieval", time.perf_counter())
+    
+    def on_retriever_end(self, documents, *, run_id: UUID, **kwargs):
+        run = self._runs.pop(run_id, None)
+        if run is not None:
+            observe_stage(run[0], time.perf_counter() - run[1])
+    
+    on_retriever_error = on_llm_error
+
 
 class MEChatbot:
     def __init__(
         self, 
         documents_path: str = "./documents",
         vector_db_path: str = "./vector_db",
-        use_local_llm: bool = False
+        use_local_llm: bool = False,
+        startup_timings: Optional[Dict[str, float]] = None
     ):
         self.documents_path = documents_path
         self.vector_db_path = vector_db_path
+        # Thời gian (giây) từng phase khởi tạo
+        self.startup_timings = startup_timings if startup_timings is not None else {}
+        
+        # Ingestion settings
+        self.ingest_workers = int(os.getenv("INGEST_WORKERS", 1))
+        self.ingest_file_timeout = float(os.getenv("INGEST_FILE_TIMEOUT", 120))
+        # Chỉ 1 thao tác ghi index (upload, rebuild) tại một thời điểm
+        self._index_lock = threading.RLock()
+        # Upload được index trong background, request trả về job ID ngay
+        self.ingest_jobs = IngestJobQueue(
+            self.add_document,
+            workers=int(os.getenv("INGEST_JOB_WORKERS", 2)),
+            max_pending=int(os.getenv("INGEST_QUEUE_MAX", 1000)),
+            max_history=int(os.getenv("INGEST_JOB_HISTORY", 1000))
+        )
         
         # Initialize components
         self.document_processor = DocumentProcessor()
-        self.vector_store = VectorStore(persist_directory=vector_db_path)
+        with self._startup_phase("embedding_model"):
+            self.vector_store = VectorStore(persist_directory=vector_db_path)
+        self.manifest = IndexManifest(persist_directory=vector_db_path)
         self.document_compare = DocumentCompare()
         
-        # Initialize LLM
-        self.llm = self._initialize_llm(use_local_llm)
+        # Initialize LLM (LLM riêng có tag cho bước condense question để không stream tokens của bước này)
+        with self._startup_phase("llm"):
+            self.llm_backend = self._initialize_llm_backend(use_local_llm)
+            self.condense_backend = None
+            self.llm = self._initialize_llm(use_local_llm)
+            self.condense_llm = self._initialize_condense_llm(use_local_llm)
         
-        # Memory for conversation
-        self.memory = ConversationBufferMemory(
-            memory_key="chat_history",
-            return_messages=True,
-            output_key="answer"
+        # Viết lại câu hỏi tiếp theo thành câu đầy đủ - bỏ qua LLM call khi câu hỏi đã đủ nghĩa
+        self.question_generator = SkippableCondenseChain(
+            llm=self.condense_llm,
+            prompt=CONDENSE_QUESTION_PROMPT,
+            enabled=os.getenv("CONDENSE_HEURISTIC", "true").lower() == "true",
+            min_words=int(os.getenv("CONDENSE_MIN_WORDS", 4))
+        )
+        
+        # Memory riêng cho từng conversation, giới hạn theo token budget
+        self.sessions = SessionStore(
+            memory_factory=self._create_memory,
+            max_sessions=int(os.getenv("CONVERSATION_MAX_SESSIONS", 1000)),
+            ttl_seconds=float(os.getenv("CONVERSATION_TTL_SECONDS", 3600))
+        )
+        
+        # Cache câu trả lời cho câu hỏi lặp lại (dùng chung embedding model với vector store)
+        self.answer_cache = None
+        if os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true":
+            self.answer_cache = SemanticAnswerCache(
+                self.vector_store.embeddings,
+                threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.93)),
+                max_size=int(os.getenv("ANSWER_CACHE_MAX_SIZE", 1000)),
+                ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL_SECONDS", 86400))
+            )
+        
+        # Xếp chunks + lịch sử vào prompt theo token budget
+        self.context_candidates = int(os.getenv("CONTEXT_CANDIDATES", 6))
+        self.context_builder = ContextBuilder(
+            max_prompt_tokens=self._prompt_budget(),
+            max_history_tokens=int(os.getenv("PROMPT_HISTORY_MAX_TOKENS", 600)),
+            dedupe_threshold=float(os.getenv("CONTEXT_DEDUPE_THRESHOLD", 0.8))
         )
         
+        # Cross-encoder rerank top-N ứng viên trước khi đưa vào prompt (tùy chọn)
+        self.reranker = None
+        self.rerank_candidates = int(os.getenv("RERANK_CANDIDATES", 20))
+        if os.getenv("RERANK_ENABLED", "false").lower() == "true":
+            with self._startup_phase("reranker"):
+                self.reranker = self._initialize_reranker()
+        
         # Initialize or load vector store
-        self._setup_vector_store()
+        with self._startup_phase("vector_store"):
+            self._setup_vector_store()
         
         # Create QA chain
-        self.qa_chain = self._create_qa_chain()
+        self.qa_chain = None
+        with self._startup_phase("qa_chain"):
+            self._refresh_qa_chain()
+        
+        if self.vector_store.wal is not None:
+            self._start_checkpointer()
+    
+    @staticmethod
+    def _prompt_budget() -> int:
+        """
+        Token budget cho prompt: context của model (vLLM --max-model-len) trừ MAX_TOKENS của câu trả lời
+        và phần dự phòng cho chat template/sai khác tokenizer; PROMPT_MAX_TOKENS (nếu đặt) chỉ giảm thêm
+        """
+        budget = (
+            int(os.getenv("MODEL_CONTEXT_LENGTH", 4096))
+            - int(os.getenv("MAX_TOKENS", 2048))
+            - int(os.getenv("PROMPT_RESERVED_TOKENS", 128))
+        )
+        if os.getenv("PROMPT_MAX_TOKENS"):
+            budget = min(budget, int(os.getenv("PROMPT_MAX_TOKENS")))
+        if budget < int(os.getenv("PROMPT_HISTORY_MAX_TOKENS", 600)) + 500:
+            print(f"Warning: prompt budget is only {budget} tokens - increase MODEL_CONTEXT_LENGTH or lower MAX_TOKENS")
+        return budget
+    
+    @contextmanager
+    def _startup_phase(self, name: str):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.startup_timings[name] = round(time.time() - start, 3)
+            print(f"Startup phase '{name}': {self.startup_timings[name]:.2f}s")
+    
+    def _initialize_llm_backend(self, use_local: bool = False) -> LLMBackend:
+        """Client dùng chung cho các LLM: connection pool, chia tải nhiều endpoint, retry, circuit breaker"""
+        if use_local:
+            # Nhiều vLLM server: LLM_API_BASES=http://gpu1:8000/v1,http://gpu2:8000/v1
+            base_urls = os.getenv("LLM_API_BASES") or os.getenv("LLM_API_BASE", "http://localhost:8000/v1")
+            return LLMBackend.from_env(parse_base_urls(base_urls), api_key="EMPTY")  # vLLM không cần API key
+        
+        base_urls = os.getenv("OPENAI_API_BASE") or "https://api.openai.com/v1"
+        return LLMBackend.from_env(parse_base_urls(base_urls), api_key=os.getenv("OPENAI_API_KEY") or "EMPTY")
     
-    def _initialize_llm(self, use_local: bool = False):
+    def _initialize_llm(self, use_local: bool = False, tags: Optional[List[str]] = None):
         """Initialize LLM - OpenAI hoặc local vLLM"""
         if use_local:
             # Sử dụng local LLM endpoint (vLLM)
-            base_url = os.getenv("LLM_API_BASE", "http://localhost:8000/v1")
             model_name = os.getenv("LLM_MODEL_NAME", "Qwen3-14B-AWQ")
             
             return ChatOpenAI(
                 model_name=model_name,
-                openai_api_base=base_url,
                 openai_api_key="EMPTY",  # vLLM không cần API key
                 temperature=float(os.getenv("TEMPERATURE", 0.7)),
-                max_tokens=int(os.getenv("MAX_TOKENS", 2048))
+                max_tokens=int(os.getenv("MAX_TOKENS", 2048)),
+                streaming=True,
+                tags=tags,
+                client=self.llm_backend.completions,
+                async_client=self.llm_backend.async_completions
             )
         else:
             # Sử dụng OpenAI API
@@ -71,31 +275,217 @@ class MEChatbot:
                 model_name="gpt-3.5-turbo",
                 temperature=float(os.getenv("TEMPERATURE", 0.7)),
                 max_tokens=int(os.getenv("MAX_TOKENS", 2048)),
-                openai_api_key=os.getenv("OPENAI_API_KEY")
+                openai_api_key=os.getenv("OPENAI_API_KEY"),
+                streaming=True,
+                tags=tags,
+                client=self.llm_backend.completions,
+                async_client=self.llm_backend.async_completions
             )
     
+    def _initialize_condense_llm(self, use_local: bool = False):
+        """LLM cho bước condense question - endpoint/model nhỏ hơn nếu cấu hình CONDENSE_LLM_API_BASE"""
+        base_url = os.getenv("CONDENSE_LLM_API_BASE")
+        if not base_url:
+            return self._initialize_llm(use_local, tags=[CONDENSE_QUESTION_TAG])
+        
+        api_key = os.getenv("CONDENSE_LLM_API_KEY", "EMPTY")
+        self.condense_backend = LLMBackend.from_env(parse_base_urls(base_url), api_key=api_key)
+        
+        # Câu hỏi viết lại ngắn và cần ổn định: giới hạn max_tokens, temperature 0
+        return ChatOpenAI(
+            model_name=os.getenv("CONDENSE_LLM_MODEL_NAME", os.getenv("LLM_MODEL_NAME", "Qwen3-14B-AWQ")),
+            openai_api_key=api_key,
+            temperature=0,
+            max_tokens=int(os.getenv("CONDENSE_MAX_TOKENS", 256)),
+            streaming=True,
+            tags=[CONDENSE_QUESTION_TAG],
+            client=self.condense_backend.completions,
+            async_client=self.condense_backend.async_completions
+        )
+    
+    def _initialize_reranker(self) -> Optional[Reranker]:
+        """Load cross-encoder; lỗi (thiếu model/thư viện) thì chạy không rerank"""
+        try:
+            return Reranker(
+                model_name=os.getenv("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"),
+                batch_size=int(os.getenv("RERANK_BATCH_SIZE", 16)),
+                time_budget_ms=float(os.getenv("RERANK_TIME_BUDGET_MS", 300))
+            )
+        except Exception as e:
+            print(f"Reranker not available, using retriever order: {e}")
+            return None
+    
+    def _create_memory(self) -> TokenWindowMemory:
+        """Memory cho 1 conversation - chỉ giữ các lượt gần nhất trong HISTORY_MAX_TOKENS"""
+        return TokenWindowMemory(
+            max_token_limit=int(os.getenv("HISTORY_MAX_TOKENS", 1000)),
+            memory_key="chat_history",
+            return_messages=True,
+            input_key="question",
+            output_key="answer"
+        )
+    
     def _setup_vector_store(self):
         """Setup hoặc load vector store"""
         if not self.vector_store.load():
             print("Creating new vector store from documents...")
-            self.rebuild_vector_store()
+            self.rebuild_vector_store(full=True)
+        elif not self.manifest.load():
+            # Index có sẵn nhưng không có manifest (index cũ): không biết chunks thuộc file nào,
+            # rebuild toàn bộ trước khi upload/incremental rebuild ghi manifest thiếu và index trùng các file còn lại
+            print("Vector store has no manifest, rebuilding from documents...")
+            self.rebuild_vector_store(full=True)
+        else:
+            # Upload được replay từ WAL: cập nhật manifest tương ứng rồi gộp vào index chính
+            for info in self.vector_store.replayed_updates:
+                if info.get("file"):
+                    self.manifest.set(info["file"], info["hash"], info["ids"])
+            if self.vector_store.replayed_updates:
+                self._checkpoint()
+    
+    def _refresh_qa_chain(self):
+        """Tạo lại QA chain khi vector store được tạo mới"""
+        if self.vector_store.vectorstore is not None:
+            self.qa_chain = self._create_qa_chain()
+    
+    def _list_document_files(self) -> Dict[str, str]:
+        """Liệt kê files trong documents folder kèm hash nội dung"""
+        return {
+            file_path: IndexManifest.file_hash(file_path)
+            for file_path in DocumentProcessor.list_files(self.documents_path)
+        }
+    
+    def _iter_file_chunks(self, file_hashes: Dict[str, str], progress: IngestProgress, indexed: Dict[str, tuple]):
+        """
+        Load, split files (song song nếu INGEST_WORKERS > 1), gán chunk IDs theo manifest
+        Yield (chunk, chunk_id) để vector store embed theo từng batch; indexed[file_path] = (hash, ids)
+        """
+        results = self.document_processor.iter_process_files(
+            list(file_hashes),
+            workers=self.ingest_workers,
+            file_timeout=self.ingest_file_timeout
+        )
+        for file_path, chunks in results:
+            progress.file_done()
+            if chunks is None:
+                # Timeout - không ghi vào manifest để lần rebuild sau thử lại
+                continue
+            
+            content_hash = file_hashes[file_path]
+            ids = IndexManifest.chunk_ids(file_path, content_hash, len(chunks))
+            indexed[file_path] = (content_hash, ids)
+            print(f"Processed: {os.path.basename(file_path)} -> {len(chunks)} chunks")
+            
+            yield from zip(chunks, ids)
+    
+    @span("index_files")
+    def _index_files(self, file_hashes: Dict[str, str], store: Optional[VectorStore] = None) -> Dict:
+        """
+        Stream load -> split -> embed theo batch -> add vào index (mặc định self.vector_store), trả về thống kê tiến độ
+        Manifest chỉ được cập nhật khi toàn bộ chunks đã nằm trong index
+        """
+        store = store or self.vector_store
+        progress = IngestProgress(total_files=len(file_hashes))
+        indexed: Dict[str, tuple] = {}
+        try:
+            store.add_documents_stream(
+                self._iter_file_chunks(file_hashes, progress, indexed),
+                on_batch=progress.chunks_added
+            )
+        except Exception:
+            # Bỏ chunks đã add của các file chưa ghi vào manifest - lần rebuild sau index lại từ đầu
+            store.delete([chunk_id for _, ids in indexed.values() for chunk_id in ids])
+            raise
+        
+        for file_path, (content_hash, ids) in indexed.items():
+            self.manifest.set(file_path, content_hash, ids)
+        return progress.as_dict()
+    
+    @operation("rebuild")
+    def rebuild_vector_store(self, full: bool = False) -> Dict:
+        """
+        Rebuild vector store từ documents folder
+        Mặc định chỉ re-embed file mới/thay đổi và xóa vectors của file đã bị xóa (dựa vào manifest).
+        full=True hoặc chưa có manifest: rebuild toàn bộ
+        """
+        with self._index_lock:
+            return self._rebuild_vector_store(full)
     
-    def rebuild_vector_store(self):
-        """Rebuild vector store từ documents folder"""
+    def _rebuild_vector_store(self, full: bool) -> Dict:
         if not os.path.exists(self.documents_path):
             os.makedirs(self.documents_path)
             print(f"Created documents directory: {self.documents_path}")
             print("Please add documents to this directory and run again.")
-            return
+            return {"mode": "none", "added": 0, "modified": 0, "deleted": 0, "chunks": 0}
         
-        chunks = self.document_processor.process_directory(self.documents_path)
+        current = self._list_document_files()
+        full = full or self.vector_store.vectorstore is None or not self.manifest.exists()
         
-        if chunks:
-            self.vector_store.create_vectorstore(chunks)
+        if full:
+            # Build index mới bên cạnh index hiện tại (vẫn phục vụ chat/search), chỉ thay vào khi thành công;
+            # lỗi hoặc không có chunk nào: giữ index và manifest cũ
+            staged = self.vector_store.staging()
+            previous_files = dict(self.manifest.files)
+            self.manifest.clear()
+            try:
+                progress = self._index_files(current, store=staged)
+                staged.build_index()
+            except Exception:
+                self.manifest.files = previous_files
+                raise
+            
+            total = progress["chunks"]
+            if not total:
+                self.manifest.files = previous_files
+                print("No documents found to process")
+                return {"mode": "full", "added": len(current), "modified": 0, "deleted": 0, "chunks": 0}
+            
+            self.vector_store.swap(staged)
             self.vector_store.save()
-            print(f"Vector store created with {len(chunks)} chunks")
-        else:
-            print("No documents found to process")
+            self.manifest.save()
+            self._refresh_qa_chain()
+            self._invalidate_answer_cache()
+            print(f"Vector store created with {total} chunks")
+            return {
+                "mode": "full",
+                "added": len(current),
+                "modified": 0,
+                "deleted": 0,
+                "chunks": total,
+                "progress": progress,
+                "embedding_cache": self.vector_store.embedding_cache_stats()
+            }
+        
+        added, modified, deleted = self.manifest.diff(current)
+        
+        # Xóa vectors cũ của file bị sửa/xóa
+        stale_ids = []
+        for file_path in modified + deleted:
+            stale_ids.extend(self.manifest.remove(file_path))
+        self.vector_store.delete(stale_ids)
+        
+        changed = {path: current[path] for path in added + modified}
+        progress = self._index_files(changed)
+        total = progress["chunks"]
+        
+        if stale_ids or changed:
+            self.vector_store.save()
+            self.manifest.save()
+            self._invalidate_answer_cache()
+        
+        print(
+            f"Incremental rebuild: {len(added)} added, {len(modified)} modified, "
+            f"{len(deleted)} deleted, {total} chunks embedded"
+        )
+        return {
+            "mode": "incremental",
+            "added": len(added),
+            "modified": len(modified),
+            "deleted": len(deleted),
+            "chunks": total,
+            "progress": progress,
+            "embedding_cache": self.vector_store.embedding_cache_stats()
+        }
     
     def _create_qa_chain(self):
         """Tạo Conversational Retrieval Chain"""
@@ -125,48 +515,295 @@ Trả lời:"""
             template=prompt_template,
             input_variables=["context", "chat_history", "question"]
         )
+        self.context_builder.template_tokens = count_tokens(
+            PROMPT.format(context="", chat_history="", question="")
+        )
         
-        # Create chain
-        chain = ConversationalRetrievalChain.from_llm(
+        # Có reranker: lấy nhiều ứng viên rồi chỉ giữ các chunks tốt nhất
+        if self.reranker is not None:
+            retriever = RerankingRetriever(
+                base_retriever=self.vector_store.get_retriever(k=self.rerank_candidates),
+                reranker=self.reranker,
+                k=self.context_candidates
+            )
+        else:
+            retriever = self.vector_store.get_retriever(k=self.context_candidates)
+        
+        # Create chain - chunks và lịch sử được cắt theo token budget trước khi vào prompt
+        chain = BudgetedConversationalRetrievalChain.from_llm(
             llm=self.llm,
-            retriever=self.vector_store.get_retriever(k=4),
-            memory=self.memory,
+            retriever=retriever,
+            condense_question_llm=self.condense_llm,
             return_source_documents=True,
             combine_docs_chain_kwargs={"prompt": PROMPT},
+            get_chat_history=self.context_builder.format_history,
+            context_builder=self.context_builder,
             verbose=False
         )
+        chain.question_generator = self.question_generator
         
         return chain
     
-    def chat(self, question: str) -> Dict:
+    @staticmethod
+    @span("format_sources")
+    def _format_sources(documents: List[Document]) -> List[Dict]:
+        """Format source documents để trả về cho client"""
+        sources = []
+        for doc in documents:
+            sources.append({
+                "filename": doc.metadata.get("filename", "Unknown"),
+                "content": doc.page_content[:200] + "...",
+                "source": doc.metadata.get("source", "")
+            })
+        return sources
+    
+    def _invalidate_answer_cache(self):
+        """Câu trả lời đã cache không còn đúng khi tài liệu thay đổi"""
+        if self.answer_cache is not None:
+            self.answer_cache.clear()
+    
+    @span("answer_cache_lookup")
+    def _lookup_cached_answer(self, question: str, chat_history: List) -> Optional[Dict]:
+        """
+        Tìm câu trả lời đã cache - chỉ áp dụng cho câu hỏi đầu hội thoại,
+        câu hỏi tiếp theo phụ thuộc ngữ cảnh nên luôn đi qua chain
+        """
+        if self.answer_cache is None or chat_history:
+            return None
+        return self.answer_cache.lookup(question)
+    
+    def _answer_cache_generation(self) -> Optional[int]:
+        """Generation của answer cache - lấy trước retrieval, để không cache câu trả lời dựa trên index đã thay đổi"""
+        return self.answer_cache.generation if self.answer_cache is not None else None
+    
+    def _cache_answer(
+        self, question: str, chat_history: List, answer: str, sources: List[Dict], generation: Optional[int]
+    ):
+        if self.answer_cache is not None and not chat_history:
+            self.answer_cache.store(question, answer, sources, generation=generation)
+    
+    def chat(self, question: str, conversation_id: str = "default") -> Dict:
         """Chat với bot - tìm kiếm tài liệu và trả lời"""
-        try:
-            if self.qa_chain is None:
+        with operation("chat") as op:
+            try:
+                if self.qa_chain is None:
+                    return {
+                        "answer": NOT_INITIALIZED_ANSWER,
+                        "sources": []
+                    }
+                
+                chat_history = self.sessions.history(conversation_id)
+                generation = self._answer_cache_generation()
+                cached = self._lookup_cached_answer(question, chat_history)
+                if cached:
+                    op["outcome"] = "cached"
+                    self.sessions.save(conversation_id, question, cached["answer"])
+                    return {
+                        "answer": cached["answer"],
+                        "sources": cached["sources"],
+                        "cached": True
+                    }
+                
+                counter = _RequestMetrics()
+                result = self.qa_chain({
+                    "question": question,
+                    "chat_history": chat_history
+                }, callbacks=[counter])
+                sources = self._format_sources(result.get("source_documents", []))
+                self.sessions.save(conversation_id, question, result["answer"])
+                self._cache_answer(question, chat_history, result["answer"], sources, generation)
+                
+                return {
+                    "answer": result["answer"],
+                    "sources": sources,
+                    "prompt_tokens": counter.prompt_tokens,
+                    "completion_tokens": counter.completion_tokens,
+                    "condensed": counter.condensed
+                }
+            
+            except Exception as e:
+                op["outcome"] = "error"
                 return {
-                    "answer": "Vector store chưa được khởi tạo. Vui lòng thêm tài liệu vào thư mục documents.",
+                    "answer": f"Xin lỗi, đã có lỗi xảy ra: {str(e)}",
                     "sources": []
                 }
+    
+    def chat_stream(self, question: str, conversation_id: str = "default") -> Iterator[Dict]:
+        """
+        Chat với bot, stream câu trả lời theo từng token
+        Yield events: {"type": "token", "content"}, sau đó {"type": "sources", "sources"}
+        và cuối cùng {"type": "done", "answer"} hoặc {"type": "error", "error"}
+        """
+        with operation("chat_stream") as op:
+            if self.qa_chain is None:
+                yield {"type": "token", "content": NOT_INITIALIZED_ANSWER}
+                yield {"type": "sources", "sources": []}
+                yield {"type": "done", "answer": NOT_INITIALIZED_ANSWER}
+                return
             
-            result = self.qa_chain({"question": question})
+            chat_history = self.sessions.history(conversation_id)
+            generation = self._answer_cache_generation()
+            cached = self._lookup_cached_answer(question, chat_history)
+            if cached:
+                op["outcome"] = "cached"
+                self.sessions.save(conversation_id, question, cached["answer"])
+                yield {"type": "token", "content": cached["answer"]}
+                yield {"type": "sources", "sources": cached["sources"]}
+                yield {"type": "done", "answer": cached["answer"], "cached": True}
+                return
             
-            # Format sources
-            sources = []
-            for doc in result.get("source_documents", []):
-                sources.append({
-                    "filename": doc.metadata.get("filename", "Unknown"),
-                    "content": doc.page_content[:200] + "...",
-                    "source": doc.metadata.get("source", "")
-                })
+            handler = _AnswerStreamHandler()
+            counter = _RequestMetrics()
+            result = {}
             
-            return {
+            def run_chain():
+                try:
+                    result.update(self.qa_chain(
+                        {"question": question, "chat_history": chat_history},
+                        callbacks=[handler, counter]
+                    ))
+                except Exception as e:
+                    result["error"] = e
+                finally:
+                    handler.queue.put(None)
+            
+            worker = threading.Thread(target=run_chain, daemon=True)
+            worker.start()
+            
+            while True:
+                token = handler.queue.get()
+                if token is None:
+                    break
+                yield {"type": "token", "content": token}
+            worker.join()
+            
+            if "error" in result:
+                op["outcome"] = "error"
+                yield {"type": "error", "error": f"Xin lỗi, đã có lỗi xảy ra: {str(result['error'])}"}
+                return
+            
+            sources = self._format_sources(result.get("source_documents", []))
+            self.sessions.save(conversation_id, question, result["answer"])
+            self._cache_answer(question, chat_history, result["answer"], sources, generation)
+            
+            yield {"type": "sources", "sources": sources}
+            yield {
+                "type": "done",
                 "answer": result["answer"],
-                "sources": sources
+                "prompt_tokens": counter.prompt_tokens,
+                "completion_tokens": counter.completion_tokens,
+                "condensed": counter.condensed
             }
-        
-        except Exception as e:
-            return {
-                "answer": f"Xin lỗi, đã có lỗi xảy ra: {str(e)}",
-                "sources": []
+    
+    async def achat(self, question: str, conversation_id: str = "default") -> Dict:
+        """Bản async của chat - dùng async LLM và retriever, không giữ state dùng chung giữa requests"""
+        with operation("chat") as op:
+            try:
+                if self.qa_chain is None:
+                    return {
+                        "answer": NOT_INITIALIZED_ANSWER,
+                        "sources": []
+                    }
+                
+                loop = asyncio.get_running_loop()
+                chat_history = self.sessions.history(conversation_id)
+                generation = self._answer_cache_generation()
+                cached = await loop.run_in_executor(None, self._lookup_cached_answer, question, chat_history)
+                if cached:
+                    op["outcome"] = "cached"
+                    self.sessions.save(conversation_id, question, cached["answer"])
+                    return {
+                        "answer": cached["answer"],
+                        "sources": cached["sources"],
+                        "cached": True
+                    }
+                
+                counter = _RequestMetrics()
+                result = await self.qa_chain.acall({
+                    "question": question,
+                    "chat_history": chat_history
+                }, callbacks=[counter])
+                sources = self._format_sources(result.get("source_documents", []))
+                self.sessions.save(conversation_id, question, result["answer"])
+                await loop.run_in_executor(
+                    None, self._cache_answer, question, chat_history, result["answer"], sources, generation
+                )
+                
+                return {
+                    "answer": result["answer"],
+                    "sources": sources,
+                    "prompt_tokens": counter.prompt_tokens,
+                    "completion_tokens": counter.completion_tokens,
+                    "condensed": counter.condensed
+                }
+            
+            except Exception as e:
+                op["outcome"] = "error"
+                return {
+                    "answer": f"Xin lỗi, đã có lỗi xảy ra: {str(e)}",
+                    "sources": []
+                }
+    
+    async def achat_stream(self, question: str, conversation_id: str = "default") -> AsyncIterator[Dict]:
+        """Bản async của chat_stream - cùng format events"""
+        with operation("chat_stream") as op:
+            if self.qa_chain is None:
+                yield {"type": "token", "content": NOT_INITIALIZED_ANSWER}
+                yield {"type": "sources", "sources": []}
+                yield {"type": "done", "answer": NOT_INITIALIZED_ANSWER}
+                return
+            
+            loop = asyncio.get_running_loop()
+            chat_history = self.sessions.history(conversation_id)
+            generation = self._answer_cache_generation()
+            cached = await loop.run_in_executor(None, self._lookup_cached_answer, question, chat_history)
+            if cached:
+                op["outcome"] = "cached"
+                self.sessions.save(conversation_id, question, cached["answer"])
+                yield {"type": "token", "content": cached["answer"]}
+                yield {"type": "sources", "sources": cached["sources"]}
+                yield {"type": "done", "answer": cached["answer"], "cached": True}
+                return
+            
+            handler = _AsyncAnswerStreamHandler()
+            counter = _RequestMetrics()
+            task = asyncio.ensure_future(self.qa_chain.acall(
+                {"question": question, "chat_history": chat_history},
+                callbacks=[handler, counter]
+            ))
+            task.add_done_callback(lambda _: handler.queue.put_nowait(None))
+            
+            try:
+                while True:
+                    token = await handler.queue.get()
+                    if token is None:
+                        break
+                    yield {"type": "token", "content": token}
+                
+                try:
+                    result = await task
+                except Exception as e:
+                    op["outcome"] = "error"
+                    yield {"type": "error", "error": f"Xin lỗi, đã có lỗi xảy ra: {str(e)}"}
+                    return
+            finally:
+                # Client ngắt kết nối -> hủy LLM call đang chạy
+                if not task.done():
+                    task.cancel()
+            
+            sources = self._format_sources(result.get("source_documents", []))
+            self.sessions.save(conversation_id, question, result["answer"])
+            await loop.run_in_executor(
+                None, self._cache_answer, question, chat_history, result["answer"], sources, generation
+            )
+            
+            yield {"type": "sources", "sources": sources}
+            yield {
+                "type": "done",
+                "answer": result["answer"],
+                "prompt_tokens": counter.prompt_tokens,
+                "completion_tokens": counter.completion_tokens,
+                "condensed": counter.condensed
             }
     
     def compare_documents(self, file1: str, file2: str) -> Dict:
@@ -178,21 +815,142 @@ Trả lời:"""
                 "error": f"Error comparing documents: {str(e)}"
             }
     
+    @operation("search")
     def search_documents(self, query: str, k: int = 4) -> List[Document]:
         """Tìm kiếm documents"""
-        return self.vector_store.similarity_search(query, k=k)
+        return self.vector_store.hybrid_search(query, k=k)
     
-    def add_document(self, file_path: str):
-        """Thêm document mới vào vector store"""
-        chunks = self.document_processor.process_document(file_path)
-        if chunks:
-            self.vector_store.add_documents(chunks)
-            self.vector_store.save()
-            print(f"Added {len(chunks)} chunks from {file_path}")
+    @operation("search_batch")
+    def search_documents_batch(self, queries: List[str], k: int = 4) -> List[List[tuple]]:
+        """
+        Tìm kiếm nhiều query trong 1 lần embed + 1 lần search FAISS, cùng đường retrieval (hybrid) với search_documents.
+        Trả về (document, L2 distance) theo từng query; distance None với chunk chỉ BM25 tìm thấy
+        """
+        return self.vector_store.batch_hybrid_search(queries, k=k)
+    
+    @operation("add_document")
+    def add_document(self, file_path: str, on_stage: Optional[Callable[[str], None]] = None) -> Dict:
+        """
+        Thêm document mới vào vector store (thay thế chunks cũ nếu file đã được index)
+        on_stage(stage) báo bước đang chạy: parsing -> indexing -> saving (dùng cho trạng thái upload job)
+        """
+        on_stage = on_stage or (lambda stage: None)
+        content_hash = IndexManifest.file_hash(file_path)
+        entry = self.manifest.get(file_path)
+        
+        if entry and entry["hash"] == content_hash:
+            print(f"Unchanged, skipped: {file_path}")
+            return {"chunks": 0, "unchanged": True}
+        
+        # Parse/split ngoài lock - các upload khác vẫn parse song song
+        on_stage("parsing")
+        with span("process_document"):
+            chunks = self.document_processor.process_document(file_path)
+        
+        on_stage("indexing")
+        with self._index_lock:
+            # Manifest có thể đã đổi trong lúc parse (upload cùng file, rebuild)
+            entry = self.manifest.get(file_path)
+            if entry and entry["hash"] == content_hash:
+                return {"chunks": 0, "unchanged": True}
+            
+            ids = IndexManifest.chunk_ids(file_path, content_hash, len(chunks))
+            if chunks or entry:
+                # Ghi vào WAL (nếu bật) rồi cập nhật index trong bộ nhớ
+                self.vector_store.upsert(
+                    chunks,
+                    ids,
+                    delete_ids=entry["ids"] if entry else None,
+                    info={"file": file_path, "hash": content_hash, "ids": ids}
+                )
+            self.manifest.set(file_path, content_hash, ids)
+            
+            if chunks or entry:
+                # Không có WAL: ghi lại toàn bộ index mỗi upload; có WAL: chỉ khi WAL đủ lớn hoặc đủ cũ
+                if self.vector_store.wal is None or self.vector_store.wal_due():
+                    on_stage("saving")
+                    self._checkpoint()
+                self._invalidate_answer_cache()
+                if self.qa_chain is None:
+                    self._refresh_qa_chain()
+                print(f"Added {len(chunks)} chunks from {file_path}")
+        
+        return {"chunks": len(chunks), "unchanged": False}
+    
+    @span("index_checkpoint")
+    def _checkpoint(self):
+        """
+        Gộp WAL vào index chính: ghi manifest, ghi lại index (file tạm + rename) rồi xóa WAL
+        Crash giữa chừng: WAL vẫn còn và được replay khi khởi động
+        """
+        self.manifest.save()
+        self.vector_store.save()
+    
+    def _start_checkpointer(self):
+        """Checkpoint WAL theo thời gian cả khi không có upload mới"""
+        interval = min(max(self.vector_store.wal_checkpoint_seconds / 4, 1.0), 60.0)
+        
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    with self._index_lock:
+                        if self.vector_store.wal_due():
+                            self._checkpoint()
+                except Exception as e:
+                    print(f"Error checkpointing index: {e}")
+        
+        threading.Thread(target=run, name="index-checkpoint", daemon=True).start()
+    
+    def submit_document(self, file_path: str, filename: Optional[str] = None, remove_on_reject: bool = False) -> Dict:
+        """
+        Đưa file vào hàng đợi index background, trả về trạng thái job (job_id, state...)
+        remove_on_reject: hàng đợi đầy thì xóa file (upload mới) để lần rebuild sau không index file đã bị từ chối
+        """
+        try:
+            return self.ingest_jobs.submit(file_path, filename or os.path.basename(file_path))
+        except QueueFull:
+            if remove_on_reject and os.path.exists(file_path):
+                os.remove(file_path)
+            raise
+    
+    def cache_stats(self) -> Dict:
+        """
+        Thống kê cache và các thành phần pipeline:
+        - Embedding: cache trên disk, query cache (LRU), batcher
+        - Hội thoại: answer cache, sessions
+        - Retrieval: reranker, context packing, condense question
+        - LLM: endpoints chính và condense
+        - Index: upload jobs, write-ahead log
+        """
+        return {
+            "embedding_cache": self.vector_store.embedding_cache_stats(),
+            "query_cache": self.vector_store.query_cache_stats(),
+            "embedding_batcher": self.vector_store.embedding_batcher_stats(),
+            "answer_cache": self.answer_cache.stats() if self.answer_cache is not None else None,
+            "sessions": self.sessions.stats(),
+            "reranker": self.reranker.stats() if self.reranker is not None else None,
+            "context": self.context_builder.stats(),
+            "condense": self.question_generator.stats(),
+            "llm_backend": self.llm_backend.stats(),
+            "condense_backend": self.condense_backend.stats() if self.condense_backend is not None else None,
+            "ingest_jobs": self.ingest_jobs.stats(),
+            "index_wal": self.vector_store.wal_stats()
+        }
+    
+    def conversation_messages(self, conversation_id: str) -> Optional[List[Dict]]:
+        """Lịch sử hội thoại đang giữ trong session store ({"role", "content"}), None nếu không có"""
+        messages = self.sessions.messages(conversation_id)
+        if messages is None:
+            return None
+        return [
+            {"role": "user" if message.type == "human" else "assistant", "content": message.content}
+            for message in messages
+        ]
     
-    def reset_conversation(self):
+    def reset_conversation(self, conversation_id: str = "default"):
         """Reset lịch sử hội thoại"""
-        self.memory.clear()
+        self.sessions.reset(conversation_id)
 
 
 if __name__ == "__main__":
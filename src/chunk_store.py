@@ -0,0 +1,193 @@
+"""
+Chunk Store - Lưu text và metadata của chunks trên disk thay cho docstore pickle (index.pkl)
+chunks-<generation>.idx (chunks.idx ở store cũ): header + bảng offsets (int64, n x 3: offset, text_len, meta_len) + danh sách IDs theo vị trí trong FAISS index
+(ID rỗng: label đã xóa khỏi index IVF/HNSW, chưa compaction)
+chunks-<time_ns>.dat: text và metadata (JSON) nối liền nhau, chỉ ghi thêm vào cuối
+
+Cả 2 file được memory-map: nhiều process dùng chung page cache, chỉ đọc các chunk top-k được truy cập
+"""
+
+import os
+import json
+import mmap
+import struct
+import time
+from typing import Callable, Dict, List, Optional, Union
+
+import numpy as np
+from langchain.schema import Document
+from langchain_community.docstore.base import AddableMixin, Docstore
+
+MAGIC = b"MECHIDX1"
+# magic, số chunks, độ dài danh sách IDs, độ dài tên file data
+HEADER = struct.Struct("<8sQQQ")
+INDEX_FILE = "chunks.idx"
+# Tỉ lệ dữ liệu không còn dùng (chunk đã xóa/thay thế) trong file data để ghi lại file mới
+COMPACT_GARBAGE_RATIO = 0.5
+
+
+class ChunkStore:
+    """Đọc chunk store đã lưu (read-only, lazy)"""
+
+    def __init__(self, directory: str, index_file: str = INDEX_FILE):
+        self.directory = directory
+        self.index_path = os.path.join(directory, index_file)
+
+        with open(self.index_path, "rb") as f:
+            self._index_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, count, ids_len, name_len = HEADER.unpack_from(self._index_map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Invalid chunk store index: {self.index_path}")
+
+        position = HEADER.size
+        self.data_file = self._index_map[position:position + name_len].decode("utf-8").rstrip("\0")
+        position += name_len
+        # View trực tiếp trên mmap, không copy
+        self.offsets = np.frombuffer(self._index_map, dtype=np.int64, count=count * 3, offset=position).reshape(count, 3)
+        position += count * 3 * 8
+        ids = self._index_map[position:position + ids_len].decode("utf-8")
+        self.ids: List[str] = ids.split("\n") if count else []
+
+        data_path = os.path.join(directory, self.data_file)
+        if os.path.getsize(data_path) == 0:
+            self._data = b""
+        else:
+            with open(data_path, "rb") as f:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @staticmethod
+    def exists(directory: str, index_file: str = INDEX_FILE) -> bool:
+        return os.path.exists(os.path.join(directory, index_file))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def get(self, row: int) -> Document:
+        offset, text_len, meta_len = (int(v) for v in self.offsets[row])
+        text = self._data[offset:offset + text_len].decode("utf-8")
+        metadata = json.loads(self._data[offset + text_len:offset + text_len + meta_len]) if meta_len else {}
+        return Document(page_content=text, metadata=metadata)
+
+    @staticmethod
+    def write(directory: str, ids: List[Optional[str]], docstore: Docstore, index_file: str = INDEX_FILE):
+        """
+        Ghi chunk store theo thứ tự ids (= vị trí trong FAISS index, None = label đã xóa).
+        Append-only: chunks đã có trong file data hiện tại chỉ được tham chiếu lại, chỉ chunk mới được ghi thêm;
+        khi phần dữ liệu không còn dùng vượt COMPACT_GARBAGE_RATIO thì ghi file data mới (compaction).
+        File index được thay thế atomic (rename): process khác đang memory-map bản cũ vẫn đọc được.
+        File data cũ không bị xóa ở đây - generation đã commit có thể vẫn trỏ tới nó
+        """
+        os.makedirs(directory, exist_ok=True)
+        offsets = np.zeros((len(ids), 3), dtype=np.int64)
+
+        base = None
+        if isinstance(docstore, ChunkDocstore) and docstore.store is not None \
+                and os.path.abspath(docstore.store.directory) == os.path.abspath(directory):
+            base = docstore.store
+
+        # Chunks dùng lại được từ file data hiện tại
+        reused = {}
+        if base is not None:
+            for row, chunk_id in enumerate(ids):
+                if chunk_id is None:
+                    continue
+                stored_row = docstore.stored_row(chunk_id)
+                if stored_row is not None:
+                    reused[row] = base.offsets[stored_row]
+
+            data_size = os.path.getsize(os.path.join(directory, base.data_file))
+            live = sum(int(text_len + meta_len) for _, text_len, meta_len in reused.values())
+            if data_size and (data_size - live) / data_size > COMPACT_GARBAGE_RATIO:
+                print(f"Compacting chunk store ({data_size - live} of {data_size} bytes unused)")
+                base, reused = None, {}
+
+        if base is not None:
+            data_file = base.data_file
+            mode = "ab"
+        else:
+            data_file = f"chunks-{time.time_ns()}.dat"
+            mode = "wb"
+
+        data_path = os.path.join(directory, data_file)
+        position = os.path.getsize(data_path) if mode == "ab" else 0
+        with open(data_path, mode) as f:
+            for row, chunk_id in enumerate(ids):
+                if row in reused:
+                    offsets[row] = reused[row]
+                    continue
+                if chunk_id is None:
+                    continue
+                document = docstore.search(chunk_id)
+                text = document.page_content.encode("utf-8")
+                meta = json.dumps(document.metadata, ensure_ascii=False, default=str).encode("utf-8") \
+                    if document.metadata else b""
+                f.write(text)
+                f.write(meta)
+                offsets[row] = (position, len(text), len(meta))
+                position += len(text) + len(meta)
+            f.flush()
+            os.fsync(f.fileno())
+
+        ids_blob = "\n".join(chunk_id or "" for chunk_id in ids).encode("utf-8")
+        name_blob = data_file.encode("utf-8")
+        # Căn lề 8 byte cho bảng offsets
+        name_blob += b"\0" * (-(HEADER.size + len(name_blob)) % 8)
+        tmp_path = os.path.join(directory, index_file + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, len(ids), len(ids_blob), len(name_blob)))
+            f.write(name_blob)
+            f.write(offsets.tobytes())
+            f.write(ids_blob)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(directory, index_file))
+
+
+class ChunkDocstore(Docstore, AddableMixin):
+    """
+    Docstore cho LangChain FAISS đọc lazy từ ChunkStore.
+    Chunks thêm/xóa sau khi load được giữ trong bộ nhớ cho tới lần save tiếp theo
+    """
+
+    def __init__(self, store: Optional[ChunkStore] = None):
+        self.store = store
+        self._rows: Dict[str, int] = {
+            chunk_id: row for row, chunk_id in enumerate(store.ids) if chunk_id
+        } if store else {}
+        self._added: Dict[str, Document] = {}
+        self._deleted = set()
+
+    def __contains__(self, chunk_id: str) -> bool:
+        if chunk_id in self._added:
+            return True
+        return chunk_id in self._rows and chunk_id not in self._deleted
+
+    def stored_row(self, chunk_id: str) -> Optional[int]:
+        """Vị trí của chunk trong ChunkStore, None nếu chunk mới thêm hoặc đã xóa"""
+        if chunk_id in self._added or chunk_id in self._deleted:
+            return None
+        return self._rows.get(chunk_id)
+
+    def search(self, search: str) -> Union[str, Document]:
+        document = self._added.get(search)
+        if document is not None:
+            return document
+        row = self._rows.get(search)
+        if row is None or search in self._deleted:
+            return f"ID {search} not found."
+        return self.store.get(row)
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        overlapping = [chunk_id for chunk_id in texts if chunk_id in self]
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        self._added.update(texts)
+
+    def delete(self, ids: List) -> None:
+        missing = [chunk_id for chunk_id in ids if chunk_id not in self]
+        if missing:
+            raise ValueError(f"Tried to delete ids that does not exist: {missing}")
+        for chunk_id in ids:
+            if self._added.pop(chunk_id, None) is None:
+                self._deleted.add(chunk_id)
@@ -0,0 +1,124 @@
+"""
+Concurrency Limiter - Giới hạn số request xử lý đồng thời cho async server
+Request vượt quá giới hạn được xếp hàng; khi hàng đợi đầy thì bị từ chối (HTTP 429)
+
+ReadWriteLock - Search (đọc) chạy song song, cập nhật index (ghi) độc quyền
+"""
+
+import asyncio
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Optional
+
+
+class Saturated(Exception):
+    """Server đang quá tải - hàng đợi đầy hoặc chờ quá lâu"""
+
+
+class ConcurrencyLimiter:
+    def __init__(
+        self,
+        max_concurrency: int = 32,
+        max_queue: int = 64,
+        queue_timeout: Optional[float] = 30
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Tạo semaphore trong event loop đang chạy
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def acquire(self):
+        """Chờ tới lượt xử lý, raise Saturated nếu hàng đợi đầy hoặc hết thời gian chờ"""
+        semaphore = self._get_semaphore()
+
+        # waiting được tăng trước khi await nên active + waiting luôn là số request đang chiếm chỗ
+        if self.active + self.waiting >= self.max_concurrency + self.max_queue:
+            self.rejected += 1
+            raise Saturated(f"Too many requests in queue ({self.waiting})")
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise Saturated(f"Waited more than {self.queue_timeout}s in queue")
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+
+    def release(self):
+        self.active -= 1
+        self._get_semaphore().release()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict:
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue
+        }
+
+
+class ReadWriteLock:
+    """
+    Nhiều thread đọc cùng lúc hoặc 1 thread ghi. Ưu tiên ghi: khi có thread ghi đang chờ,
+    thread đọc mới phải đợi để cập nhật index không bị chặn mãi dưới tải search liên tục.
+    Không reentrant
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writing = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        with self._condition:
+            while self._writing or self._waiting_writers:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._condition:
+            self._waiting_writers += 1
+            try:
+                while self._writing or self._readers:
+                    self._condition.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
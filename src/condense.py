@@ -0,0 +1,89 @@
+"""
+Condense Question - Bỏ qua bước LLM viết lại câu hỏi khi câu hỏi đã đủ nghĩa
+Câu hỏi tiếp theo trong hội thoại chỉ cần viết lại khi nó phụ thuộc ngữ cảnh trước
+("còn nghỉ ốm thì sao?", "nó áp dụng cho ai?"); câu hỏi đầy đủ được dùng nguyên để retrieve
+"""
+
+import re
+import threading
+import unicodedata
+from typing import Any, Dict, Optional
+
+from langchain.chains import LLMChain
+from langchain_core.callbacks import AsyncCallbackManagerForChainRun, CallbackManagerForChainRun
+
+_WORD_PATTERN = re.compile(r"\w+")
+_stats_lock = threading.Lock()
+
+# Đại từ / từ chỉ định tham chiếu tới lượt trước
+_FOLLOW_UP_WORDS = {
+    "nó", "đó", "này", "ấy", "kia", "đấy", "vậy", "thế", "họ", "chúng", "trên",
+    "it", "its", "that", "this", "these", "those", "they", "them"
+}
+# Câu hỏi nối tiếp lượt trước
+_FOLLOW_UP_PREFIXES = (
+    "còn ", "vậy ", "thế ", "và ", "nhưng ", "ngoài ra", "thêm ",
+    "and ", "also ", "what about", "how about"
+)
+_FOLLOW_UP_PHRASES = ("thì sao", "như trên", "nói trên", "vừa rồi")
+# Cụm từ chứa "thế"/"vậy" nhưng không tham chiếu lượt trước
+_SELF_CONTAINED_PHRASES = ("như thế nào", "thế nào", "tại sao vậy")
+
+
+def needs_condense(question: str, min_words: int = 4) -> bool:
+    """Câu hỏi có phụ thuộc ngữ cảnh hội thoại không (không chắc chắn thì coi là có)"""
+    text = " ".join(unicodedata.normalize("NFC", question).lower().split())
+
+    if text.startswith(_FOLLOW_UP_PREFIXES) or any(phrase in text for phrase in _FOLLOW_UP_PHRASES):
+        return True
+
+    for phrase in _SELF_CONTAINED_PHRASES:
+        text = text.replace(phrase, " ")
+    words = _WORD_PATTERN.findall(text)
+    # Câu quá ngắn ("bao nhiêu ngày?") thường là câu hỏi nối tiếp
+    if len(words) < min_words:
+        return True
+    return any(word in _FOLLOW_UP_WORDS for word in words)
+
+
+class SkippableCondenseChain(LLMChain):
+    """question_generator của ConversationalRetrievalChain: chỉ gọi LLM khi needs_condense"""
+
+    min_words: int = 4
+    enabled: bool = True
+    calls: int = 0
+    skipped: int = 0
+
+    def _should_skip(self, inputs: Dict[str, Any]) -> bool:
+        skip = self.enabled and not needs_condense(inputs["question"], self.min_words)
+        with _stats_lock:
+            if skip:
+                self.skipped += 1
+            else:
+                self.calls += 1
+        return skip
+
+    def _call(
+        self,
+        inputs: Dict[str, Any],
+        run_manager: Optional[CallbackManagerForChainRun] = None,
+    ) -> Dict[str, str]:
+        if self._should_skip(inputs):
+            return {self.output_key: inputs["question"]}
+        return super()._call(inputs, run_manager=run_manager)
+
+    async def _acall(
+        self,
+        inputs: Dict[str, Any],
+        run_manager: Optional[AsyncCallbackManagerForChainRun] = None,
+    ) -> Dict[str, str]:
+        if self._should_skip(inputs):
+            return {self.output_key: inputs["question"]}
+        return await super()._acall(inputs, run_manager=run_manager)
+
+    def stats(self) -> Dict:
+        return {
+            "heuristic": self.enabled,
+            "llm_calls": self.calls,
+            "skipped": self.skipped
+        }
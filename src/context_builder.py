@@ -0,0 +1,165 @@
+"""
+Context Builder - Xếp chunks và lịch sử hội thoại vào prompt theo token budget
+Lịch sử lấy từ lượt mới nhất trở về trước; chunks theo thứ tự retriever (liên quan nhất trước),
+bỏ chunk trùng lặp nội dung, chunk cuối không vừa thì cắt bớt
+"""
+
+import re
+import threading
+from typing import Any, Dict, List, Set
+
+from langchain.chains import ConversationalRetrievalChain
+from langchain.schema import Document
+from langchain_core.callbacks import AsyncCallbackManagerForChainRun, CallbackManagerForChainRun
+from langchain_core.messages import BaseMessage
+
+from token_counter import count_tokens, truncate_tokens
+from metrics import span
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+# Giống format mặc định của ConversationalRetrievalChain
+_ROLE_PREFIXES = {"human": "Human: ", "ai": "Assistant: "}
+
+# StuffDocumentsChain nối các chunks bằng "\n\n"
+_SEPARATOR_TOKENS = 1
+
+
+def _shingles(text: str, size: int = 3) -> Set[tuple]:
+    """Tập n-gram từ (lowercase) để so độ trùng lặp giữa 2 chunks"""
+    words = _WORD_PATTERN.findall(text.lower())
+    if len(words) < size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class ContextBuilder:
+    def __init__(
+        self,
+        max_prompt_tokens: int = 1920,
+        max_history_tokens: int = 600,
+        dedupe_threshold: float = 0.8,
+        min_chunk_tokens: int = 100,
+        template_tokens: int = 0
+    ):
+        self.max_prompt_tokens = max_prompt_tokens
+        self.max_history_tokens = max_history_tokens
+        self.dedupe_threshold = dedupe_threshold
+        self.min_chunk_tokens = min_chunk_tokens
+        # Số token của prompt template khi các biến để trống
+        self.template_tokens = template_tokens
+
+        self.requests = 0
+        self.duplicates_dropped = 0
+        self.chunks_dropped = 0
+        self.chunks_truncated = 0
+        self._lock = threading.Lock()
+
+    def format_history(self, chat_history: List) -> str:
+        """Hook get_chat_history của chain: giữ các lượt mới nhất trong max_history_tokens"""
+        lines = []
+        for turn in chat_history:
+            if isinstance(turn, BaseMessage):
+                lines.append(_ROLE_PREFIXES.get(turn.type, f"{turn.type}: ") + turn.content)
+            else:
+                lines.append("Human: " + turn[0])
+                lines.append("Assistant: " + turn[1])
+
+        kept = []
+        remaining = self.max_history_tokens
+        for line in reversed(lines):
+            tokens = count_tokens(line) + 1
+            if tokens > remaining:
+                break
+            kept.append(line)
+            remaining -= tokens
+
+        if not kept:
+            return ""
+        return "\n" + "\n".join(reversed(kept))
+
+    def pack(self, question: str, chat_history: str, documents: List[Document]) -> List[Document]:
+        """Chunks đưa vào prompt: phần budget còn lại sau template, câu hỏi và lịch sử"""
+        budget = (
+            self.max_prompt_tokens - self.template_tokens
+            - count_tokens(question) - count_tokens(chat_history)
+        )
+
+        packed: List[Document] = []
+        seen: Set[tuple] = set()
+        duplicates = dropped = truncated = 0
+
+        for i, doc in enumerate(documents):
+            shingles = _shingles(doc.page_content)
+            if shingles and len(shingles & seen) / len(shingles) >= self.dedupe_threshold:
+                duplicates += 1
+                continue
+
+            tokens = count_tokens(doc.page_content) + _SEPARATOR_TOKENS
+            if tokens <= budget:
+                packed.append(doc)
+                seen |= shingles
+                budget -= tokens
+                continue
+
+            # Không vừa: cắt bớt nếu phần còn lại đủ lớn, các chunks sau (ít liên quan hơn) bỏ qua
+            if budget - _SEPARATOR_TOKENS >= self.min_chunk_tokens:
+                content = truncate_tokens(doc.page_content, budget - _SEPARATOR_TOKENS)
+                packed.append(Document(page_content=content, metadata=dict(doc.metadata)))
+                truncated += 1
+                dropped -= 1
+            dropped += len(documents) - i
+            break
+
+        with self._lock:
+            self.requests += 1
+            self.duplicates_dropped += duplicates
+            self.chunks_dropped += dropped
+            self.chunks_truncated += truncated
+
+        return packed
+
+    def stats(self) -> Dict:
+        return {
+            "max_prompt_tokens": self.max_prompt_tokens,
+            "max_history_tokens": self.max_history_tokens,
+            "requests": self.requests,
+            "duplicates_dropped": self.duplicates_dropped,
+            "chunks_dropped": self.chunks_dropped,
+            "chunks_truncated": self.chunks_truncated
+        }
+
+
+class BudgetedConversationalRetrievalChain(ConversationalRetrievalChain):
+    """ConversationalRetrievalChain với chunks được chọn bởi ContextBuilder thay vì lấy hết k chunks"""
+
+    context_builder: Any
+
+    @span("context_packing")
+    def _pack(self, question: str, inputs: Dict[str, Any], documents: List[Document]) -> List[Document]:
+        chat_history = self.context_builder.format_history(inputs["chat_history"])
+        return self.context_builder.pack(question, chat_history, documents)
+
+    def _get_docs(
+        self,
+        question: str,
+        inputs: Dict[str, Any],
+        *,
+        run_manager: CallbackManagerForChainRun,
+    ) -> List[Document]:
+        documents = self.retriever.get_relevant_documents(
+            question, callbacks=run_manager.get_child()
+        )
+        return self._pack(question, inputs, documents)
+
+    async def _aget_docs(
+        self,
+        question: str,
+        inputs: Dict[str, Any],
+        *,
+        run_manager: AsyncCallbackManagerForChainRun,
+    ) -> List[Document]:
+        documents = await self.retriever.aget_relevant_documents(
+            question, callbacks=run_manager.get_child()
+        )
+        return self._pack(question, inputs, documents)
@@ -4,7 +4,9 @@ Hỗ trợ: PDF, DOCX, TXT
 """
 
 import os
-from typing import List, Dict
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import (
     PyPDFLoader,
@@ -14,6 +16,54 @@ from langchain_community.document_loaders import (
 from langchain.schema import Document
 
 
+# Processor riêng cho mỗi worker process (khởi tạo 1 lần trong initializer)
+_worker_processor = None
+
+
+def _init_worker(chunk_size: int, chunk_overlap: int):
+    global _worker_processor
+    _worker_processor = DocumentProcessor(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+def _process_in_worker(file_path: str) -> List[Document]:
+    return _worker_processor.process_document(file_path)
+
+
+class IngestProgress:
+    """Theo dõi tiến độ ingest: số file đã xử lý, số chunks đã embed, throughput"""
+    
+    def __init__(self, total_files: int = 0):
+        self.total_files = total_files
+        self.files_done = 0
+        self.chunks_done = 0
+        self.started = time.monotonic()
+    
+    def file_done(self):
+        self.files_done += 1
+    
+    def chunks_added(self, count: int):
+        self.chunks_done += count
+        self.report()
+    
+    def as_dict(self) -> Dict:
+        elapsed = time.monotonic() - self.started
+        return {
+            "files": self.files_done,
+            "total_files": self.total_files,
+            "chunks": self.chunks_done,
+            "elapsed_s": round(elapsed, 2),
+            "files_per_s": round(self.files_done / elapsed, 2) if elapsed else 0.0,
+            "chunks_per_s": round(self.chunks_done / elapsed, 2) if elapsed else 0.0
+        }
+    
+    def report(self):
+        stats = self.as_dict()
+        print(
+            f"Progress: {stats['files']}/{stats['total_files']} files, "
+            f"{stats['chunks']} chunks embedded ({stats['chunks_per_s']} chunks/s)"
+        )
+
+
 class DocumentProcessor:
     def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
         self.chunk_size = chunk_size
@@ -60,24 +110,135 @@ class DocumentProcessor:
         chunks = self.text_splitter.split_documents(documents)
         return chunks
     
-    def process_directory(self, directory_path: str) -> List[Document]:
-        """Xử lý tất cả documents trong thư mục"""
-        all_chunks = []
+    def iter_process_files(
+        self,
+        file_paths: Iterable[str],
+        workers: int = 1,
+        file_timeout: Optional[float] = None
+    ) -> Iterator[Tuple[str, Optional[List[Document]]]]:
+        """
+        Load và split nhiều files, yield (file_path, chunks) theo thứ tự hoàn thành
+        workers > 1: parse song song bằng process pool; file vượt quá file_timeout giây
+        bị bỏ qua và yield chunks=None
+        """
+        if workers <= 1:
+            for file_path in file_paths:
+                yield file_path, self.process_document(file_path)
+            return
         
+        yield from self._iter_process_files_parallel(file_paths, workers, file_timeout)
+    
+    def _new_executor(self, workers: int) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(self.chunk_size, self.chunk_overlap)
+        )
+    
+    @staticmethod
+    def _terminate_executor(executor: ProcessPoolExecutor):
+        """Dừng executor ngay lập tức, kill cả các worker đang bị treo"""
+        processes = list((getattr(executor, "_processes", None) or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+    
+    def _iter_process_files_parallel(
+        self,
+        file_paths: Iterable[str],
+        workers: int,
+        file_timeout: Optional[float]
+    ) -> Iterator[Tuple[str, Optional[List[Document]]]]:
+        paths = iter(file_paths)
+        retry: List[str] = []
+        in_flight = {}  # future -> (file_path, submitted_at)
+        executor = self._new_executor(workers)
+        
+        try:
+            while True:
+                # Giới hạn số file đang xử lý = số workers để thời gian timeout tính từ lúc bắt đầu parse
+                while len(in_flight) < workers:
+                    file_path = retry.pop() if retry else next(paths, None)
+                    if file_path is None:
+                        break
+                    future = executor.submit(_process_in_worker, file_path)
+                    in_flight[future] = (file_path, time.monotonic())
+                
+                if not in_flight:
+                    break
+                
+                done, _ = wait(in_flight, timeout=0.5, return_when=FIRST_COMPLETED)
+                
+                for future in done:
+                    file_path, _ = in_flight.pop(future)
+                    try:
+                        chunks = future.result()
+                    except Exception as e:
+                        print(f"Error processing {file_path}: {e}")
+                        chunks = []
+                    yield file_path, chunks
+                
+                if not file_timeout:
+                    continue
+                
+                now = time.monotonic()
+                timed_out = [
+                    future for future, (_, submitted_at) in in_flight.items()
+                    if now - submitted_at > file_timeout
+                ]
+                if not timed_out:
+                    continue
+                
+                # Không thể kill riêng 1 worker -> dừng pool, chạy lại các file còn lại trên pool mới
+                for future in timed_out:
+                    file_path, _ = in_flight.pop(future)
+                    print(f"Timeout after {file_timeout}s, skipped: {file_path}")
+                    yield file_path, None
+                
+                retry.extend(file_path for file_path, _ in in_flight.values())
+                in_flight.clear()
+                self._terminate_executor(executor)
+                executor = self._new_executor(workers)
+        finally:
+            if in_flight:
+                self._terminate_executor(executor)
+            else:
+                executor.shutdown(wait=True)
+    
+    @staticmethod
+    def list_files(directory_path: str) -> List[str]:
+        """Liệt kê files trong thư mục (không đệ quy)"""
+        return [
+            os.path.join(directory_path, filename)
+            for filename in sorted(os.listdir(directory_path))
+            if os.path.isfile(os.path.join(directory_path, filename))
+        ]
+    
+    def iter_chunks(
+        self,
+        directory_path: str,
+        workers: int = 1,
+        file_timeout: Optional[float] = None
+    ) -> Iterator[Document]:
+        """Yield từng chunk của thư mục - bộ nhớ chỉ giữ chunks của các file đang xử lý"""
         if not os.path.exists(directory_path):
             print(f"Directory not found: {directory_path}")
-            return all_chunks
-        
-        for filename in os.listdir(directory_path):
-            file_path = os.path.join(directory_path, filename)
-            
-            if os.path.isfile(file_path):
-                print(f"Processing: {filename}")
-                chunks = self.process_document(file_path)
-                all_chunks.extend(chunks)
-                print(f"  -> {len(chunks)} chunks created")
+            return
         
-        return all_chunks
+        results = self.iter_process_files(
+            self.list_files(directory_path),
+            workers=workers,
+            file_timeout=file_timeout
+        )
+        for file_path, chunks in results:
+            if chunks:
+                print(f"Processed: {os.path.basename(file_path)} -> {len(chunks)} chunks")
+                yield from chunks
+    
+    def process_directory(self, directory_path: str) -> List[Document]:
+        """Xử lý tất cả documents trong thư mục (dùng iter_chunks cho thư mục lớn)"""
+        return list(self.iter_chunks(directory_path))
     
     def get_document_text(self, file_path: str) -> str:
         """Lấy toàn bộ text từ document"""
@@ -91,9 +252,11 @@ if __name__ == "__main__":
     docs_path = "./documents"
     
     if os.path.exists(docs_path):
-        chunks = processor.process_directory(docs_path)
-        print(f"\nTotal chunks: {len(chunks)}")
-        if chunks:
-            print(f"Sample chunk: {chunks[0].page_content[:200]}...")
+        total = 0
+        for chunk in processor.iter_chunks(docs_path):
+            if total == 0:
+                print(f"Sample chunk: {chunk.page_content[:200]}...")
+            total += 1
+        print(f"\nTotal chunks: {total}")
     else:
         print(f"Create '{docs_path}' directory and add some documents to test")
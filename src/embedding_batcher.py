@@ -0,0 +1,87 @@
+"""
+Embedding Batcher - Gom các query embedding đồng thời thành 1 batch
+Mỗi request chờ tối đa max_wait_ms để gom thêm request khác, sau đó cả batch chạy 1 forward pass;
+trên CPU 1 batch 16 câu nhanh hơn nhiều so với 16 lần embed từng câu
+"""
+
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class EmbeddingBatcher:
+    def __init__(
+        self,
+        embed_batch: Callable[[List[str]], List[List[float]]],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5
+    ):
+        self.embed_batch = embed_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+
+        self.requests = 0
+        self.batches = 0
+        self.largest_batch = 0
+
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._worker.start()
+
+    def embed(self, text: str) -> List[float]:
+        """Embed 1 text - block tới khi batch chứa text này chạy xong"""
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future.result()
+
+    def _collect(self) -> List[Tuple[str, Future]]:
+        """Chờ request đầu tiên, gom thêm tới max_batch_size hoặc hết max_wait_ms"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                # Hết thời gian chờ vẫn lấy nốt các request đã có sẵn trong queue
+                batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # Cùng text (nhiều user hỏi cùng câu) chỉ embed 1 lần
+            texts = list(dict.fromkeys(text for text, _ in batch))
+            try:
+                vectors = dict(zip(texts, self.embed_batch(texts)))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            with self._lock:
+                self.requests += len(batch)
+                self.batches += 1
+                self.largest_batch = max(self.largest_batch, len(batch))
+            for text, future in batch:
+                future.set_result(list(vectors[text]))
+
+    def stats(self) -> Dict:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "avg_batch_size": round(self.requests / self.batches, 2) if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms
+        }
@@ -0,0 +1,398 @@
+"""
+Embedding Cache - Cache embeddings trên disk theo hash nội dung chunk
+Vectors lưu trong file float32 memory-mapped, keys (hash) lưu song song theo từng dòng
+Nhiều process (Gradio + API server cùng vector_db) dùng chung cache: ghi thêm giữ file lock (flock),
+số dòng lấy theo file trên disk. Vượt max_size_mb thì bỏ các vectors cũ nhất, ghi ra cặp file mới
+(vectors-<epoch>.f32, keys-<epoch>.txt) và đổi epoch trong meta.json
+Query embeddings được cache trong bộ nhớ (LRU) theo query text đã chuẩn hóa,
+query chưa có trong cache được embed qua batcher (gom các request đồng thời) nếu có
+"""
+
+import os
+import re
+import json
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+try:
+    import fcntl
+except ImportError:  # Windows: không có flock - chỉ 1 process được ghi cache
+    fcntl = None
+
+
+class CachedEmbeddings(Embeddings):
+    """Bọc embedding model, chỉ gọi model cho các chunk chưa có trong cache"""
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        cache_directory: str,
+        model_name: str = "",
+        query_cache_size: int = 2048,
+        query_batcher: Any = None,
+        max_size_mb: float = 0
+    ):
+        self.underlying = underlying
+        self.cache_directory = cache_directory
+        self.model_name = model_name
+        self.query_cache_size = query_cache_size
+        # EmbeddingBatcher (có method embed(text)) cho query embedding; None = gọi model trực tiếp
+        self.query_batcher = query_batcher
+        # Kích thước tối đa file vectors (0 = không giới hạn)
+        self.max_size_mb = max_size_mb
+
+        self.meta_path = os.path.join(cache_directory, "meta.json")
+        self.lock_path = os.path.join(cache_directory, "cache.lock")
+
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.query_hits = 0
+        self.query_misses = 0
+
+        self._query_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._query_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._rows: Dict[str, int] = {}
+        # Số dòng hợp lệ trong file (có thể > len(_rows) nếu 2 process cùng ghi 1 key) và độ dài file keys tương ứng
+        self._count = 0
+        self._keys_size = 0
+        self._epoch = 0
+        self._dim: Optional[int] = None
+        self._vectors: Optional[np.memmap] = None
+        self._load()
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _paths(self, epoch: int) -> Tuple[str, str]:
+        """File vectors và keys của epoch (epoch 0: tên file của cache cũ)"""
+        if not epoch:
+            return (
+                os.path.join(self.cache_directory, "vectors.f32"),
+                os.path.join(self.cache_directory, "keys.txt")
+            )
+        return (
+            os.path.join(self.cache_directory, f"vectors-{epoch}.f32"),
+            os.path.join(self.cache_directory, f"keys-{epoch}.txt")
+        )
+
+    @property
+    def vectors_path(self) -> str:
+        return self._paths(self._epoch)[0]
+
+    @property
+    def keys_path(self) -> str:
+        return self._paths(self._epoch)[1]
+
+    @contextmanager
+    def _file_lock(self):
+        """Khóa giữa các process dùng chung cache directory"""
+        os.makedirs(self.cache_directory, exist_ok=True)
+        with open(self.lock_path, "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            yield
+
+    def _read_meta(self) -> Optional[Dict]:
+        if not os.path.exists(self.meta_path):
+            return None
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_meta(self, epoch: int):
+        """Ghi meta.json atomic - đổi epoch là commit point khi thay cặp file vectors/keys"""
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"model": self.model_name, "dim": self._dim, "epoch": epoch}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.meta_path)
+
+    def _remove_files(self, keep_epoch: Optional[int] = None):
+        """Xóa cặp file vectors/keys của mọi epoch, trừ keep_epoch"""
+        keep = {os.path.basename(path) for path in self._paths(keep_epoch)} if keep_epoch is not None else set()
+        for name in os.listdir(self.cache_directory):
+            if name.startswith(("vectors", "keys")) and name.endswith((".f32", ".txt")) and name not in keep:
+                os.remove(os.path.join(self.cache_directory, name))
+
+    def _reset(self):
+        """Xóa cache (khi đổi model hoặc file bị hỏng) - gọi khi đang giữ file lock"""
+        self._remove_files()
+        self._epoch = 0
+        self._rows = {}
+        self._count = 0
+        self._keys_size = 0
+        self._dim = None
+        self._vectors = None
+
+    def _load(self):
+        """Load index hash -> row và memory-map file vectors"""
+        with self._file_lock():
+            try:
+                meta = self._read_meta()
+            except Exception as e:
+                print(f"Error loading embedding cache: {e}")
+                self._reset()
+                return
+
+            if meta is None:
+                self._reset()
+                return
+
+            if meta.get("model") != self.model_name:
+                print("Embedding model changed, clearing embedding cache")
+                self._reset()
+                return
+
+            self._dim = meta.get("dim")
+            self._epoch = meta.get("epoch", 0)
+            if not self._dim or not os.path.exists(self.vectors_path) or not os.path.exists(self.keys_path):
+                self._reset()
+                return
+
+            self._sync()
+
+    def _sync(self):
+        """
+        Đọc các dòng process khác đã ghi thêm và cắt phần ghi dở khi crash (gọi khi đang giữ file lock).
+        Process khác đã đổi epoch (eviction) thì đọc lại từ đầu
+        """
+        epoch = (self._read_meta() or {}).get("epoch", 0)
+        if epoch != self._epoch:
+            self._epoch = epoch
+            self._rows = {}
+            self._count = 0
+            self._keys_size = 0
+
+        tail = b""
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path, "rb") as f:
+                f.seek(self._keys_size)
+                tail = f.read()
+        # Dòng cuối không có "\n" là key ghi dở
+        lines = tail.split(b"\n")[:-1]
+
+        # Số dòng hợp lệ = min(keys, vectors)
+        row_bytes = 4 * self._dim
+        vector_rows = os.path.getsize(self.vectors_path) // row_bytes if os.path.exists(self.vectors_path) else 0
+        lines = lines[:max(vector_rows - self._count, 0)]
+        for i, key in enumerate(lines):
+            self._rows[key.decode("utf-8")] = self._count + i
+        self._count += len(lines)
+        self._keys_size += sum(len(line) + 1 for line in lines)
+
+        self._truncate(self._count * row_bytes, self._keys_size)
+        self._remap(self._count)
+
+    def _truncate(self, vectors_size: int, keys_size: int):
+        """Cắt 2 file về cùng số dòng, để lần _append sau ghi đúng offset"""
+        for path, size in ((self.vectors_path, vectors_size), (self.keys_path, keys_size)):
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                print(f"Embedding cache: dropping {os.path.getsize(path) - size} incomplete bytes of {os.path.basename(path)}")
+                os.truncate(path, size)
+
+    def _remap(self, rows: int):
+        if rows == 0:
+            self._vectors = None
+            return
+        self._vectors = np.memmap(
+            self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self._dim)
+        )
+
+    def _max_rows(self) -> int:
+        if not self.max_size_mb:
+            return 0
+        return max(int(self.max_size_mb * 1024 * 1024) // (4 * self._dim), 1)
+
+    def _evict(self):
+        """Giữ nửa số vectors mới nhất (FIFO): ghi ra cặp file của epoch mới rồi commit bằng meta.json"""
+        keep = self._max_rows() // 2
+        first = max(self._count - keep, 0)
+        by_row = {row: key for key, row in self._rows.items() if row >= first}
+        rows = sorted(by_row)
+
+        epoch = self._epoch + 1
+        vectors_path, keys_path = self._paths(epoch)
+        keys_data = "".join(f"{by_row[row]}\n" for row in rows).encode("utf-8")
+        with open(vectors_path, "wb") as f:
+            if rows:
+                f.write(np.ascontiguousarray(self._vectors[rows], dtype=np.float32).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        with open(keys_path, "wb") as f:
+            f.write(keys_data)
+            f.flush()
+            os.fsync(f.fileno())
+        self._write_meta(epoch)
+
+        self.evicted += self._count - len(rows)
+        print(f"Embedding cache: evicted {self._count - len(rows)} oldest vectors (max {self.max_size_mb} MB)")
+        self._epoch = epoch
+        self._rows = {by_row[row]: i for i, row in enumerate(rows)}
+        self._count = len(rows)
+        self._keys_size = len(keys_data)
+        self._remap(self._count)
+        self._remove_files(keep_epoch=epoch)
+
+    def _append(self, keys: List[str], vectors: np.ndarray):
+        """Ghi thêm vectors mới vào cuối file cache; giữ file lock nên các process ghi lần lượt"""
+        with self._file_lock():
+            if self._dim is None:
+                # Process khác có thể đã tạo cache
+                meta = self._read_meta()
+                if meta and meta.get("model") == self.model_name and meta.get("dim"):
+                    self._dim = meta["dim"]
+                else:
+                    self._dim = int(vectors.shape[1])
+                    self._write_meta(0)
+
+            self._sync()
+            new = [i for i, key in enumerate(keys) if key not in self._rows]
+            if not new:
+                return
+            keys = [keys[i] for i in new]
+            if self._max_rows() and self._count + len(keys) > self._max_rows():
+                self._evict()
+
+            start = self._count
+            vectors_size = start * 4 * self._dim
+            keys_data = "".join(f"{key}\n" for key in keys).encode("utf-8")
+            try:
+                with open(self.vectors_path, "ab") as f:
+                    f.write(np.ascontiguousarray(vectors[new], dtype=np.float32).tobytes())
+                with open(self.keys_path, "ab") as f:
+                    f.write(keys_data)
+            except OSError:
+                # Ghi lỗi giữa chừng (disk đầy...): trả 2 file về số dòng cũ
+                self._truncate(vectors_size, self._keys_size)
+                raise
+
+            for i, key in enumerate(keys):
+                self._rows[key] = start + i
+            self._count += len(keys)
+            self._keys_size += len(keys_data)
+            self._remap(self._count)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self.text_hash(text) for text in texts]
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        missing: Dict[str, str] = {}
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                row = self._rows.get(key)
+                if row is not None:
+                    results[i] = self._vectors[row].tolist()
+                    self.hits += 1
+                else:
+                    missing[key] = texts[i]
+                    self.misses += 1
+
+        if missing:
+            missing_keys = list(missing)
+            vectors = np.asarray(
+                self.underlying.embed_documents([missing[key] for key in missing_keys]),
+                dtype=np.float32
+            )
+            computed = {key: vectors[i].tolist() for i, key in enumerate(missing_keys)}
+
+            with self._lock:
+                new = [i for i, key in enumerate(missing_keys) if key not in self._rows]
+                if new:
+                    self._append([missing_keys[i] for i in new], vectors[new])
+
+            for i, key in enumerate(keys):
+                if results[i] is None:
+                    results[i] = computed[key]
+
+        return results
+
+    @staticmethod
+    def normalize_query(text: str) -> str:
+        """Chuẩn hóa query: Unicode NFC (tiếng Việt có thể gõ dạng tổ hợp) và gộp khoảng trắng"""
+        return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self.normalize_query(text)
+
+        with self._query_lock:
+            vector = self._query_cache.get(key)
+            if vector is not None:
+                self._query_cache.move_to_end(key)
+                self.query_hits += 1
+                return list(vector)
+            self.query_misses += 1
+
+        if self.query_batcher is not None:
+            vector = self.query_batcher.embed(key)
+        else:
+            vector = self.underlying.embed_query(key)
+
+        if self.query_cache_size > 0:
+            with self._query_lock:
+                self._query_cache[key] = vector
+                while len(self._query_cache) > self.query_cache_size:
+                    self._query_cache.popitem(last=False)
+        return list(vector)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed nhiều query trong 1 lần gọi model (query đã có trong LRU không embed lại)"""
+        keys = [self.normalize_query(text) for text in texts]
+        results: List[Optional[List[float]]] = [None] * len(keys)
+
+        with self._query_lock:
+            for i, key in enumerate(keys):
+                vector = self._query_cache.get(key)
+                if vector is not None:
+                    self._query_cache.move_to_end(key)
+                    self.query_hits += 1
+                    results[i] = list(vector)
+                else:
+                    self.query_misses += 1
+
+        missing = list(dict.fromkeys(key for i, key in enumerate(keys) if results[i] is None))
+        if missing:
+            # Model sentence-transformers embed query và document giống nhau
+            computed = dict(zip(missing, self.underlying.embed_documents(missing)))
+
+            if self.query_cache_size > 0:
+                with self._query_lock:
+                    for key, vector in computed.items():
+                        self._query_cache[key] = vector
+                    while len(self._query_cache) > self.query_cache_size:
+                        self._query_cache.popitem(last=False)
+
+            for i, key in enumerate(keys):
+                if results[i] is None:
+                    results[i] = list(computed[key])
+
+        return results
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "size": len(self._rows),
+            "evicted": self.evicted
+        }
+
+    def query_stats(self) -> Dict:
+        total = self.query_hits + self.query_misses
+        return {
+            "hits": self.query_hits,
+            "misses": self.query_misses,
+            "hit_rate": round(self.query_hits / total, 4) if total else 0.0,
+            "size": len(self._query_cache),
+            "max_size": self.query_cache_size
+        }
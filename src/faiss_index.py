@@ -0,0 +1,162 @@
+"""
+FAISS Index - Tạo, train và cấu hình các loại FAISS index
+flat: brute-force chính xác; ivf: IVF-Flat; hnsw: đồ thị HNSW; ivfpq: IVF với PQ codes (nén vectors)
+"""
+
+import os
+import math
+from typing import Callable, Optional
+
+import numpy as np
+import faiss
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq")
+
+
+class IndexConfig:
+    def __init__(
+        self,
+        index_type: str = "flat",
+        nlist: int = 0,
+        nprobe: int = 8,
+        hnsw_m: int = 32,
+        ef_construction: int = 80,
+        ef_search: int = 64,
+        pq_m: int = 16,
+        pq_nbits: int = 8,
+        train_sample: int = 50000
+    ):
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown FAISS index type '{index_type}', expected one of {INDEX_TYPES}")
+
+        self.index_type = index_type
+        self.nlist = nlist              # 0 = tự chọn theo số vectors
+        self.nprobe = nprobe
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.pq_m = pq_m                # số sub-quantizer, phải chia hết số chiều
+        self.pq_nbits = pq_nbits
+        self.train_sample = train_sample
+
+    @classmethod
+    def from_env(cls) -> "IndexConfig":
+        return cls(
+            index_type=os.getenv("FAISS_INDEX_TYPE", "flat").lower(),
+            nlist=int(os.getenv("FAISS_NLIST", 0)),
+            nprobe=int(os.getenv("FAISS_NPROBE", 8)),
+            hnsw_m=int(os.getenv("FAISS_HNSW_M", 32)),
+            ef_construction=int(os.getenv("FAISS_EF_CONSTRUCTION", 80)),
+            ef_search=int(os.getenv("FAISS_EF_SEARCH", 64)),
+            pq_m=int(os.getenv("FAISS_PQ_M", 16)),
+            pq_nbits=int(os.getenv("FAISS_PQ_NBITS", 8)),
+            train_sample=int(os.getenv("FAISS_TRAIN_SAMPLE", 50000))
+        )
+
+    def copy(self, **overrides) -> "IndexConfig":
+        values = dict(self.__dict__)
+        values.update(overrides)
+        return IndexConfig(**values)
+
+    def nlist_for(self, ntotal: int) -> int:
+        """Số cluster IVF: mặc định ~4*sqrt(N), mỗi cluster cần >= 39 điểm train"""
+        if self.nlist:
+            return self.nlist
+        return max(1, min(int(4 * math.sqrt(ntotal)), ntotal // 39))
+
+    def min_train_size(self, ntotal: int) -> int:
+        """Số vectors tối thiểu để train index (0 nếu không cần train)"""
+        if self.index_type == "ivf":
+            return self.nlist_for(ntotal)
+        if self.index_type == "ivfpq":
+            return max(self.nlist_for(ntotal), 2 ** self.pq_nbits)
+        return 0
+
+
+def resolve_config(config: IndexConfig, ntotal: int) -> IndexConfig:
+    """Dùng flat index khi chưa đủ vectors để train loại index đã cấu hình"""
+    if config.index_type != "flat" and ntotal < config.min_train_size(ntotal):
+        return config.copy(index_type="flat")
+    return config
+
+
+def index_type_of(index: faiss.Index) -> str:
+    """Loại index (theo INDEX_TYPES) của một FAISS index"""
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+
+def create_index(config: IndexConfig, dim: int, ntotal: int) -> faiss.Index:
+    """Tạo index rỗng (chưa train) - dùng L2 distance như index mặc định của LangChain"""
+    if config.index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, config.hnsw_m)
+        index.hnsw.efConstruction = config.ef_construction
+        return index
+
+    if config.index_type in ("ivf", "ivfpq"):
+        quantizer = faiss.IndexFlatL2(dim)
+        nlist = config.nlist_for(ntotal)
+        if config.index_type == "ivf":
+            return faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_L2)
+        if dim % config.pq_m:
+            raise ValueError(f"FAISS_PQ_M={config.pq_m} must divide embedding dimension {dim}")
+        return faiss.IndexIVFPQ(quantizer, dim, nlist, config.pq_m, config.pq_nbits)
+
+    return faiss.IndexFlatL2(dim)
+
+
+def apply_search_params(
+    index: faiss.Index,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None
+):
+    """Đặt runtime knobs: nprobe (IVF) và efSearch (HNSW)"""
+    if isinstance(index, faiss.IndexHNSW):
+        if ef_search:
+            index.hnsw.efSearch = ef_search
+    elif isinstance(index, faiss.IndexIVF):
+        if nprobe:
+            index.nprobe = min(nprobe, index.nlist)
+
+
+def build_index(
+    config: IndexConfig,
+    ntotal: int,
+    dim: int,
+    read_vectors: Callable[[np.ndarray], np.ndarray],
+    block_size: int = 4096,
+    seed: int = 1234
+) -> faiss.Index:
+    """
+    Build index theo config từ vectors đã có.
+    read_vectors(positions) trả về ma trận float32 của các vectors tại các vị trí đó;
+    vectors được thêm vào theo đúng thứ tự vị trí để giữ nguyên mapping vị trí -> docstore id
+    """
+    resolved = resolve_config(config, ntotal)
+    if resolved is not config:
+        print(
+            f"Only {ntotal} vectors, not enough to train '{config.index_type}' index "
+            f"(need {config.min_train_size(ntotal)}), using flat index"
+        )
+        config = resolved
+
+    index = create_index(config, dim, ntotal)
+
+    if not index.is_trained:
+        rng = np.random.default_rng(seed)
+        sample_size = min(ntotal, max(config.train_sample, config.min_train_size(ntotal)))
+        sample = np.sort(rng.choice(ntotal, size=sample_size, replace=False))
+        print(f"Training {config.index_type} index on {sample_size} of {ntotal} vectors...")
+        index.train(np.ascontiguousarray(read_vectors(sample), dtype=np.float32))
+
+    for start in range(0, ntotal, block_size):
+        positions = np.arange(start, min(start + block_size, ntotal))
+        index.add(np.ascontiguousarray(read_vectors(positions), dtype=np.float32))
+
+    apply_search_params(index, nprobe=config.nprobe, ef_search=config.ef_search)
+    return index
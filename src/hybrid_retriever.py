@@ -0,0 +1,30 @@
+"""
+Hybrid Retriever - Kết hợp vector search (FAISS) và BM25 (LexicalIndex) bằng reciprocal-rank fusion
+"""
+
+from typing import Any, Dict, List, Sequence
+
+from langchain.schema import Document
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], rrf_k: int = 60) -> List[str]:
+    """Gộp nhiều danh sách xếp hạng: score(id) = sum 1 / (rrf_k + rank)"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, 1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class HybridRetriever(BaseRetriever):
+    """Retriever cho QA chain: lấy fetch_k kết quả từ mỗi nguồn, trả về k chunks tốt nhất sau fusion"""
+
+    vector_store: Any
+    k: int = 4
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self.vector_store.hybrid_search(query, k=self.k)
@@ -0,0 +1,99 @@
+"""
+Index Manifest - Theo dõi hash nội dung file và chunk IDs trong vector store
+Cho phép rebuild incremental: chỉ re-embed file mới/thay đổi, xóa vector của file đã bị xóa
+"""
+
+import os
+import json
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+
+class IndexManifest:
+    FILENAME = "manifest.json"
+
+    def __init__(self, persist_directory: str = "./vector_db"):
+        self.persist_directory = persist_directory
+        self.path = os.path.join(persist_directory, self.FILENAME)
+        # {file_path: {"hash": sha256, "ids": [chunk_id, ...]}}
+        self.files: Dict[str, Dict] = {}
+
+    @staticmethod
+    def file_key(file_path: str) -> str:
+        """Chuẩn hóa đường dẫn file làm key trong manifest"""
+        return os.path.normpath(file_path)
+
+    @staticmethod
+    def file_hash(file_path: str, block_size: int = 1 << 20) -> str:
+        """Tính SHA-256 nội dung file (đọc theo block để không load cả file vào RAM)"""
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def chunk_ids(file_path: str, content_hash: str, count: int) -> List[str]:
+        """Tạo chunk IDs ổn định từ đường dẫn + hash nội dung"""
+        path_hash = hashlib.sha1(IndexManifest.file_key(file_path).encode("utf-8")).hexdigest()
+        prefix = f"{path_hash[:12]}-{content_hash[:12]}"
+        return [f"{prefix}-{i}" for i in range(count)]
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def load(self) -> bool:
+        """Load manifest từ disk"""
+        if not self.exists():
+            self.files = {}
+            return False
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.files = json.load(f).get("files", {})
+            return True
+        except Exception as e:
+            print(f"Error loading manifest: {e}")
+            self.files = {}
+            return False
+
+    def save(self):
+        """Lưu manifest vào disk (ghi file tạm rồi rename - không để lại manifest ghi dở)"""
+        os.makedirs(self.persist_directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"files": self.files}, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        self.files = {}
+
+    def get(self, file_path: str) -> Optional[Dict]:
+        return self.files.get(self.file_key(file_path))
+
+    def set(self, file_path: str, content_hash: str, ids: List[str]):
+        self.files[self.file_key(file_path)] = {"hash": content_hash, "ids": list(ids)}
+
+    def remove(self, file_path: str) -> List[str]:
+        """Xóa file khỏi manifest, trả về chunk IDs của file đó"""
+        entry = self.files.pop(self.file_key(file_path), None)
+        return entry["ids"] if entry else []
+
+    def diff(self, current: Dict[str, str]) -> Tuple[List[str], List[str], List[str]]:
+        """
+        So sánh manifest với trạng thái hiện tại của thư mục
+        current: {file_path: content_hash}
+        Trả về (added, modified, deleted)
+        """
+        current = {self.file_key(path): h for path, h in current.items()}
+
+        added = [path for path in current if path not in self.files]
+        modified = [
+            path for path, h in current.items()
+            if path in self.files and self.files[path]["hash"] != h
+        ]
+        deleted = [path for path in self.files if path not in current]
+
+        return added, modified, deleted
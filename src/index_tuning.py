@@ -0,0 +1,133 @@
+"""
+Index Tuning - Đo recall và latency của các loại FAISS index so với flat index (kết quả chính xác)
+Dùng để chọn FAISS_INDEX_TYPE, FAISS_NPROBE, FAISS_EF_SEARCH cho corpus hiện tại
+
+Chạy: python src/index_tuning.py [vector_db_path] [n_queries] [k]
+"""
+
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import faiss
+
+from faiss_index import apply_search_params, build_index
+from vector_store import VectorStore
+
+
+def _recall(found: np.ndarray, truth: np.ndarray) -> float:
+    """Recall@k trung bình: tỉ lệ kết quả đúng (theo flat index) được tìm thấy"""
+    k = truth.shape[1]
+    hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+    return hits / (len(truth) * k)
+
+
+def _timed_search(index: faiss.Index, queries: np.ndarray, k: int, repeat: int = 3):
+    """Search từng query một (như khi serve) và lấy thời gian tốt nhất trong `repeat` lần"""
+    best = float("inf")
+    indices = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = [index.search(queries[i:i + 1], k)[1][0] for i in range(len(queries))]
+        best = min(best, time.perf_counter() - start)
+        indices = np.asarray(results)
+    return indices, best * 1000 / len(queries)
+
+
+def recall_latency_report(
+    vector_store: VectorStore,
+    n_queries: int = 200,
+    k: int = 10,
+    index_types: Sequence[str] = ("ivf", "hnsw", "ivfpq"),
+    nprobe_values: Sequence[int] = (1, 2, 4, 8, 16, 32, 64),
+    ef_search_values: Sequence[int] = (16, 32, 64, 128, 256),
+    query_texts: Optional[List[str]] = None,
+    seed: int = 1234
+) -> List[Dict]:
+    """
+    So sánh recall@k và latency (ms/query) của từng loại index và từng giá trị nprobe/efSearch.
+    Ground truth là flat index trên vectors gốc (embed lại text trong docstore, hầu hết hit embedding cache).
+    Query mặc định là mẫu ngẫu nhiên các chunk trong corpus, hoặc query_texts nếu có
+    """
+    if vector_store.vectorstore is None:
+        raise ValueError("Vector store not initialized")
+
+    ntotal = len(vector_store.vectorstore.index_to_docstore_id)
+    vectors = vector_store.stored_vectors(range(ntotal))
+    dim = vectors.shape[1]
+
+    if query_texts:
+        queries = np.asarray(vector_store.embeddings.embed_queries(query_texts), dtype=np.float32)
+    else:
+        rng = np.random.default_rng(seed)
+        queries = vectors[rng.choice(ntotal, size=min(n_queries, ntotal), replace=False)]
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    k = min(k, ntotal)
+
+    flat = faiss.IndexFlatL2(dim)
+    flat.add(vectors)
+    truth, flat_latency = _timed_search(flat, queries, k)
+
+    report = [{
+        "index_type": "flat",
+        "param": None,
+        "value": None,
+        "recall": 1.0,
+        "latency_ms": round(flat_latency, 4),
+        "build_s": 0.0
+    }]
+
+    for index_type in index_types:
+        config = vector_store.index_config.copy(index_type=index_type)
+        start = time.time()
+        index = build_index(config, ntotal, dim, lambda positions: vectors[positions])
+        build_seconds = time.time() - start
+
+        if isinstance(index, faiss.IndexHNSW):
+            param, values = "ef_search", ef_search_values
+        elif isinstance(index, faiss.IndexIVF):
+            param, values = "nprobe", [v for v in nprobe_values if v <= index.nlist]
+        else:
+            # Không đủ vectors để train -> đã dùng flat, bỏ qua
+            continue
+
+        for value in values:
+            apply_search_params(index, **{param: value})
+            found, latency = _timed_search(index, queries, k)
+            report.append({
+                "index_type": index_type,
+                "param": param,
+                "value": value,
+                "recall": round(_recall(found, truth), 4),
+                "latency_ms": round(latency, 4),
+                "build_s": round(build_seconds, 2)
+            })
+
+    return report
+
+
+def print_report(report: List[Dict], k: int):
+    print(f"\n{'index':<8}{'param':<12}{'value':>8}{f'recall@{k}':>12}{'ms/query':>12}{'build s':>10}")
+    print("-" * 62)
+    for row in report:
+        print(
+            f"{row['index_type']:<8}{row['param'] or '-':<12}{str(row['value'] or '-'):>8}"
+            f"{row['recall']:>12.4f}{row['latency_ms']:>12.4f}{row['build_s']:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    import sys
+
+    db_path = sys.argv[1] if len(sys.argv) > 1 else "./vector_db"
+    n_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    k = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+
+    vector_store = VectorStore(persist_directory=db_path)
+    if not vector_store.load():
+        print(f"No vector store at {db_path}, build it first")
+        sys.exit(1)
+
+    report = recall_latency_report(vector_store, n_queries=n_queries, k=k)
+    print_report(report, k)
+    print(f"\nEmbedding cache: {vector_store.embedding_cache_stats()}")
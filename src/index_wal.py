@@ -0,0 +1,128 @@
+"""
+Index WAL - Write-ahead log cho các cập nhật index (upload tài liệu)
+Mỗi cập nhật (xóa chunks cũ + thêm chunks mới kèm vectors) được ghi thêm vào index.wal và fsync
+trước khi áp dụng vào index trong bộ nhớ; index chính chỉ được ghi lại toàn bộ khi checkpoint.
+Khởi động: load index chính rồi replay các bản ghi trong WAL
+
+Frame: length (uint32) + crc32 (uint32) + JSON; frame ghi dở (crash giữa chừng) bị bỏ qua khi đọc
+"""
+
+import os
+import json
+import time
+import zlib
+import base64
+import struct
+import threading
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+FRAME = struct.Struct("<II")
+
+
+def encode_vectors(vectors: List[List[float]]) -> str:
+    return base64.b64encode(np.asarray(vectors, dtype=np.float32).tobytes()).decode("ascii")
+
+
+def decode_vectors(data: str, count: int) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(data), dtype=np.float32).reshape(count, -1)
+
+
+class IndexWAL:
+    FILENAME = "index.wal"
+
+    def __init__(self, persist_directory: str):
+        self.persist_directory = persist_directory
+        self.path = os.path.join(persist_directory, self.FILENAME)
+
+        # Số bản ghi / bytes chưa checkpoint và thời điểm ghi bản ghi đầu tiên
+        self.records_count = 0
+        self.size_bytes = 0
+        self.first_record_at: Optional[float] = None
+        self.checkpoints = 0
+
+        self._file = None
+        self._lock = threading.Lock()
+
+    def append(self, record: Dict):
+        """Ghi 1 bản ghi và fsync - sau khi hàm trả về, cập nhật không bị mất khi crash"""
+        payload = json.dumps(record, ensure_ascii=False, default=str).encode("utf-8")
+        frame = FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+        with self._lock:
+            if self._file is None:
+                os.makedirs(self.persist_directory, exist_ok=True)
+                self._file = open(self.path, "ab")
+            self._file.write(frame)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+            self.records_count += 1
+            self.size_bytes += len(frame)
+            if self.first_record_at is None:
+                self.first_record_at = time.time()
+
+    def records(self) -> Iterator[Dict]:
+        """Đọc các bản ghi hợp lệ; phần đuôi ghi dở hoặc hỏng bị cắt bỏ khỏi file"""
+        if not os.path.exists(self.path):
+            return
+
+        valid_end = 0
+        count = 0
+        with open(self.path, "rb") as f:
+            while True:
+                header = f.read(FRAME.size)
+                if len(header) < FRAME.size:
+                    break
+                length, checksum = FRAME.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != checksum:
+                    break
+                try:
+                    record = json.loads(payload)
+                except ValueError:
+                    break
+                valid_end = f.tell()
+                count += 1
+                yield record
+
+        size = os.path.getsize(self.path)
+        if valid_end < size:
+            print(f"Write-ahead log: dropping {size - valid_end} bytes of incomplete records")
+            os.truncate(self.path, valid_end)
+
+        with self._lock:
+            self.records_count = count
+            self.size_bytes = valid_end
+            self.first_record_at = time.time() if count else None
+
+    def reset(self):
+        """Sau checkpoint: thay WAL bằng file rỗng (atomic rename)"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if os.path.exists(self.path):
+                tmp_path = self.path + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+
+            if self.records_count:
+                self.checkpoints += 1
+            self.records_count = 0
+            self.size_bytes = 0
+            self.first_record_at = None
+
+    def age(self) -> float:
+        """Số giây từ bản ghi chưa checkpoint đầu tiên"""
+        first = self.first_record_at
+        return time.time() - first if first is not None else 0.0
+
+    def stats(self) -> Dict:
+        return {
+            "records": self.records_count,
+            "size_mb": round(self.size_bytes / (1024 * 1024), 2),
+            "age_s": round(self.age(), 1),
+            "checkpoints": self.checkpoints
+        }
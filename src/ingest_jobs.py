@@ -0,0 +1,186 @@
+"""
+Ingest Jobs - Hàng đợi index tài liệu upload trong background
+Upload chỉ lưu file và trả về job ID ngay; worker threads chạy hàm index (parse, split, embed, save)
+và cập nhật trạng thái job: queued -> running -> done | failed
+"""
+
+import time
+import uuid
+import queue
+import threading
+import traceback
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from metrics import OPERATIONS, observe_stage
+
+# process(file_path, on_stage) -> kết quả (dict) của job
+ProcessFn = Callable[[str, Callable[[str], None]], Any]
+
+
+class QueueFull(Exception):
+    """Hàng đợi index đầy - client nên thử lại sau"""
+
+
+class IngestJob:
+    def __init__(self, file_path: str, filename: str):
+        self.id = uuid.uuid4().hex
+        self.file_path = file_path
+        self.filename = filename
+        self.state = "queued"
+        # Bước đang chạy của job (parsing, indexing, saving...) do hàm index báo về
+        self.stage: Optional[str] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.state in ("done", "failed")
+
+    def as_dict(self) -> Dict:
+        now = time.time()
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "state": self.state,
+            "stage": self.stage,
+            "result": self.result,
+            "error": self.error,
+            "submitted_at": self.submitted_at,
+            "queued_s": round((self.started_at or now) - self.submitted_at, 3),
+            "running_s": round((self.finished_at or now) - self.started_at, 3) if self.started_at else None
+        }
+
+
+class IngestJobQueue:
+    def __init__(
+        self,
+        process: ProcessFn,
+        workers: int = 2,
+        max_pending: int = 1000,
+        max_history: int = 1000
+    ):
+        self.process = process
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        # Số job đã xong được giữ lại để tra cứu trạng thái
+        self.max_history = max_history
+
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+        self._jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._queue: "queue.Queue[IngestJob]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+
+    def _start_workers(self):
+        # Worker threads chỉ tạo khi có job đầu tiên
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"ingest-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _pending(self) -> int:
+        # Gọi khi đang giữ _lock
+        return sum(1 for job in self._jobs.values() if not job.finished)
+
+    def check_capacity(self, count: int = 1):
+        """Raise QueueFull nếu không nhận thêm được count job - gọi trước khi lưu file upload"""
+        with self._lock:
+            pending = self._pending()
+            if pending + count > self.max_pending:
+                self.rejected += count
+                raise QueueFull(f"Too many documents waiting to be indexed ({pending})")
+
+    def submit(self, file_path: str, filename: Optional[str] = None) -> Dict:
+        """Đưa file vào hàng đợi index, raise QueueFull nếu quá max_pending job chưa xong"""
+        job = IngestJob(file_path, filename or file_path)
+        with self._lock:
+            pending = self._pending()
+            if pending >= self.max_pending:
+                self.rejected += 1
+                raise QueueFull(f"Too many documents waiting to be indexed ({pending})")
+            self._jobs[job.id] = job
+            self._evict()
+            self._start_workers()
+            snapshot = self._snapshot(job)
+        self._queue.put(job)
+        return snapshot
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return self._snapshot(job) if job else None
+
+    def recent(self, limit: int = 50) -> List[Dict]:
+        """Các job gần nhất (mới nhất trước)"""
+        with self._lock:
+            jobs = list(self._jobs.values())[-limit:]
+            return [self._snapshot(job) for job in reversed(jobs)]
+
+    def _snapshot(self, job: IngestJob) -> Dict:
+        # Gọi khi đang giữ _lock
+        data = job.as_dict()
+        if job.state == "queued":
+            data["queued_ahead"] = sum(
+                1 for other in self._jobs.values()
+                if other.state == "queued" and other.submitted_at < job.submitted_at
+            )
+        return data
+
+    def _evict(self):
+        # Bỏ job đã xong cũ nhất khi lịch sử vượt max_history (gọi khi đang giữ _lock)
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.max_history)]:
+            del self._jobs[job_id]
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            job.started_at = time.time()
+            job.state = "running"
+            observe_stage("ingest_queue_wait", job.started_at - job.submitted_at)
+
+            def on_stage(stage: str):
+                job.stage = stage
+
+            try:
+                result = self.process(job.file_path, on_stage)
+            except Exception as e:
+                traceback.print_exc()
+                job.error = str(e)
+                job.state = "failed"
+            else:
+                job.result = result
+                job.state = "done"
+            finally:
+                job.finished_at = time.time()
+                with self._lock:
+                    if job.state == "done":
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+                OPERATIONS.inc(operation="ingest_job", outcome="ok" if job.state == "done" else "error")
+                print(f"Ingest job {job.id} ({job.filename}) {job.state} in {job.finished_at - job.started_at:.2f}s")
+                self._queue.task_done()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            states: Dict[str, int] = {"queued": 0, "running": 0}
+            for job in self._jobs.values():
+                if not job.finished:
+                    states[job.state] += 1
+            return {
+                "workers": self.workers,
+                **states,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected
+            }
@@ -0,0 +1,158 @@
+"""
+Lexical Index - Inverted index BM25 trên text của chunks
+Bổ sung cho vector search với các truy vấn chứa từ khóa chính xác: số hiệu văn bản, mã biểu mẫu, mã sản phẩm...
+Tokenize tiếng Việt theo âm tiết + bigram (xấp xỉ từ ghép) + dạng bỏ dấu (người dùng gõ không dấu)
+"""
+
+import os
+import re
+import json
+import math
+import heapq
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Mã/số hiệu có ký tự nối: 01/2023/NĐ-CP, QĐ-123, BM.05, ISO-9001
+_CODE_PATTERN = re.compile(r"\w+(?:[-/.]\w+)+")
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+def fold_diacritics(text: str) -> str:
+    """Bỏ dấu tiếng Việt: 'nghỉ phép' -> 'nghi phep'"""
+    decomposed = unicodedata.normalize("NFD", text)
+    stripped = "".join(c for c in decomposed if unicodedata.category(c) != "Mn")
+    return stripped.replace("đ", "d").replace("Đ", "D")
+
+
+def tokenize(text: str) -> List[str]:
+    """Tokens cho BM25: mã nguyên vẹn, âm tiết, bigram âm tiết liền kề và âm tiết bỏ dấu"""
+    text = unicodedata.normalize("NFC", text).lower()
+
+    codes = _CODE_PATTERN.findall(text)
+    words = _WORD_PATTERN.findall(text)
+    tokens = codes + words
+    tokens.extend(f"{a}_{b}" for a, b in zip(words, words[1:]))
+    # Dạng bỏ dấu luôn được thêm (cả khi index lẫn khi query) để query không dấu vẫn khớp
+    tokens.extend(f"~{fold_diacritics(token)}" for token in codes + words)
+    return tokens
+
+
+class LexicalIndex:
+    # Tên file của store cũ; VectorStore lưu theo generation (lexical-<n>.json, truyền path vào save/load)
+    INDEX_FILE = "lexical_index.json"
+
+    def __init__(self, persist_directory: str, k1: float = 1.5, b: float = 0.75):
+        self.persist_directory = persist_directory
+        self.index_path = os.path.join(persist_directory, self.INDEX_FILE)
+        self.k1 = k1
+        self.b = b
+
+        # token -> {chunk_id: term frequency}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        # chunk_id -> {token: term frequency} (để xóa và lưu)
+        self._documents: Dict[str, Dict[str, int]] = {}
+        self._doc_lengths: Dict[str, int] = {}
+        self._total_length = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self._documents
+
+    def _index(self, chunk_id: str, term_freqs: Dict[str, int]):
+        if chunk_id in self._documents:
+            self._remove(chunk_id)
+        self._documents[chunk_id] = term_freqs
+        length = sum(term_freqs.values())
+        self._doc_lengths[chunk_id] = length
+        self._total_length += length
+        for token, tf in term_freqs.items():
+            self._postings.setdefault(token, {})[chunk_id] = tf
+
+    def _remove(self, chunk_id: str):
+        term_freqs = self._documents.pop(chunk_id, None)
+        if term_freqs is None:
+            return
+        self._total_length -= self._doc_lengths.pop(chunk_id)
+        for token in term_freqs:
+            posting = self._postings.get(token)
+            if posting is not None:
+                posting.pop(chunk_id, None)
+                if not posting:
+                    del self._postings[token]
+
+    def add(self, items: Iterable[Tuple[str, str]]):
+        """Thêm (chunk_id, text) vào index"""
+        with self._lock:
+            for chunk_id, text in items:
+                self._index(chunk_id, dict(Counter(tokenize(text))))
+
+    def delete(self, chunk_ids: Iterable[str]):
+        with self._lock:
+            for chunk_id in chunk_ids:
+                self._remove(chunk_id)
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+            self._documents.clear()
+            self._doc_lengths.clear()
+            self._total_length = 0
+
+    def search(self, query: str, k: int = 20) -> List[Tuple[str, float]]:
+        """Top-k (chunk_id, BM25 score)"""
+        query_tokens = set(tokenize(query))
+
+        with self._lock:
+            n = len(self._documents)
+            if not n or not query_tokens:
+                return []
+            avg_length = self._total_length / n
+
+            scores: Dict[str, float] = {}
+            for token in query_tokens:
+                posting = self._postings.get(token)
+                if not posting:
+                    continue
+                idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+                for chunk_id, tf in posting.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_lengths[chunk_id] / avg_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def exists(self) -> bool:
+        return os.path.exists(self.index_path)
+
+    def save(self, path: Optional[str] = None):
+        """Lưu forward index (chunk_id -> term frequencies); postings được dựng lại khi load. path mặc định: index_path"""
+        path = path or self.index_path
+        os.makedirs(self.persist_directory, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with self._lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": 1, "documents": self._documents}, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def load(self, path: Optional[str] = None) -> bool:
+        path = path or self.index_path
+        if not os.path.exists(path):
+            return False
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"Error loading lexical index: {e}")
+            return False
+
+        with self._lock:
+            self.clear()
+            for chunk_id, term_freqs in data.get("documents", {}).items():
+                self._index(chunk_id, term_freqs)
+        return True
@@ -0,0 +1,371 @@
+"""
+LLM Backend - Gọi nhiều endpoint OpenAI-compatible (vLLM) qua connection pool dùng chung
+Chọn endpoint đang xử lý ít request nhất, timeout cho từng request, retry có jitter
+và circuit breaker tạm ngừng gửi tới endpoint lỗi liên tục.
+Dùng làm client/async_client của ChatOpenAI (cùng interface chat.completions.create)
+"""
+
+import os
+import time
+import random
+import asyncio
+import threading
+from typing import Any, Dict, List, Optional
+
+import httpx
+import openai
+
+# Lỗi tạm thời - thử lại trên endpoint khác; lỗi còn lại (400, 401...) raise ngay
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,   # gồm cả APITimeoutError
+    openai.RateLimitError,
+    openai.InternalServerError
+)
+# Lỗi tính là endpoint không khỏe (circuit breaker), gồm cả lỗi kết nối giữa stream
+ENDPOINT_FAILURES = RETRYABLE_ERRORS + (httpx.TransportError,)
+
+
+def parse_base_urls(value: str) -> List[str]:
+    """'http://a:8000/v1, http://b:8000/v1' -> danh sách base URL"""
+    return [url.strip() for url in value.split(",") if url.strip()]
+
+
+class NoHealthyEndpoint(Exception):
+    """Tất cả endpoint đang bị circuit breaker chặn"""
+
+
+class CircuitBreaker:
+    """closed -> open sau failure_threshold lỗi liên tiếp -> half_open sau reset_timeout (cho 1 request thử)"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def release_probe(self):
+        """Request thử kết thúc mà không biết endpoint khỏe hay không (bị hủy)"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+class Endpoint:
+    def __init__(self, base_url: str, api_key: str, breaker: CircuitBreaker):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.breaker = breaker
+
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self._client: Optional[openai.OpenAI] = None
+        self._async_client: Optional[openai.AsyncOpenAI] = None
+
+    def stats(self) -> Dict:
+        return {
+            "base_url": self.base_url,
+            "state": self.breaker.state,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures
+        }
+
+
+class LLMBackend:
+    def __init__(
+        self,
+        base_urls: List[str],
+        api_key: str = "EMPTY",
+        timeout: float = 60,
+        connect_timeout: float = 5,
+        max_retries: int = 2,
+        backoff_base: float = 0.25,
+        backoff_max: float = 4,
+        max_connections: int = 64,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30
+    ):
+        if not base_urls:
+            raise ValueError("At least one LLM endpoint is required")
+
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections
+        )
+
+        self.endpoints = [
+            Endpoint(url.rstrip("/"), api_key, CircuitBreaker(failure_threshold, reset_timeout))
+            for url in base_urls
+        ]
+        self.retries = 0
+        self._lock = threading.Lock()
+
+        # Connection pool dùng chung cho mọi endpoint; async client tạo khi dùng lần đầu (trong event loop)
+        self._http_client = httpx.Client(limits=self.limits, timeout=self.timeout)
+        self._async_http_client: Optional[httpx.AsyncClient] = None
+
+        self.completions = _Completions(self)
+        self.async_completions = _AsyncCompletions(self)
+
+    @classmethod
+    def from_env(cls, base_urls: List[str], api_key: str = "EMPTY") -> "LLMBackend":
+        return cls(
+            base_urls,
+            api_key=api_key,
+            timeout=float(os.getenv("LLM_TIMEOUT", 60)),
+            connect_timeout=float(os.getenv("LLM_CONNECT_TIMEOUT", 5)),
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", 2)),
+            backoff_base=float(os.getenv("LLM_RETRY_BACKOFF", 0.25)),
+            max_connections=int(os.getenv("LLM_POOL_MAX_CONNECTIONS", 64)),
+            failure_threshold=int(os.getenv("LLM_CIRCUIT_FAILURES", 5)),
+            reset_timeout=float(os.getenv("LLM_CIRCUIT_RESET_SECONDS", 30))
+        )
+
+    def _client(self, endpoint: Endpoint) -> openai.OpenAI:
+        if endpoint._client is None:
+            # Retry do backend xử lý (đổi endpoint), không để SDK tự retry
+            endpoint._client = openai.OpenAI(
+                api_key=endpoint.api_key, base_url=endpoint.base_url,
+                timeout=self.timeout, max_retries=0, http_client=self._http_client
+            )
+        return endpoint._client
+
+    def _async_client(self, endpoint: Endpoint) -> openai.AsyncOpenAI:
+        if self._async_http_client is None:
+            self._async_http_client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout)
+        if endpoint._async_client is None:
+            endpoint._async_client = openai.AsyncOpenAI(
+                api_key=endpoint.api_key, base_url=endpoint.base_url,
+                timeout=self.timeout, max_retries=0, http_client=self._async_http_client
+            )
+        return endpoint._async_client
+
+    def _acquire(self, exclude: Optional[Endpoint] = None) -> Endpoint:
+        """Endpoint ít request đang xử lý nhất trong số endpoint circuit breaker cho phép"""
+        with self._lock:
+            candidates = sorted(
+                self.endpoints,
+                # Endpoint vừa lỗi xếp sau cùng; random để chia đều khi bằng nhau
+                key=lambda e: (e is exclude, e.outstanding, random.random())
+            )
+            for endpoint in candidates:
+                if endpoint.breaker.allow():
+                    endpoint.outstanding += 1
+                    endpoint.requests += 1
+                    return endpoint
+        raise NoHealthyEndpoint(f"All {len(self.endpoints)} LLM endpoints are unavailable")
+
+    def _release(self, endpoint: Endpoint, error: Optional[BaseException] = None):
+        with self._lock:
+            endpoint.outstanding -= 1
+            if isinstance(error, Exception):
+                endpoint.failures += 1
+        if isinstance(error, ENDPOINT_FAILURES):
+            endpoint.breaker.record_failure()
+        elif error is None or isinstance(error, openai.APIStatusError):
+            # Endpoint vẫn trả lời (kể cả lỗi 4xx do request)
+            endpoint.breaker.record_success()
+        else:
+            # Client ngắt kết nối / request bị hủy
+            endpoint.breaker.release_probe()
+
+    def _backoff(self, attempt: int) -> float:
+        """Full jitter: ngẫu nhiên trong [0, min(backoff_max, base * 2^attempt)]"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def create(self, **kwargs) -> Any:
+        endpoint = None
+        for attempt in range(self.max_retries + 1):
+            endpoint = self._acquire(exclude=endpoint)
+            try:
+                response = self._client(endpoint).chat.completions.create(**kwargs)
+            except RETRYABLE_ERRORS as e:
+                self._release(endpoint, e)
+                if attempt == self.max_retries:
+                    raise
+                print(f"LLM request to {endpoint.base_url} failed ({type(e).__name__}), retrying")
+                with self._lock:
+                    self.retries += 1
+                time.sleep(self._backoff(attempt))
+                continue
+            except BaseException as e:
+                self._release(endpoint, e)
+                raise
+
+            if kwargs.get("stream"):
+                # Request còn "outstanding" cho tới khi đọc hết stream hoặc stream bị đóng/thu hồi
+                return _TrackedStream(self, endpoint, response)
+            self._release(endpoint)
+            return response
+
+    async def acreate(self, **kwargs) -> Any:
+        endpoint = None
+        for attempt in range(self.max_retries + 1):
+            endpoint = self._acquire(exclude=endpoint)
+            try:
+                response = await self._async_client(endpoint).chat.completions.create(**kwargs)
+            except RETRYABLE_ERRORS as e:
+                self._release(endpoint, e)
+                if attempt == self.max_retries:
+                    raise
+                print(f"LLM request to {endpoint.base_url} failed ({type(e).__name__}), retrying")
+                with self._lock:
+                    self.retries += 1
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+            except BaseException as e:
+                self._release(endpoint, e)
+                raise
+
+            if kwargs.get("stream"):
+                return _AsyncTrackedStream(self, endpoint, response)
+            self._release(endpoint)
+            return response
+
+    def stats(self) -> Dict:
+        return {
+            "retries": self.retries,
+            "endpoints": [endpoint.stats() for endpoint in self.endpoints]
+        }
+
+
+class _Completions:
+    """Interface giống openai.OpenAI().chat.completions - truyền vào ChatOpenAI(client=...)"""
+
+    def __init__(self, backend: LLMBackend):
+        self.backend = backend
+
+    def create(self, **kwargs) -> Any:
+        return self.backend.create(**kwargs)
+
+
+class _AsyncCompletions:
+    def __init__(self, backend: LLMBackend):
+        self.backend = backend
+
+    async def create(self, **kwargs) -> Any:
+        return await self.backend.acreate(**kwargs)
+
+
+class _TrackedStream:
+    """Stream chunks; giải phóng endpoint đúng 1 lần khi đọc hết, lỗi giữa chừng (không retry - tokens đã gửi đi),
+    close() / thoát with, hoặc khi bị thu hồi mà chưa đọc (__del__) - nếu không outstanding bị tính thừa mãi"""
+
+    def __init__(self, backend: LLMBackend, endpoint: Endpoint, stream: Any):
+        self.backend = backend
+        self.endpoint = endpoint
+        self.stream = stream
+        self._released = False
+
+    def _finish(self, error: Optional[BaseException] = None):
+        with self.backend._lock:
+            if self._released:
+                return
+            self._released = True
+        self.backend._release(self.endpoint, error)
+
+    def __iter__(self):
+        error = None
+        try:
+            for chunk in self.stream:
+                yield chunk
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._finish(error)
+
+    def close(self):
+        """Đóng kết nối HTTP và giải phóng endpoint (stream bị bỏ dở tính như request bị hủy)"""
+        try:
+            close = getattr(self.stream, "close", None)
+            if close is not None:
+                close()
+        finally:
+            self._finish(GeneratorExit())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        self._finish(GeneratorExit())
+
+
+class _AsyncTrackedStream:
+    def __init__(self, backend: LLMBackend, endpoint: Endpoint, stream: Any):
+        self.backend = backend
+        self.endpoint = endpoint
+        self.stream = stream
+        self._released = False
+
+    def _finish(self, error: Optional[BaseException] = None):
+        with self.backend._lock:
+            if self._released:
+                return
+            self._released = True
+        self.backend._release(self.endpoint, error)
+
+    async def __aiter__(self):
+        error = None
+        try:
+            async for chunk in self.stream:
+                yield chunk
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._finish(error)
+
+    async def close(self):
+        try:
+            close = getattr(self.stream, "close", None)
+            if close is not None:
+                await close()
+        finally:
+            self._finish(GeneratorExit())
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def __del__(self):
+        # Không await được close() ở đây; chỉ trả lại slot outstanding
+        self._finish(GeneratorExit())
@@ -0,0 +1,157 @@
+"""
+LLM Stub Server - Endpoint OpenAI-compatible giả lập để thử LLM backend, benchmark và load test
+Trả lời cố định, có thể cấu hình độ trễ token đầu, độ trễ mỗi token và tỉ lệ lỗi 500
+
+Chạy: python src/llm_stub_server.py [port] [latency_s] [fail_rate]
+"""
+
+import json
+import time
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+DEFAULT_ANSWER = "Theo tài liệu nội bộ, nhân viên chính thức được nghỉ phép năm 12 ngày."
+
+
+class StubLLMServer:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8001,
+        latency: float = 0.0,
+        token_delay: float = 0.0,
+        fail_rate: float = 0.0,
+        answer: str = DEFAULT_ANSWER
+    ):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.token_delay = token_delay
+        self.fail_rate = fail_rate
+        self.answer = answer
+
+        self.requests = 0
+        self.failures = 0
+        self.last_request: Optional[Dict] = None
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def start(self) -> "StubLLMServer":
+        """Chạy server trong background thread (port=0 -> chọn port trống)"""
+        self._server = ThreadingHTTPServer((self.host, self.port), self._handler())
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name="llm-stub", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, payload: Dict):
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path.rstrip("/").endswith("/models"):
+                    self._send_json(200, {"object": "list", "data": [{"id": "stub", "object": "model"}]})
+                else:
+                    self._send_json(404, {"error": {"message": "Not found"}})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                with stub._lock:
+                    stub.requests += 1
+                    stub.last_request = request
+                    fail = random.random() < stub.fail_rate
+                    if fail:
+                        stub.failures += 1
+
+                time.sleep(stub.latency)
+                if fail:
+                    self._send_json(500, {"error": {"message": "Stub failure", "type": "server_error"}})
+                    return
+
+                model = request.get("model", "stub")
+                if request.get("stream"):
+                    self._stream(model)
+                else:
+                    self._send_json(200, {
+                        "id": "chatcmpl-stub",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [{
+                            "index": 0,
+                            "message": {"role": "assistant", "content": stub.answer},
+                            "finish_reason": "stop"
+                        }],
+                        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+                    })
+
+            def _stream(self, model: str):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+
+                words = stub.answer.split(" ")
+                for i, word in enumerate(words):
+                    self._chunk(model, {"content": word if i == 0 else " " + word}, None)
+                    time.sleep(stub.token_delay)
+                self._chunk(model, {}, "stop")
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+            def _chunk(self, model: str, delta: Dict, finish_reason: Optional[str]):
+                chunk = {
+                    "id": "chatcmpl-stub",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+                }
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import sys
+
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8001
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+    fail_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0
+
+    server = StubLLMServer(host="0.0.0.0", port=port, latency=latency, token_delay=0.02, fail_rate=fail_rate)
+    server.start()
+    print(f"Stub LLM server at http://0.0.0.0:{server.port}/v1 (latency {latency}s, fail rate {fail_rate})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
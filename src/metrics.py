@@ -0,0 +1,188 @@
+"""
+Metrics - Counters và latency histograms cho pipeline RAG, xuất theo Prometheus text format
+Mỗi bước (embed query, FAISS search, condense, LLM, format sources...) được đo bằng span(stage)
+và ghi vào histogram mechat_stage_seconds{stage="..."}; /api/metrics trả về render()
+"""
+
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+LabelValues = Tuple[Tuple[str, str], ...]
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+
+def _labels(labels: Dict[str, str]) -> LabelValues:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: LabelValues, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in items) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        # labels -> (số lần rơi vào từng bucket (không cộng dồn), sum, count)
+        self._values: Dict[LabelValues, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _labels(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = ("le", _format_value(bound))
+                    lines.append(f"{self.name}_bucket{_format_labels(labels, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(round(total, 6))}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """count / avg theo labels - dùng cho /api/stats và benchmark"""
+        with self._lock:
+            return {
+                ",".join(f"{key}={value}" for key, value in labels) or "all": {
+                    "count": count,
+                    "avg": round(total / count, 6) if count else 0.0
+                }
+                for labels, (_, total, count) in self._values.items()
+            }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str) -> Counter:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Counter(name, help)
+            return self._metrics[name]
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(name, help, buckets)
+            return self._metrics[name]
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "mechat_stage_seconds", "Thời gian từng bước của pipeline (embed, search, condense, llm, ...)"
+)
+OPERATIONS = REGISTRY.counter(
+    "mechat_operations_total", "Số lần gọi chat/search/add_document/rebuild theo kết quả"
+)
+PROMPT_TOKENS = REGISTRY.histogram(
+    "mechat_prompt_tokens", "Số token prompt gửi tới LLM trả lời mỗi request", TOKEN_BUCKETS
+)
+COMPLETION_TOKENS = REGISTRY.histogram(
+    "mechat_completion_tokens", "Số token câu trả lời của LLM mỗi request", TOKEN_BUCKETS
+)
+TOKENS = REGISTRY.counter("mechat_llm_tokens_total", "Tổng số token prompt/completion của LLM trả lời")
+
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+
+
+@contextmanager
+def span(stage: str):
+    """Đo thời gian 1 bước (kể cả khi lỗi) vào mechat_stage_seconds{stage=...}"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+@contextmanager
+def operation(name: str):
+    """
+    Span tổng của 1 thao tác + đếm mechat_operations_total{operation, outcome}
+    outcome mặc định ok, error khi có exception; caller có thể đặt lại qua dict được yield
+    """
+    start = time.perf_counter()
+    result = {"outcome": "ok"}
+    try:
+        yield result
+    except BaseException:
+        result["outcome"] = "error"
+        raise
+    finally:
+        observe_stage(name, time.perf_counter() - start)
+        OPERATIONS.inc(operation=name, outcome=result["outcome"])
+
+
+def record_tokens(prompt_tokens: Optional[int], completion_tokens: Optional[int]):
+    if prompt_tokens is not None:
+        PROMPT_TOKENS.observe(prompt_tokens)
+        TOKENS.inc(prompt_tokens, kind="prompt")
+    if completion_tokens is not None:
+        COMPLETION_TOKENS.observe(completion_tokens)
+        TOKENS.inc(completion_tokens, kind="completion")
@@ -0,0 +1,97 @@
+"""
+Reranker - Xếp hạng lại các chunk ứng viên bằng cross-encoder chạy trên CPU
+Retriever lấy top-N ứng viên, cross-encoder chấm điểm (query, chunk) theo batch và chỉ giữ top-k đưa vào prompt;
+quá thời gian cho phép thì dùng lại thứ tự ban đầu (vector/hybrid)
+"""
+
+import time
+import threading
+from typing import Any, Dict, List
+
+from langchain.schema import Document
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+
+from metrics import observe_stage
+
+
+class Reranker:
+    def __init__(
+        self,
+        model_name: str = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1",
+        batch_size: int = 16,
+        time_budget_ms: float = 300,
+        max_length: int = 512
+    ):
+        from sentence_transformers import CrossEncoder
+
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.time_budget_ms = time_budget_ms
+        self.model = CrossEncoder(model_name, max_length=max_length, device="cpu")
+
+        self.calls = 0
+        self.fallbacks = 0
+        self.total_ms = 0.0
+        self._lock = threading.Lock()
+
+    def rerank(self, query: str, documents: List[Document], top_k: int) -> List[Document]:
+        """top_k documents theo điểm cross-encoder; hết time budget thì giữ thứ tự ban đầu"""
+        if len(documents) <= 1:
+            return documents[:top_k]
+
+        start = time.perf_counter()
+        deadline = start + self.time_budget_ms / 1000
+        scores: List[float] = []
+        timed_out = False
+
+        for i in range(0, len(documents), self.batch_size):
+            if time.perf_counter() > deadline:
+                timed_out = True
+                break
+            batch = documents[i:i + self.batch_size]
+            scores.extend(
+                float(score) for score in
+                self.model.predict([(query, doc.page_content) for doc in batch], batch_size=len(batch))
+            )
+
+        # Batch cuối có thể làm vượt budget - vẫn dùng kết quả vì đã tính xong
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        observe_stage("rerank", elapsed_ms / 1000)
+        with self._lock:
+            self.calls += 1
+            self.total_ms += elapsed_ms
+            if timed_out:
+                self.fallbacks += 1
+
+        if timed_out:
+            print(f"Rerank exceeded {self.time_budget_ms}ms budget, using retriever order")
+            return documents[:top_k]
+
+        order = sorted(range(len(documents)), key=lambda i: scores[i], reverse=True)
+        return [documents[i] for i in order[:top_k]]
+
+    def stats(self) -> Dict:
+        return {
+            "model": self.model_name,
+            "calls": self.calls,
+            "fallbacks": self.fallbacks,
+            "avg_ms": round(self.total_ms / self.calls, 2) if self.calls else 0.0,
+            "time_budget_ms": self.time_budget_ms
+        }
+
+
+class RerankingRetriever(BaseRetriever):
+    """Lấy ứng viên từ base_retriever (top-N) rồi rerank, trả về k chunks tốt nhất"""
+
+    base_retriever: BaseRetriever
+    reranker: Any
+    k: int = 4
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        candidates = self.base_retriever.get_relevant_documents(
+            query, callbacks=run_manager.get_child()
+        )
+        return self.reranker.rerank(query, candidates, self.k)
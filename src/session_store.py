@@ -0,0 +1,104 @@
+"""
+Session Store - Lưu memory hội thoại riêng cho từng conversation_id
+Giới hạn số session (LRU) và thời gian không hoạt động (TTL) để bộ nhớ không tăng vô hạn
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from langchain.memory import ConversationBufferMemory
+from langchain.memory.chat_memory import BaseChatMemory
+
+from token_counter import count_tokens
+
+
+class TokenWindowMemory(ConversationBufferMemory):
+    """Buffer memory chỉ giữ các lượt hội thoại gần nhất trong max_token_limit token"""
+    
+    max_token_limit: int = 1000
+    
+    def save_context(self, inputs: Dict, outputs: Dict) -> None:
+        super().save_context(inputs, outputs)
+        
+        messages = self.chat_memory.messages
+        total = sum(count_tokens(message.content) for message in messages)
+        # Xóa theo từng cặp hỏi-đáp cũ nhất cho tới khi nằm trong budget
+        while messages and total > self.max_token_limit:
+            for _ in range(min(2, len(messages))):
+                total -= count_tokens(messages.pop(0).content)
+
+
+class SessionStore:
+    def __init__(
+        self,
+        memory_factory: Callable[[], BaseChatMemory],
+        max_sessions: int = 1000,
+        ttl_seconds: float = 3600
+    ):
+        self.memory_factory = memory_factory
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+
+        # conversation_id -> (memory, last_access), thứ tự = ít dùng gần đây nhất trước
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, conversation_id: str) -> BaseChatMemory:
+        """Lấy memory của conversation, tạo mới nếu chưa có hoặc đã hết hạn"""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+
+            entry = self._sessions.pop(conversation_id, None)
+            memory = entry[0] if entry else self.memory_factory()
+            self._sessions[conversation_id] = (memory, now)
+
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+            return memory
+
+    def history(self, conversation_id: str) -> List:
+        """Lịch sử hội thoại (đã cắt theo token budget) của conversation"""
+        memory = self.get(conversation_id)
+        # Copy - memory trả về chính list messages, sẽ thay đổi khi save lượt tiếp theo
+        return list(memory.load_memory_variables({})[memory.memory_key])
+
+    def save(self, conversation_id: str, question: str, answer: str):
+        """Lưu 1 lượt hỏi-đáp vào memory của conversation"""
+        memory = self.get(conversation_id)
+        memory.save_context({"question": question}, {"answer": answer})
+
+    def messages(self, conversation_id: str) -> Optional[List]:
+        """Messages (đã cắt theo token budget) của conversation, None nếu không có hoặc đã hết hạn - không tạo session mới"""
+        with self._lock:
+            self._evict_expired(time.monotonic())
+            entry = self._sessions.get(conversation_id)
+        if entry is None:
+            return None
+        return list(entry[0].chat_memory.messages)
+
+    def reset(self, conversation_id: str):
+        with self._lock:
+            self._sessions.pop(conversation_id, None)
+
+    def _evict_expired(self, now: float):
+        # Sessions được sắp theo thời gian truy cập -> chỉ cần xóa từ đầu tới session còn hạn đầu tiên
+        while self._sessions:
+            conversation_id, (_, last_access) = next(iter(self._sessions.items()))
+            if now - last_access <= self.ttl_seconds:
+                break
+            del self._sessions[conversation_id]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "ttl_seconds": self.ttl_seconds
+            }
+
+    def __len__(self) -> int:
+        return len(self._sessions)
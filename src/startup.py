@@ -0,0 +1,107 @@
+"""
+Startup - Khởi tạo thành phần nặng (embedding model, FAISS index, LLM chain) trong background thread
+Server bind port ngay, health check (liveness) trả lời ngay; readiness chỉ OK khi đã load xong
+"""
+
+import time
+import asyncio
+import threading
+import traceback
+from contextlib import contextmanager
+from typing import Callable, Dict, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class NotReady(Exception):
+    """Thành phần chưa khởi tạo xong (hoặc khởi tạo lỗi)"""
+
+
+class BackgroundLoader(Generic[T]):
+    def __init__(self, factory: Callable[[], T], name: str = "component"):
+        self.factory = factory
+        self.name = name
+
+        self.state = "pending"   # pending -> loading -> ready | failed
+        self.error: Optional[str] = None
+        # Thời gian (giây) từng phase khởi tạo, factory ghi vào qua phase() hoặc truyền dict này đi
+        self.phases: Dict[str, float] = {}
+
+        self._value: Optional[T] = None
+        self._started_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self) -> "BackgroundLoader[T]":
+        """Bắt đầu khởi tạo trong background (gọi nhiều lần không sao)"""
+        with self._lock:
+            if self.state != "pending":
+                return self
+            self.state = "loading"
+            self._started_at = time.time()
+
+        threading.Thread(target=self._run, name=f"{self.name}-loader", daemon=True).start()
+        return self
+
+    def _run(self):
+        try:
+            value = self.factory()
+        except Exception as e:
+            traceback.print_exc()
+            self.error = str(e)
+            self.state = "failed"
+        else:
+            self._value = value
+            self.state = "ready"
+        finally:
+            self._finished_at = time.time()
+            print(f"{self.name} {self.state} in {self._finished_at - self._started_at:.2f}s: {self.phases}")
+            self._done.set()
+
+    @contextmanager
+    def phase(self, name: str):
+        """Đo thời gian một phase khởi tạo"""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.phases[name] = round(time.time() - start, 3)
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def _result(self) -> T:
+        if self.state == "ready":
+            return self._value
+        if self.state == "failed":
+            raise NotReady(f"{self.name} failed to start: {self.error}")
+        raise NotReady(f"{self.name} is starting up, please retry shortly")
+
+    def get(self, timeout: Optional[float] = None) -> T:
+        """Lấy thành phần đã khởi tạo, chờ tối đa timeout giây (khởi tạo nếu chưa bắt đầu)"""
+        self.start()
+        self._done.wait(timeout)
+        return self._result()
+
+    async def aget(self, timeout: Optional[float] = None) -> T:
+        """Bản async của get - không block event loop khi chờ"""
+        self.start()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._done.is_set():
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            await asyncio.sleep(0.05)
+        return self._result()
+
+    def status(self) -> Dict:
+        elapsed = None
+        if self._started_at is not None:
+            elapsed = round((self._finished_at or time.time()) - self._started_at, 3)
+        return {
+            "state": self.state,
+            "elapsed_s": elapsed,
+            "phases": dict(self.phases),
+            "error": self.error
+        }
@@ -0,0 +1,55 @@
+"""
+Token Counter - Đếm token bằng tiktoken
+Model local (Qwen) không có tokenizer trong tiktoken nên dùng encoding gần đúng (cl100k_base);
+nếu không load được encoding (môi trường offline) thì ước lượng theo số ký tự
+"""
+
+import os
+import threading
+
+_encoding = None
+_encoding_loaded = False
+_lock = threading.Lock()
+
+
+def get_encoding():
+    """Load tiktoken encoding 1 lần, trả về None nếu không khả dụng"""
+    global _encoding, _encoding_loaded
+    if _encoding_loaded:
+        return _encoding
+
+    with _lock:
+        if not _encoding_loaded:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding(os.getenv("TOKENIZER_ENCODING", "cl100k_base"))
+            except Exception as e:
+                print(f"Tokenizer not available, using approximate token count: {e}")
+                _encoding = None
+            _encoding_loaded = True
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Số token của text"""
+    if not text:
+        return 0
+    encoding = get_encoding()
+    if encoding is None:
+        # ~4 ký tự / token
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Cắt text còn tối đa max_tokens token"""
+    if max_tokens <= 0:
+        return ""
+    encoding = get_encoding()
+    if encoding is None:
+        return text[:max_tokens * 4]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    # Bỏ ký tự lỗi ở chỗ cắt (token giữa một ký tự UTF-8 nhiều byte)
+    return encoding.decode(tokens[:max_tokens]).rstrip("�")
@@ -4,79 +4,655 @@ Sử dụng FAISS cho performance tốt hơn với large dataset
 """
 
 import os
+import copy
+import json
+import time
+import uuid
 import pickle
-from typing import List, Optional
+import numpy as np
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 from langchain.schema import Document
 from langchain_community.vectorstores import FAISS
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain.embeddings.base import Embeddings
 
+from chunk_store import INDEX_FILE as CHUNK_INDEX_FILE, ChunkDocstore, ChunkStore
+from concurrency import ReadWriteLock
+from embedding_cache import CachedEmbeddings
+from embedding_batcher import EmbeddingBatcher
+from metrics import span
+from faiss_index import IndexConfig, apply_search_params, build_index, index_type_of, resolve_config
+from hybrid_retriever import HybridRetriever, reciprocal_rank_fusion
+from lexical_index import LexicalIndex
+from index_wal import IndexWAL, decode_vectors, encode_vectors
+
 
 class VectorStore:
+    EMBEDDING_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+    # Con trỏ tới generation đã commit (tên file index, chunk store, lexical index) - thay file này là commit point của save()
+    CURRENT_FILE = "CURRENT"
+    # Tên file của store cũ (trước khi có CURRENT)
+    LEGACY_FILES = {"index": "index.faiss", "chunks": CHUNK_INDEX_FILE, "lexical": LexicalIndex.INDEX_FILE}
+    
     def __init__(self, persist_directory: str = "./vector_db"):
         self.persist_directory = persist_directory
+        # Số chunks embed mỗi lần - giới hạn bộ nhớ khi index corpus lớn
+        self.batch_size = int(os.getenv("EMBED_BATCH_SIZE", 256))
+        # Loại FAISS index (flat/ivf/hnsw/ivfpq) và các tham số train/search
+        self.index_config = IndexConfig.from_env()
+        # IVF/HNSW: chunk bị xóa để lại label trống (IVF: đã remove_ids, HNSW: tombstone còn trong đồ thị);
+        # index chỉ được build lại (compaction) khi tỉ lệ label trống vượt INDEX_COMPACT_RATIO
+        self.compact_ratio = float(os.getenv("INDEX_COMPACT_RATIO", 0.2))
+        self._holes = 0
+        # Load index bằng memory-map (read-only, chia sẻ page cache giữa các worker)
+        self.mmap = os.getenv("VECTOR_STORE_MMAP", "false").lower() == "true"
+        self._index_mmapped = False
+        # Hybrid search: BM25 (LexicalIndex) + vector, gộp bằng reciprocal-rank fusion
+        self.lexical_index = None
+        if os.getenv("HYBRID_SEARCH", "true").lower() == "true":
+            self.lexical_index = LexicalIndex(persist_directory)
+        self.hybrid_fetch_k = int(os.getenv("HYBRID_FETCH_K", 20))
+        self.rrf_k = int(os.getenv("HYBRID_RRF_K", 60))
+        # Upload ghi vào write-ahead log, index chính chỉ ghi lại khi checkpoint (theo kích thước/số bản ghi/thời gian)
+        self.wal = None
+        if os.getenv("INDEX_WAL_ENABLED", "true").lower() == "true":
+            self.wal = IndexWAL(persist_directory)
+        self.wal_max_bytes = float(os.getenv("INDEX_WAL_MAX_MB", 64)) * 1024 * 1024
+        self.wal_max_records = int(os.getenv("INDEX_WAL_MAX_RECORDS", 1000))
+        self.wal_checkpoint_seconds = float(os.getenv("INDEX_WAL_CHECKPOINT_SECONDS", 300))
+        # Thông tin (info) của các cập nhật được replay từ WAL ở lần load gần nhất
+        self.replayed_updates: List[Dict] = []
+        # Generation đã commit và các file của nó
+        self.generation = 0
+        self._files: Dict[str, Optional[str]] = dict(self.LEGACY_FILES)
+        # Search giữ read lock; thay đổi index/mapping/docstore trong bộ nhớ giữ write lock.
+        # Các thao tác ghi được gọi tuần tự (MEChatbot._index_lock), phần nặng (embed, train index) chạy ngoài write lock
+        self._lock = ReadWriteLock()
         self.embeddings = self._initialize_embeddings()
         self.vectorstore = None
         
     def _initialize_embeddings(self) -> Embeddings:
-        """Initialize embedding model - sử dụng multilingual model cho tiếng Việt"""
-        return HuggingFaceEmbeddings(
-            model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
+        """Initialize embedding model - sử dụng multilingual model cho tiếng Việt, có cache trên disk"""
+        model = HuggingFaceEmbeddings(
+            model_name=self.EMBEDDING_MODEL,
             model_kwargs={'device': 'cpu'},
             encode_kwargs={'normalize_embeddings': True}
         )
+        # Gom query embedding của các request đồng thời thành 1 batch
+        batcher = None
+        if os.getenv("EMBED_QUERY_BATCHING", "true").lower() == "true":
+            batcher = EmbeddingBatcher(
+                model.embed_documents,
+                max_batch_size=int(os.getenv("EMBED_QUERY_BATCH_SIZE", 32)),
+                max_wait_ms=float(os.getenv("EMBED_QUERY_MAX_WAIT_MS", 5))
+            )
+        return CachedEmbeddings(
+            model,
+            cache_directory=os.path.join(self.persist_directory, "embedding_cache"),
+            model_name=self.EMBEDDING_MODEL,
+            query_cache_size=int(os.getenv("QUERY_CACHE_SIZE", 2048)),
+            query_batcher=batcher,
+            max_size_mb=float(os.getenv("EMBED_CACHE_MAX_MB", 2048))
+        )
+    
+    def embedding_cache_stats(self) -> dict:
+        """Hit/miss counters của embedding cache"""
+        return self.embeddings.stats()
     
-    def create_vectorstore(self, documents: List[Document]) -> FAISS:
+    def query_cache_stats(self) -> dict:
+        """Hit/miss counters của query embedding LRU cache"""
+        return self.embeddings.query_stats()
+    
+    def embedding_batcher_stats(self) -> Optional[dict]:
+        """Số request / số batch của query embedding batcher"""
+        batcher = self.embeddings.query_batcher
+        return batcher.stats() if batcher is not None else None
+    
+    def create_vectorstore(
+        self, 
+        documents: List[Document],
+        ids: Optional[List[str]] = None
+    ) -> FAISS:
         """Tạo vector store từ documents"""
         if not documents:
             raise ValueError("No documents provided")
         
         print(f"Creating vector store from {len(documents)} documents...")
-        self.vectorstore = FAISS.from_documents(
-            documents=documents,
-            embedding=self.embeddings
-        )
+        self.vectorstore = None
+        self._add_in_batches(documents, ids)
+        self.build_index()
+        print(f"Embedding cache: {self.embedding_cache_stats()}")
         
         return self.vectorstore
     
-    def add_documents(self, documents: List[Document]):
+    def add_documents(
+        self, 
+        documents: List[Document],
+        ids: Optional[List[str]] = None
+    ):
         """Thêm documents vào vector store hiện tại"""
         if self.vectorstore is None:
-            self.vectorstore = self.create_vectorstore(documents)
+            self.vectorstore = self.create_vectorstore(documents, ids=ids)
+        else:
+            self._add_in_batches(documents, ids)
+            print(f"Embedding cache: {self.embedding_cache_stats()}")
+    
+    @span("embed_and_index")
+    def _add_in_batches(
+        self, 
+        documents: List[Document],
+        ids: Optional[List[str]] = None
+    ):
+        """Embed và thêm vào index theo từng batch cố định"""
+        self._ensure_writable()
+        # Tự sinh IDs để lexical index dùng chung ID với docstore
+        ids = ids or [str(uuid.uuid4()) for _ in documents]
+        
+        for start in range(0, len(documents), self.batch_size):
+            batch = documents[start:start + self.batch_size]
+            batch_ids = ids[start:start + self.batch_size]
+            
+            if self.vectorstore is None:
+                vectorstore = FAISS.from_documents(
+                    documents=batch,
+                    embedding=self.embeddings,
+                    ids=batch_ids
+                )
+                with self._lock.write():
+                    self.vectorstore = vectorstore
+                    if self.lexical_index is not None:
+                        self.lexical_index.clear()
+            else:
+                texts = [doc.page_content for doc in batch]
+                self._add_embeddings(
+                    texts, self.embeddings.embed_documents(texts), [doc.metadata for doc in batch], batch_ids
+                )
+            
+            if self.lexical_index is not None:
+                self.lexical_index.add(zip(batch_ids, (doc.page_content for doc in batch)))
+    
+    def add_documents_stream(
+        self,
+        items: Iterable[Tuple[Document, Optional[str]]],
+        on_batch: Optional[Callable[[int], None]] = None
+    ) -> int:
+        """
+        Thêm documents từ generator (document, chunk_id) theo từng batch
+        Bộ nhớ chỉ giữ 1 batch chunks tại một thời điểm; on_batch(n) được gọi sau mỗi batch
+        """
+        total = 0
+        batch: List[Document] = []
+        batch_ids: List[Optional[str]] = []
+        
+        def flush():
+            ids = batch_ids if all(i is not None for i in batch_ids) else None
+            self._add_in_batches(batch, ids)
+            if on_batch:
+                on_batch(len(batch))
+        
+        for document, chunk_id in items:
+            batch.append(document)
+            batch_ids.append(chunk_id)
+            if len(batch) >= self.batch_size:
+                flush()
+                total += len(batch)
+                batch, batch_ids = [], []
+        
+        if batch:
+            flush()
+            total += len(batch)
+        
+        if total:
+            print(f"Embedding cache: {self.embedding_cache_stats()}")
+        return total
+    
+    def staging(self) -> "VectorStore":
+        """
+        VectorStore rỗng dùng chung embedding model và cấu hình: build index mới vào đây rồi swap(),
+        index hiện tại vẫn phục vụ search trong lúc build
+        """
+        staged = copy.copy(self)
+        staged.vectorstore = None
+        staged._index_mmapped = False
+        staged._holes = 0
+        staged.replayed_updates = []
+        staged._lock = ReadWriteLock()
+        if self.lexical_index is not None:
+            staged.lexical_index = LexicalIndex(self.persist_directory)
+        return staged
+    
+    def swap(self, staged: "VectorStore"):
+        """Thay index hiện tại bằng index đã build trong staged (do staging() tạo)"""
+        with self._lock.write():
+            self.vectorstore = staged.vectorstore
+            self.lexical_index = staged.lexical_index
+            self._index_mmapped = staged._index_mmapped
+            self._holes = staged._holes
+    
+    def upsert(
+        self,
+        documents: List[Document],
+        ids: List[str],
+        delete_ids: Optional[List[str]] = None,
+        info: Optional[Dict] = None
+    ):
+        """
+        Xóa delete_ids và thêm documents như 1 cập nhật. Có WAL: embed, ghi bản ghi (kèm vectors và info)
+        vào WAL rồi mới áp dụng vào index trong bộ nhớ - không ghi lại index chính
+        """
+        if self.wal is None:
+            self.delete(delete_ids or [])
+            if documents:
+                self.add_documents(documents, ids=ids)
+            return
+        
+        with span("embed_and_index"):
+            vectors = self.embeddings.embed_documents([doc.page_content for doc in documents]) if documents else []
+            record = {
+                "op": "upsert",
+                "delete": list(delete_ids or []),
+                "ids": list(ids),
+                "texts": [doc.page_content for doc in documents],
+                "metadatas": [doc.metadata for doc in documents],
+                "vectors": encode_vectors(vectors) if documents else "",
+                "info": info or {}
+            }
+            self.wal.append(record)
+            self._apply_update(record)
+    
+    def _apply_update(self, record: Dict):
+        """Áp dụng 1 bản ghi WAL - idempotent: bỏ qua IDs đã có (replay bản ghi đã nằm trong index)"""
+        self.delete(record["delete"])
+        if not record["ids"]:
+            return
+        
+        existing = set(self.vectorstore.index_to_docstore_id.values()) if self.vectorstore is not None else set()
+        vectors = decode_vectors(record["vectors"], len(record["ids"]))
+        rows = [i for i, chunk_id in enumerate(record["ids"]) if chunk_id not in existing]
+        if not rows:
+            return
+        
+        ids = [record["ids"][i] for i in rows]
+        texts = [record["texts"][i] for i in rows]
+        metadatas = [record["metadatas"][i] for i in rows]
+        
+        text_embeddings = list(zip(texts, vectors[rows]))
+        self._ensure_writable()
+        if self.vectorstore is None:
+            vectorstore = FAISS.from_embeddings(
+                text_embeddings, self.embeddings, metadatas=metadatas, ids=ids
+            )
+            with self._lock.write():
+                self.vectorstore = vectorstore
+                if self.lexical_index is not None:
+                    self.lexical_index.clear()
+            self.build_index()
         else:
-            self.vectorstore.add_documents(documents)
+            self._add_embeddings(texts, vectors[rows], metadatas, ids)
+        
+        if self.lexical_index is not None:
+            self.lexical_index.add(zip(ids, texts))
+    
+    def _add_embeddings(self, texts: List[str], vectors, metadatas: List[Dict], ids: List[str]):
+        """
+        Thêm vectors đã embed vào index hiện tại. Label mới tiếp nối sau cả các label đã xóa
+        (IVF giữ nguyên label khi remove_ids, HNSW giữ tombstone) nên không trùng label cũ
+        """
+        import faiss
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(len(texts), -1)
+        if self.vectorstore._normalize_L2:
+            faiss.normalize_L2(vectors)
+        
+        documents = {
+            chunk_id: Document(page_content=text, metadata=metadata or {})
+            for chunk_id, text, metadata in zip(ids, texts, metadatas)
+        }
+        with self._lock.write():
+            self.vectorstore.docstore.add(documents)
+            start = len(self.vectorstore.index_to_docstore_id) + self._holes
+            labels = np.arange(start, start + len(ids), dtype=np.int64)
+            if isinstance(self.vectorstore.index, faiss.IndexIVF):
+                self.vectorstore.index.add_with_ids(vectors, labels)
+            else:
+                # Flat/HNSW: label = vị trí = ntotal hiện tại (= start)
+                self.vectorstore.index.add(vectors)
+            self.vectorstore.index_to_docstore_id.update(zip(labels.tolist(), ids))
+    
+    def _replay_wal(self) -> List[Dict]:
+        """Áp dụng lại các cập nhật trong WAL chưa được checkpoint, trả về info của từng cập nhật"""
+        if self.wal is None:
+            return []
+        
+        replayed = []
+        for record in self.wal.records():
+            self._apply_update(record)
+            replayed.append(record.get("info") or {})
+        if replayed:
+            print(f"Replayed {len(replayed)} index updates from write-ahead log")
+        return replayed
+    
+    def wal_due(self) -> bool:
+        """WAL cần checkpoint: vượt kích thước, số bản ghi hoặc thời gian tối đa"""
+        if self.wal is None or not self.wal.records_count:
+            return False
+        return (
+            self.wal.size_bytes >= self.wal_max_bytes
+            or self.wal.records_count >= self.wal_max_records
+            or self.wal.age() >= self.wal_checkpoint_seconds
+        )
+    
+    def wal_stats(self) -> Optional[Dict]:
+        return self.wal.stats() if self.wal is not None else None
+    
+    def delete(self, ids: List[str]):
+        """Xóa vectors theo chunk IDs (bỏ qua IDs không có trong index)"""
+        if self.vectorstore is None or not ids:
+            return
+        
+        existing = set(self.vectorstore.index_to_docstore_id.values())
+        ids = [i for i in ids if i in existing]
+        if not ids:
+            return
+        
+        self._ensure_writable()
+        index_type = self.index_type()
+        with self._lock.write():
+            if self.lexical_index is not None:
+                self.lexical_index.delete(ids)
+            
+            if index_type == "flat":
+                # FAISS.delete: remove_ids rồi mới đánh lại mapping - search không được chạy xen giữa
+                self.vectorstore.delete(ids)
+                return
+            
+            # IVF: remove_ids, các label còn lại giữ nguyên; HNSW không hỗ trợ xóa: để lại tombstone, bị lọc khi search
+            removed = set(ids)
+            mapping = self.vectorstore.index_to_docstore_id
+            labels = [label for label, chunk_id in mapping.items() if chunk_id in removed]
+            self.vectorstore.docstore.delete(ids)
+            for label in labels:
+                del mapping[label]
+            if index_type != "hnsw":
+                self.vectorstore.index.remove_ids(np.asarray(labels, dtype=np.int64))
+            self._holes += len(labels)
+        
+        if self._holes > self.compact_ratio * (len(mapping) + self._holes):
+            self.compact()
+    
+    def compact(self):
+        """Build lại index từ các chunks còn lại: bỏ tombstones, đánh lại label liên tục"""
+        if self.vectorstore is None or not self._holes:
+            return
+        print(f"Compacting index: {self._holes} deleted of {len(self.vectorstore.index_to_docstore_id) + self._holes} vectors")
+        self.build_index(force=True)
+    
+    def index_type(self) -> Optional[str]:
+        """Loại FAISS index hiện tại"""
+        if self.vectorstore is None:
+            return None
+        return index_type_of(self.vectorstore.index)
+    
+    def stored_vectors(self, positions: Iterable[int]) -> np.ndarray:
+        """Vectors của chunks tại các vị trí (theo thứ tự label) - embed lại text từ docstore (hit embedding cache)"""
+        mapping = self.vectorstore.index_to_docstore_id
+        if self._holes:
+            live = [mapping[label] for label in sorted(mapping)]
+            ids = [live[int(position)] for position in positions]
+        else:
+            ids = [mapping[int(position)] for position in positions]
+        texts = [self.vectorstore.docstore.search(chunk_id).page_content for chunk_id in ids]
+        return np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32).reshape(len(texts), -1)
+    
+    @span("build_index")
+    def build_index(self, force: bool = False) -> bool:
+        """
+        Chuyển index sang loại đã cấu hình (FAISS_INDEX_TYPE), train trên mẫu vectors.
+        Trả về True nếu index được build lại
+        """
+        if self.vectorstore is None:
+            return False
+        
+        index = self.vectorstore.index
+        ntotal = len(self.vectorstore.index_to_docstore_id)
+        target = resolve_config(self.index_config, ntotal)
+        if not force and index_type_of(index) == target.index_type:
+            self.set_search_params()
+            return False
+        
+        start = time.time()
+        # Index mới không có label trống: đánh lại label 0..ntotal-1 theo thứ tự cũ
+        mapping = self.vectorstore.index_to_docstore_id
+        dense = dict(enumerate(mapping[label] for label in sorted(mapping)))
+        new_index = build_index(
+            self.index_config, ntotal, index.d, self.stored_vectors
+        )
+        # Build lỗi thì giữ nguyên index + mapping cũ; build xong thì thay cả 2 trong 1 lần gán
+        vectorstore = copy.copy(self.vectorstore)
+        vectorstore.index = new_index
+        vectorstore.index_to_docstore_id = dense
+        with self._lock.write():
+            self.vectorstore = vectorstore
+            self._holes = 0
+        print(
+            f"Built {self.index_type()} index with {ntotal} vectors "
+            f"in {time.time() - start:.1f}s"
+        )
+        return True
     
+    def set_search_params(self, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+        """Đặt nprobe (IVF) / efSearch (HNSW) cho index hiện tại"""
+        if nprobe:
+            self.index_config.nprobe = nprobe
+        if ef_search:
+            self.index_config.ef_search = ef_search
+        if self.vectorstore is not None:
+            apply_search_params(
+                self.vectorstore.index,
+                nprobe=self.index_config.nprobe,
+                ef_search=self.index_config.ef_search
+            )
+    
+    def _index_path(self) -> str:
+        return os.path.join(self.persist_directory, self._files["index"])
+    
+    def _lexical_path(self) -> Optional[str]:
+        name = self._files.get("lexical")
+        return os.path.join(self.persist_directory, name) if name else None
+    
+    def _current_path(self) -> str:
+        return os.path.join(self.persist_directory, self.CURRENT_FILE)
+    
+    def _fsync_directory(self):
+        fd = os.open(self.persist_directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    
+    def _commit(self, generation: int, files: Dict[str, Optional[str]]):
+        """Thay CURRENT (atomic rename + fsync) - sau hàm này generation mới là bản được load khi khởi động"""
+        # Các file của generation mới phải nằm trên disk trước khi CURRENT trỏ tới chúng
+        self._fsync_directory()
+        tmp_path = self._current_path() + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"generation": generation, "files": files}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._current_path())
+        self._fsync_directory()
+    
+    def _remove_stale_files(self):
+        """Xóa file của các generation cũ và của store cũ (index.faiss, chunks.idx...) sau khi commit"""
+        keep = {name for name in self._files.values() if name}
+        keep.add(self.vectorstore.docstore.store.data_file)
+        legacy = set(self.LEGACY_FILES.values()) | {os.path.basename(self._legacy_docstore_path())}
+        for name in os.listdir(self.persist_directory):
+            generational = name.startswith(("index-", "chunks-", "lexical-")) \
+                and name.endswith((".faiss", ".idx", ".dat", ".json"))
+            if (generational or name in legacy) and name not in keep:
+                os.remove(os.path.join(self.persist_directory, name))
+    
+    def _ensure_writable(self):
+        """Index memory-mapped là read-only: load lại vào bộ nhớ trước khi thêm/xóa vectors"""
+        if self.vectorstore is None or not self._index_mmapped:
+            return
+        import faiss
+        index = faiss.read_index(self._index_path())
+        with self._lock.write():
+            self.vectorstore.index = index
+            self._index_mmapped = False
+        self.set_search_params()
+    
+    def _legacy_docstore_path(self) -> str:
+        return os.path.join(self.persist_directory, "index.pkl")
+    
+    @span("save_index")
     def save(self):
-        """Lưu vector store vào disk"""
+        """
+        Lưu vector store vào disk: FAISS index + chunk store (text/metadata) + lexical index.
+        Mỗi lần save ghi các file mới theo generation, rồi commit bằng cách thay file CURRENT;
+        crash trước khi CURRENT được thay thì khởi động lại dùng generation cũ + WAL
+        """
         if self.vectorstore is None:
             print("No vector store to save")
             return
         
         os.makedirs(self.persist_directory, exist_ok=True)
+        import faiss
+        
+        generation = self.generation + 1
+        files = {
+            "index": f"index-{generation}.faiss",
+            "chunks": f"chunks-{generation}.idx",
+            "lexical": f"lexical-{generation}.json" if self.lexical_index is not None else None
+        }
+        
+        index_path = os.path.join(self.persist_directory, files["index"])
+        faiss.write_index(self.vectorstore.index, index_path)
+        fd = os.open(index_path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        
+        # Chỉ ghi thêm chunks mới, sau đó đọc lazy từ disk thay vì giữ toàn bộ documents trong RAM
+        # Dòng thứ i = label i; label đã xóa (IVF/HNSW chưa compaction) ghi thành dòng trống
+        mapping = self.vectorstore.index_to_docstore_id
+        ids = [mapping.get(label) for label in range(len(mapping) + self._holes)]
+        ChunkStore.write(self.persist_directory, ids, self.vectorstore.docstore, index_file=files["chunks"])
+        
+        if self.lexical_index is not None:
+            self.lexical_index.save(os.path.join(self.persist_directory, files["lexical"]))
         
-        # Save FAISS index
-        self.vectorstore.save_local(self.persist_directory)
-        print(f"Vector store saved to {self.persist_directory}")
+        self._commit(generation, files)
+        self.generation = generation
+        self._files = files
+        docstore = ChunkDocstore(ChunkStore(self.persist_directory, files["chunks"]))
+        with self._lock.write():
+            self.vectorstore.docstore = docstore
+        
+        # Toàn bộ cập nhật đã nằm trong generation vừa commit
+        if self.wal is not None:
+            self.wal.reset()
+        self._remove_stale_files()
+        print(f"Vector store saved to {self.persist_directory} (generation {generation})")
+    
+    def _load_chunk_store(self) -> FAISS:
+        """Load FAISS index (memory-map nếu VECTOR_STORE_MMAP) và docstore lazy từ chunk store"""
+        import faiss
+        flags = faiss.IO_FLAG_MMAP if self.mmap else 0
+        index = faiss.read_index(self._index_path(), flags)
+        store = ChunkStore(self.persist_directory, self._files["chunks"])
+        mapping = {label: chunk_id for label, chunk_id in enumerate(store.ids) if chunk_id}
+        # IVF không còn giữ vectors đã xóa, flat/HNSW có đủ mọi label (kể cả tombstone)
+        expected = len(mapping) if isinstance(index, faiss.IndexIVF) else len(store)
+        if index.ntotal != expected:
+            raise ValueError(f"Chunk store has {expected} chunks but index has {index.ntotal} vectors")
+        
+        self._index_mmapped = self.mmap
+        self._holes = len(store) - len(mapping)
+        return FAISS(
+            self.embeddings,
+            index,
+            ChunkDocstore(store),
+            mapping
+        )
+    
+    def _migrate_legacy_docstore(self) -> FAISS:
+        """Chuyển vector store cũ (index.pkl do FAISS.save_local ghi) sang chunk store"""
+        import faiss
+        # index.pkl do chính ứng dụng ghi ra trong persist_directory
+        with open(self._legacy_docstore_path(), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        
+        self._index_mmapped = False
+        self._holes = 0
+        self.vectorstore = FAISS(
+            self.embeddings,
+            faiss.read_index(self._index_path()),
+            docstore,
+            index_to_docstore_id
+        )
+        return self.vectorstore
     
     def load(self) -> bool:
-        """Load vector store từ disk"""
-        index_path = os.path.join(self.persist_directory, "index.faiss")
+        """Load generation đã commit (theo CURRENT, store cũ: index.faiss + chunks.idx) và replay WAL"""
+        try:
+            if os.path.exists(self._current_path()):
+                with open(self._current_path(), "r", encoding="utf-8") as f:
+                    current = json.load(f)
+                self.generation = current["generation"]
+                self._files = current["files"]
+            else:
+                self.generation = 0
+                self._files = dict(self.LEGACY_FILES)
+        except Exception as e:
+            print(f"Error reading {self.CURRENT_FILE}: {e}")
+            return False
         
-        if not os.path.exists(index_path):
+        if not os.path.exists(self._index_path()):
             print(f"No saved vector store found at {self.persist_directory}")
             return False
         
+        # Store cũ (index.pkl) hoặc lexical index phải dựng lại: save sau khi replay WAL
+        needs_save = False
         try:
-            self.vectorstore = FAISS.load_local(
-                self.persist_directory,
-                self.embeddings,
-                allow_dangerous_deserialization=True
-            )
-            print(f"Vector store loaded from {self.persist_directory}")
-            return True
+            if ChunkStore.exists(self.persist_directory, self._files["chunks"]):
+                self.vectorstore = self._load_chunk_store()
+            elif os.path.exists(self._legacy_docstore_path()):
+                self.vectorstore = self._migrate_legacy_docstore()
+                needs_save = True
+                print("Migrating index.pkl to chunk store")
+            else:
+                print(f"No chunk store found at {self.persist_directory}")
+                return False
+            mode = "memory-mapped" if self._index_mmapped else "loaded"
+            print(f"Vector store {mode} from {self.persist_directory}")
         except Exception as e:
             print(f"Error loading vector store: {e}")
+            self.vectorstore = None
             return False
+        
+        # Lexical index thiếu hoặc không khớp (store cũ, đổi HYBRID_SEARCH): dựng lại từ chunk store
+        if self.lexical_index is not None and (
+            self._lexical_path() is None
+            or not self.lexical_index.load(self._lexical_path())
+            or len(self.lexical_index) != len(self.vectorstore.index_to_docstore_id)
+        ):
+            self.rebuild_lexical_index()
+            needs_save = True
+        
+        # Cập nhật đã ghi vào WAL nhưng chưa checkpoint (process dừng đột ngột, chưa tới lượt checkpoint)
+        self.replayed_updates = self._replay_wal()
+        
+        # Đổi FAISS_INDEX_TYPE: build lại index từ vectors đã lưu, lỗi thì giữ index đã load
+        try:
+            needs_save = self.build_index() or needs_save
+        except Exception as e:
+            print(f"Error building {self.index_config.index_type} index, keeping {self.index_type()} index: {e}")
+        if needs_save:
+            self.save()
+        return True
     
     def similarity_search(
         self, 
@@ -88,11 +664,15 @@ class VectorStore:
         if self.vectorstore is None:
             raise ValueError("Vector store not initialized")
         
-        results = self.vectorstore.similarity_search(
-            query=query,
-            k=k,
-            filter=filter
-        )
+        if filter is None:
+            return [doc for doc, _ in self.similarity_search_with_score(query, k=k)]
+        
+        with self._lock.read():
+            results = self.vectorstore.similarity_search(
+                query=query,
+                k=k,
+                filter=filter
+            )
         
         return results
     
@@ -105,11 +685,141 @@ class VectorStore:
         if self.vectorstore is None:
             raise ValueError("Vector store not initialized")
         
-        results = self.vectorstore.similarity_search_with_score(
-            query=query,
-            k=k
+        # Search qua _search_vectors (bỏ qua tombstones) thay vì FAISS.similarity_search_with_score
+        vectors = np.asarray([self.embeddings.embed_query(query)], dtype=np.float32)
+        return [(doc, score) for _, doc, score in self._search_vectors(vectors, k)[0]]
+    
+    def batch_similarity_search_with_score(
+        self,
+        queries: List[str],
+        k: int = 4
+    ) -> List[List[Tuple[Document, float]]]:
+        """
+        Tìm kiếm nhiều query cùng lúc: embed tất cả query trong 1 lần gọi model
+        và search FAISS với 1 ma trận query. Score là L2 distance như similarity_search_with_score
+        """
+        if self.vectorstore is None:
+            raise ValueError("Vector store not initialized")
+        if not queries:
+            return []
+        
+        with span("embed_query_batch"):
+            vectors = np.asarray(self.embeddings.embed_queries(queries), dtype=np.float32)
+        return [
+            [(doc, score) for _, doc, score in hits]
+            for hits in self._search_vectors(vectors, k)
+        ]
+    
+    @span("vector_search")
+    def _search_vectors(self, vectors: np.ndarray, k: int) -> List[List[Tuple[str, Document, float]]]:
+        """
+        Search FAISS với ma trận query, trả về (chunk_id, document, L2 distance) cho từng query
+        HNSW có tombstones: lấy thêm kết quả (gấp đôi mỗi lần) tới khi đủ k chunks còn sống
+        """
+        if self.vectorstore._normalize_L2:
+            import faiss
+            faiss.normalize_L2(vectors)
+        
+        with self._lock.read():
+            index = self.vectorstore.index
+            mapping = self.vectorstore.index_to_docstore_id
+            fetch_k = k
+            while True:
+                scores, indices = index.search(vectors, fetch_k)
+                if not self._holes or fetch_k >= index.ntotal:
+                    break
+                # Tombstone trong kết quả làm thiếu chunks -> search lại với fetch_k lớn hơn
+                if all(sum(1 for i in row if i in mapping) >= k or -1 in row for row in indices):
+                    break
+                fetch_k = min(fetch_k * 2, index.ntotal)
+            
+            results = []
+            for row_scores, row_indices in zip(scores, indices):
+                hits = []
+                for score, label in zip(row_scores, row_indices):
+                    chunk_id = mapping.get(int(label))
+                    if chunk_id is None:
+                        continue
+                    doc = self.vectorstore.docstore.search(chunk_id)
+                    if isinstance(doc, Document):
+                        hits.append((chunk_id, doc, float(score)))
+                    if len(hits) == k:
+                        break
+                results.append(hits)
+        
+        return results
+    
+    def rebuild_lexical_index(self):
+        """Dựng lại BM25 index từ toàn bộ chunks trong docstore"""
+        if self.lexical_index is None:
+            return
+        
+        self.lexical_index.clear()
+        if self.vectorstore is None:
+            return
+        
+        ids = list(self.vectorstore.index_to_docstore_id.values())
+        self.lexical_index.add(
+            (chunk_id, self.vectorstore.docstore.search(chunk_id).page_content) for chunk_id in ids
+        )
+        print(f"Lexical index rebuilt with {len(ids)} chunks")
+    
+    def hybrid_search(self, query: str, k: int = 4) -> List[Document]:
+        """Vector search + BM25, gộp bằng reciprocal-rank fusion; chỉ vector search nếu tắt HYBRID_SEARCH"""
+        if self.vectorstore is None:
+            raise ValueError("Vector store not initialized")
+        
+        fetch_k = max(k, self.hybrid_fetch_k)
+        with span("embed_query"):
+            vectors = np.asarray([self.embeddings.embed_query(query)], dtype=np.float32)
+        vector_hits = self._search_vectors(vectors, fetch_k if self.lexical_index is not None else k)[0]
+        if self.lexical_index is None:
+            return [doc for _, doc, _ in vector_hits]
+        
+        return [doc for doc, _ in self._fuse(query, vector_hits, k)]
+    
+    def batch_hybrid_search(self, queries: List[str], k: int = 4) -> List[List[Tuple[Document, Optional[float]]]]:
+        """
+        hybrid_search cho nhiều query: embed 1 lần và search FAISS 1 lần, BM25 + fusion theo từng query.
+        Trả về (document, L2 distance) - distance None với chunk chỉ BM25 tìm thấy
+        """
+        if self.lexical_index is None:
+            return self.batch_similarity_search_with_score(queries, k=k)
+        if self.vectorstore is None:
+            raise ValueError("Vector store not initialized")
+        if not queries:
+            return []
+        
+        with span("embed_query_batch"):
+            vectors = np.asarray(self.embeddings.embed_queries(queries), dtype=np.float32)
+        vector_hits = self._search_vectors(vectors, max(k, self.hybrid_fetch_k))
+        return [self._fuse(query, hits, k) for query, hits in zip(queries, vector_hits)]
+    
+    def _fuse(
+        self,
+        query: str,
+        vector_hits: List[Tuple[str, Document, float]],
+        k: int
+    ) -> List[Tuple[Document, Optional[float]]]:
+        """Gộp vector hits với kết quả BM25 của query bằng reciprocal-rank fusion, lấy k chunks đầu"""
+        with span("lexical_search"):
+            lexical_hits = self.lexical_index.search(query, k=max(k, self.hybrid_fetch_k))
+        fused = reciprocal_rank_fusion(
+            [[chunk_id for chunk_id, _, _ in vector_hits], [chunk_id for chunk_id, _ in lexical_hits]],
+            rrf_k=self.rrf_k
         )
         
+        scored = {chunk_id: (doc, score) for chunk_id, doc, score in vector_hits}
+        results = []
+        with self._lock.read():
+            for chunk_id in fused[:k]:
+                hit = scored.get(chunk_id)
+                if hit is None:
+                    doc = self.vectorstore.docstore.search(chunk_id)
+                    if not isinstance(doc, Document):
+                        continue
+                    hit = (doc, None)
+                results.append(hit)
         return results
     
     def get_retriever(self, k: int = 4):
@@ -117,9 +827,8 @@ class VectorStore:
         if self.vectorstore is None:
             raise ValueError("Vector store not initialized")
         
-        return self.vectorstore.as_retriever(
-            search_kwargs={"k": k}
-        )
+        # Tắt HYBRID_SEARCH: HybridRetriever chỉ dùng vector search (qua _search_vectors, bỏ qua tombstones)
+        return HybridRetriever(vector_store=self, k=k)
 
 
 if __name__ == "__main__":
@@ -135,10 +844,12 @@ if __name__ == "__main__":
         docs_path = "./documents"
         if os.path.exists(docs_path):
             print("Processing documents...")
-            chunks = processor.process_directory(docs_path)
+            total = vector_store.add_documents_stream(
+                (chunk, None) for chunk in processor.iter_chunks(docs_path)
+            )
             
-            if chunks:
-                vector_store.create_vectorstore(chunks)
+            if total:
+                vector_store.build_index()
                 vector_store.save()
                 
                 # Test search
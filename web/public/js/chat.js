@@ -4,22 +4,26 @@ const sendBtn = document.getElementById("sendBtn");
 const resetBtn = document.getElementById("resetBtn");
 const chips = document.querySelectorAll(".chip");
 
-let conversationId = "default";
+// One conversation per browser tab, kept across reloads
+function newConversationId() {
+  if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+  // crypto.randomUUID is only available in secure contexts (https, localhost)
+  return Array.from(crypto.getRandomValues(new Uint8Array(16)), (b) =>
+    b.toString(16).padStart(2, "0")
+  ).join("");
+}
 
-// Add message to chat
-function addMessage(content, isUser, sources = null) {
-  const messageDiv = document.createElement("div");
-  messageDiv.className = `message ${isUser ? "user" : "bot"}`;
+let conversationId = sessionStorage.getItem("conversationId");
+if (!conversationId) {
+  conversationId = newConversationId();
+  sessionStorage.setItem("conversationId", conversationId);
+}
 
-  let messageHTML = `
-        <div class="message-content">
-            ${content}
-        </div>
-    `;
+// Render sources list
+function renderSources(sources) {
+  if (!sources || sources.length === 0) return "";
 
-  // Add sources if available
-  if (sources && sources.length > 0) {
-    messageHTML += `
+  return `
             <div class="message-sources">
                 <h4>📚 Nguồn tham khảo:</h4>
                 <ul>
@@ -34,14 +38,58 @@ function addMessage(content, isUser, sources = null) {
                 </ul>
             </div>
         `;
-  }
+}
+
+// Add message to chat
+function addMessage(content, isUser, sources = null) {
+  const messageDiv = document.createElement("div");
+  messageDiv.className = `message ${isUser ? "user" : "bot"}`;
+
+  let messageHTML = `
+        <div class="message-content">
+            ${content}
+        </div>
+    `;
+
+  // Add sources if available
+  messageHTML += renderSources(sources);
 
   messageDiv.innerHTML = messageHTML;
   chatBox.appendChild(messageDiv);
   chatBox.scrollTop = chatBox.scrollHeight;
+  return messageDiv;
+}
+
+// Read server-sent events from a fetch response
+async function readEventStream(response, onEvent) {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary;
+    while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      let event = "message";
+      let data = "";
+      rawEvent.split("\n").forEach((line) => {
+        if (line.startsWith("event:")) event = line.slice(6).trim();
+        else if (line.startsWith("data:")) data += line.slice(5).trim();
+      });
+
+      if (data) onEvent(event, JSON.parse(data));
+    }
+  }
 }
 
-// Send message
+// Send message (streaming answer)
 async function sendMessage() {
   const message = messageInput.value.trim();
 
@@ -51,11 +99,13 @@ async function sendMessage() {
   addMessage(message, true);
   messageInput.value = "";
 
-  // Add loading message
-  addMessage("Đang xử lý...", false);
+  // Add bot message, filled in as tokens arrive
+  const botMessage = addMessage("Đang xử lý...", false);
+  const contentDiv = botMessage.querySelector(".message-content");
+  let answer = "";
 
   try {
-    const response = await fetch("/api/chat", {
+    const response = await fetch("/api/chat/stream", {
       method: "POST",
       headers: {
         "Content-Type": "application/json",
@@ -66,20 +116,24 @@ async function sendMessage() {
       }),
     });
 
-    const data = await response.json();
-
-    // Remove loading message
-    chatBox.removeChild(chatBox.lastChild);
-
-    if (data.error) {
-      addMessage(`❌ Lỗi: ${data.error}`, false);
-    } else {
-      addMessage(data.answer, false, data.sources);
+    if (!response.ok) {
+      const data = await response.json();
+      throw new Error(data.error || response.statusText);
     }
+
+    await readEventStream(response, (event, data) => {
+      if (event === "token") {
+        answer += data.content;
+        contentDiv.textContent = answer;
+      } else if (event === "sources") {
+        botMessage.insertAdjacentHTML("beforeend", renderSources(data.sources));
+      } else if (event === "error") {
+        contentDiv.textContent = `❌ Lỗi: ${data.error}`;
+      }
+      chatBox.scrollTop = chatBox.scrollHeight;
+    });
   } catch (error) {
-    // Remove loading message
-    chatBox.removeChild(chatBox.lastChild);
-    addMessage(`❌ Lỗi kết nối: ${error.message}`, false);
+    contentDiv.textContent = `❌ Lỗi kết nối: ${error.message}`;
   }
 }
 
@@ -38,18 +38,60 @@ app.get("/compare", (req, res) => {
   res.render("compare");
 });
 
+// Upstream error body when the request used responseType: "stream"
+async function readErrorStream(stream, fallback) {
+  try {
+    const chunks = [];
+    for await (const chunk of stream) chunks.push(chunk);
+    const text = Buffer.concat(chunks).toString("utf8");
+    try {
+      return JSON.parse(text).error || text || fallback;
+    } catch {
+      return text || fallback;
+    }
+  } catch {
+    return fallback;
+  }
+}
+
 // API Proxy endpoints
 app.post("/api/chat", async (req, res) => {
   try {
     const response = await axios.post(`${API_URL}/api/chat`, req.body);
     res.json(response.data);
   } catch (error) {
-    res.status(500).json({
+    res.status(error.response?.status || 500).json({
       error: error.response?.data?.error || error.message,
     });
   }
 });
 
+app.post("/api/chat/stream", async (req, res) => {
+  try {
+    const response = await axios.post(`${API_URL}/api/chat/stream`, req.body, {
+      responseType: "stream",
+    });
+
+    res.setHeader("Content-Type", "text/event-stream");
+    res.setHeader("Cache-Control", "no-cache");
+    res.setHeader("Connection", "keep-alive");
+    res.flushHeaders();
+
+    response.data.pipe(res);
+    req.on("close", () => response.data.destroy());
+  } catch (error) {
+    // Pass through upstream status (429 busy, 400 bad request, 503 not ready) and its error message
+    const upstream = error.response;
+    const message = upstream?.data
+      ? await readErrorStream(upstream.data, error.message)
+      : error.message;
+    if (upstream?.headers?.["retry-after"]) {
+      res.setHeader("Retry-After", upstream.headers["retry-after"]);
+    }
+    res.status(upstream?.status || 500).json({ error: message });
+  }
+});
+
 app.post("/api/search", async (req, res) => {
   try {
     const response = await axios.post(`${API_URL}/api/search`, req.body);
@@ -85,9 +127,22 @@ app.post("/api/upload", upload.single("file"), async (req, res) => {
       headers: formData.getHeaders(),
     });
 
+    res.status(response.status).json(response.data);
+  } catch (error) {
+    res.status(error.response?.status || 500).json({
+      error: error.response?.data?.error || error.message,
+    });
+  }
+});
+
+app.get("/api/upload/jobs/:jobId", async (req, res) => {
+  try {
+    const response = await axios.get(
+      `${API_URL}/api/upload/jobs/${encodeURIComponent(req.params.jobId)}`
+    );
     res.json(response.data);
   } catch (error) {
-    res.status(500).json({
+    res.status(error.response?.status || 500).json({
       error: error.response?.data?.error || error.message,
     });
   }
@@ -95,9 +150,12 @@ app.post("/api/upload", upload.single("file"), async (req, res) => {
 
 app.post("/api/reset", async (req, res) => {
   try {
-    const conversationId = req.body.conversation_id || "default";
+    const conversationId = req.body.conversation_id;
+    if (!conversationId) {
+      return res.status(400).json({ error: "conversation_id is required" });
+    }
     const response = await axios.post(
-      `${API_URL}/api/conversations/${conversationId}/reset`
+      `${API_URL}/api/conversations/${encodeURIComponent(conversationId)}/reset`
     );
     res.json(response.data);
   } catch (error) {